@@ -0,0 +1,403 @@
+"""
+Headless benchmarks of the drawing primitives, the shapes, the selection, the rendering and
+the file formats. Every benchmark reports the best time per call over a few repeats and the
+peak memory allocated during one call, next to a baseline stored on the same machine:
+
+    python benchmarks/bench.py                    # run and compare with benchmarks/baseline.json
+    python benchmarks/bench.py --check            # also fail (exit status 1) on a regression
+    python benchmarks/bench.py --save-baseline    # run and store the results as the new baseline
+    python benchmarks/bench.py -k arrow --quick   # only the benchmarks whose name contains "arrow"
+
+The first run stores the baseline, which is not part of the repository. Times are stored in
+units of a fixed pure Python calibration loop timed in the same run, so a baseline survives a
+busier or slower machine better than seconds would. A benchmark regresses when it is slower,
+or allocates more, than its baseline by more than --tolerance.
+"""
+from array import array
+from typing import Callable, Dict, List, NamedTuple
+import argparse
+import gc
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "textual-blockdiagram")
+sys.path.insert(0, SOURCE_DIR)
+
+from rich.console import Console
+
+from _canvas import AsciiCanvas
+from _model import DiagramModel
+from _render import CanvasRenderable
+from _shapes import Arrow, Box, Trapezoid
+from _storage import DiagramReader
+from _utils import Cursor, UnicodeBoxChars
+
+
+EXAMPLE       = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "example.json")
+BASELINE      = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+CHAR_SET      = UnicodeBoxChars.get_char_set("SINGLE", "CONTINUOUS", "SQUARE", "LIGHT")
+
+# example.json is tiled rows x cols times to get each scale
+SCALES = {1: (1, 1), 10: (5, 2), 100: (10, 10)}
+
+
+class Result(NamedTuple):
+    time : float    # seconds per call
+    peak : int      # bytes allocated at the peak of one call
+
+
+# name -> setup, the setup returns the callable to measure
+BENCHMARKS : Dict[str, Callable[[], Callable[[], None]]] = {}
+
+
+#---------------------------------------------------------------------------------------
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+#---------------------------------------------------------------------------------------
+def calibration_loop() -> int:
+    total = 0
+    for i in range(10000):
+        total += i * i % 7
+    return total
+
+
+#---------------------------------------------------------------------------------------
+def measure(function, repeat, min_time) -> Result:
+    """
+    Times function like timeit.autorange: the number of calls per repeat grows until a repeat
+    lasts min_time, the best repeat wins. As in timeit, the garbage collector is off while
+    timing, so objects left by other benchmarks do not change the results. The peak memory
+    comes from one more, traced, call.
+    """
+    def timed(number):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            for _ in range(number):
+                function()
+            return time.perf_counter() - start
+        finally:
+            gc.enable()
+
+    number = 1
+    while True:
+        elapsed = timed(number)
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        best = min(best, timed(number) / number)
+
+    gc.collect()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return Result(best, peak)
+
+
+#=======================================================================================
+# Fixtures
+#=======================================================================================
+_FIXTURES : Dict[int, str] = {}
+_FIXTURE_DIR = tempfile.TemporaryDirectory(prefix="blockdiagram-bench-")
+
+
+#---------------------------------------------------------------------------------------
+def example_file(scale) -> str:
+    """
+    Returns a .json copy of examples/example.json tiled to scale times its area.
+    """
+    if scale not in _FIXTURES:
+        tile_rows, tile_cols = SCALES[scale]
+        reader = DiagramReader(EXAMPLE)
+        rows = list(reader.read())
+        width = reader.cols
+
+        tiled = []
+        for _ in range(tile_rows):
+            for text, codes in rows:
+                text  = text.ljust(width)
+                codes = codes + array("B", bytes(width - len(codes)))
+                tiled.append((text * tile_cols, codes * tile_cols))
+
+        model = DiagramModel(history=False)
+        model.load_rows(tiled)
+        _FIXTURES[scale] = os.path.join(_FIXTURE_DIR.name, f"example_{scale}x.json")
+        model.save_diagram(_FIXTURES[scale])
+    return _FIXTURES[scale]
+
+
+#---------------------------------------------------------------------------------------
+def example_canvas() -> AsciiCanvas:
+    canvas = AsciiCanvas()
+    canvas.load_diagram(example_file(1))
+    return canvas
+
+
+#=======================================================================================
+# Primitives
+#=======================================================================================
+@benchmark("set_char[100x100]")
+def bench_set_char():
+    model = DiagramModel()
+    def run():
+        for row in range(100):
+            for col in range(100):
+                model.set_char(col, row, "x", 6, False)
+        model.commit()
+    return run
+
+
+#---------------------------------------------------------------------------------------
+@benchmark("grow[2000 cells diagonal]")
+def bench_grow():
+    # every cell is past the extent of the fresh model, a new tile is allocated every 64 cells
+    def run():
+        model = DiagramModel(history=False)
+        for step in range(2000):
+            model.set_char(step * 2, step, "x", 6, False)
+    return run
+
+
+#=======================================================================================
+# Shapes
+#=======================================================================================
+@benchmark("Box.draw_box[40x20]")
+def bench_box():
+    model = DiagramModel(history=False)
+    def run():
+        Box(model, CHAR_SET, False).draw_box(10, 10, 40, 20)
+    return run
+
+
+#---------------------------------------------------------------------------------------
+# name -> (anchor, end, approach mode), anchor and end as (col, row)
+ARROWS = {
+    "right"        : ((10, 30), (60, 30), None),
+    "left"         : ((60, 30), (10, 30), None),
+    "down"         : ((30, 10), (30, 50), None),
+    "up"           : ((30, 50), (30, 10), None),
+    "top_right"    : ((10, 10), (60, 40), "h"),
+    "right_down"   : ((10, 10), (60, 40), "v"),
+    "top_left"     : ((60, 10), (10, 40), "h"),
+    "left_down"    : ((60, 10), (10, 40), "v"),
+    "bottom_right" : ((10, 40), (60, 10), "h"),
+    "right_up"     : ((10, 40), (60, 10), "v"),
+    "bottom_left"  : ((60, 40), (10, 10), "h"),
+    "left_up"      : ((60, 40), (10, 10), "v"),
+}
+
+
+#---------------------------------------------------------------------------------------
+def _arrow_benchmark(anchor, end, approach_mode):
+    def setup():
+        model = DiagramModel(history=False)
+        def run():
+            Arrow(model, CHAR_SET, False).draw(Cursor(end[1], end[0]), Cursor(anchor[1], anchor[0]), approach_mode)
+        return run
+    return setup
+
+
+for _name, (_anchor, _end, _mode) in ARROWS.items():
+    benchmark(f"Arrow.draw[{_name}]")(_arrow_benchmark(_anchor, _end, _mode))
+
+
+#---------------------------------------------------------------------------------------
+@benchmark("Trapezoid.draw[ver]")
+def bench_trapezoid_ver():
+    model = DiagramModel(history=False)
+    def run():
+        Trapezoid(model, CHAR_SET, False).draw(Cursor(40, 30), Cursor(10, 10), "ver")
+    return run
+
+
+#---------------------------------------------------------------------------------------
+@benchmark("Trapezoid.draw[hor]")
+def bench_trapezoid_hor():
+    model = DiagramModel(history=False)
+    def run():
+        Trapezoid(model, CHAR_SET, False).draw(Cursor(30, 70), Cursor(10, 10), "hor")
+    return run
+
+
+#=======================================================================================
+# Selection and rendering
+#=======================================================================================
+@benchmark("copy_selection[example]")
+def bench_copy_selection():
+    canvas = example_canvas()
+    first, second = Cursor(0, 0), Cursor(canvas.drawing_row_max, canvas.drawing_col_max)
+    def run():
+        canvas.copy_selection(first, second)
+    return run
+
+
+#---------------------------------------------------------------------------------------
+@benchmark("move_selection[example, preview]")
+def bench_move_selection_preview():
+    canvas = example_canvas()
+    canvas.copy_selection(Cursor(0, 0), Cursor(canvas.drawing_row_max, canvas.drawing_col_max))
+    canvas.active_buffer = canvas.preview
+    def run():
+        canvas.discard_preview()
+        canvas.move_selection(20, 10, True)
+    return run
+
+
+#---------------------------------------------------------------------------------------
+@benchmark("move_selection[example, commit]")
+def bench_move_selection_commit():
+    canvas = example_canvas()
+    canvas.copy_selection(Cursor(0, 0), Cursor(canvas.drawing_row_max, canvas.drawing_col_max))
+    def run():
+        canvas.move_selection(20, 10, False)
+        canvas.command_history.commit()
+    return run
+
+
+#---------------------------------------------------------------------------------------
+@benchmark("render[example]")
+def bench_render():
+    canvas = example_canvas()
+    def run():
+        # a fresh line cache every call, cached strips would only measure the lookup
+        canvas.line_cache.mark_all_dirty()
+        console = Console(file=io.StringIO(), width=canvas.drawing_buffer.cols, color_system="truecolor", force_terminal=True)
+        console.print(CanvasRenderable(canvas))
+    return run
+
+
+#=======================================================================================
+# File formats
+#=======================================================================================
+def _save_benchmark(scale):
+    def setup():
+        model = DiagramModel(history=False)
+        model.load_diagram(example_file(scale))
+        target = os.path.join(_FIXTURE_DIR.name, f"save_{scale}x.json")
+        def run():
+            model.save_diagram(target)
+        return run
+    return setup
+
+
+#---------------------------------------------------------------------------------------
+def _load_benchmark(scale):
+    def setup():
+        model = DiagramModel(history=False)
+        source = example_file(scale)
+        def run():
+            model.load_diagram(source)
+        return run
+    return setup
+
+
+for _scale in SCALES:
+    benchmark(f"save_diagram[{_scale}x]")(_save_benchmark(_scale))
+    benchmark(f"load_diagram[{_scale}x]")(_load_benchmark(_scale))
+
+
+#=======================================================================================
+# Runner
+#=======================================================================================
+def load_baseline(file_name) -> Dict[str, dict]:
+    """
+    Returns the stored results, in calibration units.
+    """
+    with open(file_name) as f:
+        return json.load(f)
+
+
+#---------------------------------------------------------------------------------------
+def save_baseline(file_name, results: Dict[str, Result], unit) -> None:
+    baseline = load_baseline(file_name) if os.path.exists(file_name) else {}
+    baseline.update({name: {"units": result.time / unit, "peak": result.peak} for name, result in results.items()})
+    with open(file_name, "w") as f:
+        json.dump(baseline, f, indent=4, sort_keys=True)
+        f.write("\n")
+
+
+#---------------------------------------------------------------------------------------
+def compare(results: Dict[str, Result], baseline: Dict[str, dict], unit, tolerance, min_delta) -> List[str]:
+    """
+    Prints the results next to the baseline, scaled to seconds on this machine by the time of
+    the calibration loop (unit), and returns the names of the regressions. A time regression
+    also has to exceed min_delta seconds, so very short benchmarks do not flap.
+    """
+    regressions = []
+    print(f"{'benchmark':40} {'time':>11} {'baseline':>11} {'ratio':>6} {'peak':>10} {'baseline':>10} {'ratio':>6}")
+    for name, result in results.items():
+        line = f"{name:40} {result.time * 1e3:9.3f}ms"
+        reference = baseline.get(name)
+        if reference is None:
+            print(line + f" {'-':>11} {'-':>6} {result.peak / 1024:8.1f}KB")
+            continue
+
+        reference_time = reference["units"] * unit
+        time_ratio = result.time / reference_time if reference_time else 1.0
+        peak_ratio = result.peak / reference["peak"] if reference["peak"] else 1.0
+        slower = time_ratio > 1 + tolerance and result.time - reference_time > min_delta
+        bigger = peak_ratio > 1 + tolerance and result.peak - reference["peak"] > 4096
+        print(line + f" {reference_time * 1e3:9.3f}ms {time_ratio:6.2f}"
+                   + f" {result.peak / 1024:8.1f}KB {reference['peak'] / 1024:8.1f}KB {peak_ratio:6.2f}"
+                   + ("  SLOWER" if slower else "") + ("  BIGGER" if bigger else ""))
+        if slower or bigger:
+            regressions.append(name)
+    return regressions
+
+
+#---------------------------------------------------------------------------------------
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Runs the block diagram benchmarks.")
+    parser.add_argument("-k", "--filter", default="", help="only run the benchmarks whose name contains this")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file (default: benchmarks/baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--check", action="store_true", help="exit with status 1 when a benchmark regresses")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown / growth ratio (default: 0.25)")
+    parser.add_argument("--min-delta", type=float, default=0.05e-3, help="smallest time regression reported, in seconds")
+    parser.add_argument("--repeat", type=int, default=5, help="timed repeats per benchmark (default: 5)")
+    parser.add_argument("--min-time", type=float, default=0.1, help="minimum duration of one repeat in seconds")
+    parser.add_argument("--quick", action="store_true", help="one short repeat per benchmark")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.repeat, args.min_time = 1, 0.02
+
+    unit = measure(calibration_loop, args.repeat, args.min_time).time
+    results : Dict[str, Result] = {}
+    for name, setup in BENCHMARKS.items():
+        if args.filter in name:
+            results[name] = measure(setup(), args.repeat, args.min_time)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        baseline = load_baseline(args.baseline)
+    regressions = compare(results, baseline, unit, args.tolerance, args.min_delta)
+
+    # the first run on a machine, or of a new benchmark, sets its baseline
+    stored = results if args.save_baseline else {name: result for name, result in results.items() if name not in baseline}
+    if stored:
+        save_baseline(args.baseline, stored, unit)
+        print(f"\nstored the baseline of {len(stored)} benchmark(s) in {args.baseline}")
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        if args.check:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
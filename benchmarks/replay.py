@@ -0,0 +1,232 @@
+"""
+Records the mouse and key events of an editing session and replays them headlessly through
+Textual's run_test pilot, to measure the latency of the canvas event handlers end to end:
+
+    python benchmarks/replay.py record session.jsonl [--diagram FILE]
+    python benchmarks/replay.py replay session.jsonl [--diagram FILE] [--realtime] [--json]
+
+The recording starts with a header line (terminal size and diagram) followed by one JSON line
+per input event. The replay runs the application at the recorded terminal size, loads the
+diagram and posts the events to the application as the driver would, as fast as it drains
+them unless --realtime keeps the recorded pace. It then reports the p50/p95/p99 handling time
+of on_mouse_move, on_mouse_up and on_key, and of flush_pending_move, which redraws the
+preview of the drag moves on_mouse_move coalesces.
+"""
+from functools import wraps
+from statistics import quantiles
+from typing import Dict, List, TextIO, Tuple
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "textual-blockdiagram")
+sys.path.insert(0, SOURCE_DIR)
+
+from textual import events
+
+from _canvas import AsciiCanvas
+from blockdiagram import BlockDiagramApp
+
+
+MOUSE_EVENTS = {
+    cls.__name__: cls
+    for cls in (
+        events.MouseDown, events.MouseMove, events.MouseUp,
+        events.MouseScrollDown, events.MouseScrollUp, events.MouseScrollLeft, events.MouseScrollRight,
+    )
+}
+MOUSE_FIELDS = ("x", "y", "delta_x", "delta_y", "button", "shift", "meta", "ctrl")
+
+TIMED_HANDLERS = ("on_mouse_move", "flush_pending_move", "on_mouse_up", "on_key")
+PERCENTILES    = (50, 95, 99)
+
+
+#---------------------------------------------------------------------------------------
+def encode_event(event: events.Event, start: float) -> Dict:
+    record = {"t": round(time.monotonic() - start, 6), "event": type(event).__name__}
+    if isinstance(event, events.Key):
+        record["key"] = event.key
+        record["character"] = event.character
+    else:
+        for field in MOUSE_FIELDS:
+            record[field] = getattr(event, field)
+    return record
+
+
+#---------------------------------------------------------------------------------------
+def decode_event(record: Dict) -> events.Event:
+    if record["event"] == "Key":
+        return events.Key(record["key"], record["character"])
+    cls = MOUSE_EVENTS[record["event"]]
+    return cls(None, *(record[field] for field in MOUSE_FIELDS), screen_x=record["x"], screen_y=record["y"])
+
+
+#---------------------------------------------------------------------------------------
+def read_session(file_name) -> Tuple[Dict, List[Dict]]:
+    with open(file_name, encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        records = [json.loads(line) for line in f if line.strip()]
+    return header, records
+
+
+#=======================================================================================
+class RecordingApp(BlockDiagramApp):
+    """
+    The editor, writing every input event it receives from the driver to a session file.
+    """
+    CSS_PATH = os.path.join(SOURCE_DIR, BlockDiagramApp.CSS_PATH)
+
+    def __init__(self, output: TextIO, diagram=None) -> None:
+        super().__init__()
+        self.output  = output
+        self.diagram = diagram
+        self.start   = time.monotonic()
+
+    #---------------------------------------------------------------------------------------
+    def on_mount(self) -> None:
+        # textual also calls the on_mount of BlockDiagramApp, which fills the menus
+        if self.diagram is not None:
+            self.query_one(AsciiCanvas).load_diagram(self.diagram)
+        header = {"size": list(self.size), "diagram": self.diagram}
+        self.output.write(json.dumps(header) + "\n")
+        self.start = time.monotonic()
+
+    #---------------------------------------------------------------------------------------
+    async def on_event(self, event: events.Event) -> None:
+        if not event.is_forwarded and (isinstance(event, events.Key) or type(event).__name__ in MOUSE_EVENTS):
+            self.output.write(json.dumps(encode_event(event, self.start)) + "\n")
+        await super().on_event(event)
+
+
+#---------------------------------------------------------------------------------------
+def record(file_name, diagram=None) -> None:
+    with open(file_name, "w", encoding="utf-8") as output:
+        RecordingApp(output, diagram).run()
+
+
+#=======================================================================================
+class HandlerTimer():
+    """
+    Wraps the timed handlers of AsciiCanvas and collects their durations. A handler called
+    from another timed handler (e.g. the flush of on_mouse_up) counts only in its caller.
+    """
+    def __init__(self) -> None:
+        self.samples : Dict[str, List[float]] = {name: [] for name in TIMED_HANDLERS}
+        self._depth = 0
+        self._originals = {}
+
+    #---------------------------------------------------------------------------------------
+    def install(self) -> None:
+        for name in TIMED_HANDLERS:
+            self._originals[name] = original = AsciiCanvas.__dict__[name]
+            setattr(AsciiCanvas, name, self._timed(name, original))
+
+    #---------------------------------------------------------------------------------------
+    def uninstall(self) -> None:
+        for name, original in self._originals.items():
+            setattr(AsciiCanvas, name, original)
+        self._originals.clear()
+
+    #---------------------------------------------------------------------------------------
+    def _timed(self, name, function):
+        samples = self.samples[name]
+
+        @wraps(function)
+        def timed(*args, **kwargs):
+            self._depth += 1
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                self._depth -= 1
+                if self._depth == 0:
+                    samples.append(elapsed)
+        return timed
+
+
+#---------------------------------------------------------------------------------------
+async def replay(file_name, diagram=None, realtime=False) -> Dict[str, List[float]]:
+    header, records = read_session(file_name)
+    diagram = diagram or header.get("diagram")
+
+    timer = HandlerTimer()
+    timer.install()
+    try:
+        app = BlockDiagramApp()
+        async with app.run_test(size=tuple(header["size"])) as pilot:
+            if diagram is not None:
+                app.query_one(AsciiCanvas).load_diagram(diagram)
+            await pilot.pause()
+            for handler_samples in timer.samples.values():
+                handler_samples.clear()
+
+            start = time.monotonic()
+            for record in records:
+                if realtime:
+                    await asyncio.sleep(max(0.0, start + record["t"] - time.monotonic()))
+                app.post_message(decode_event(record))
+                # the application forwards the event to a widget, which may post messages back
+                # to it (e.g. a button press): let both hops drain without idling
+                await pilot.pause(0)
+                await pilot.pause(0)
+            await pilot.pause()
+    finally:
+        timer.uninstall()
+    return timer.samples
+
+
+#---------------------------------------------------------------------------------------
+def percentiles(samples: List[float]) -> List[float]:
+    if len(samples) == 1:
+        return [samples[0]] * len(PERCENTILES)
+    cuts = quantiles(samples, n=100, method="inclusive")
+    return [cuts[p - 1] for p in PERCENTILES]
+
+
+#---------------------------------------------------------------------------------------
+def report(samples: Dict[str, List[float]]) -> Dict[str, Dict]:
+    summary = {}
+    print(f"{'handler':<22}{'events':>8}" + "".join(f"{'p' + str(p):>12}" for p in PERCENTILES))
+    for name, handler_samples in samples.items():
+        if not handler_samples:
+            print(f"{name:<22}{0:>8}" + "".join(f"{'-':>12}" for _ in PERCENTILES))
+            continue
+        values = percentiles(handler_samples)
+        summary[name] = {"events": len(handler_samples), **{f"p{p}": value for p, value in zip(PERCENTILES, values)}}
+        print(f"{name:<22}{len(handler_samples):>8}" + "".join(f"{value * 1e3:>10.3f}ms" for value in values))
+    return summary
+
+
+#---------------------------------------------------------------------------------------
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Records and replays editing sessions to measure the event handling latency.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record", help="run the editor and record its input events")
+    record_parser.add_argument("session", help="session file to write")
+    record_parser.add_argument("--diagram", help="diagram opened before recording")
+
+    replay_parser = commands.add_parser("replay", help="replay a session headlessly and report the latencies")
+    replay_parser.add_argument("session", help="session file to replay")
+    replay_parser.add_argument("--diagram", help="diagram to replay against (default: the recorded one)")
+    replay_parser.add_argument("--realtime", action="store_true", help="keep the recorded pace instead of full speed")
+    replay_parser.add_argument("--json", help="also write the percentiles, in seconds, to this file")
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        record(args.session, args.diagram)
+        return 0
+
+    summary = report(asyncio.run(replay(args.session, args.diagram, args.realtime)))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
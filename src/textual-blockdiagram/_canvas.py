@@ -1,35 +1,24 @@
-# from textual_textarea import TextArea
-from textual.app import App, ComposeResult
-from textual.message import Message
-from textual.containers import Container, VerticalScroll, Horizontal, Vertical
-from textual.widgets import Header, Footer, Button, Static
-from textual.reactive import reactive
+from textual.scroll_view import ScrollView
+from textual.reactive import reactive, var
+from textual.geometry import Offset, Region, Size
+from textual.strip import Strip
 from textual.events import MouseEvent
 from textual import events
-from textual.binding import Binding
 
-from rich.console import RenderableType
 from rich.style import Style
-from rich.syntax import Syntax
-from rich.text import Text
 
-from typing import Deque, List, Tuple, Union, NamedTuple
+from typing import Union
 
 from _shapes import *
 from _utils import *
-import copy
-import os
-import pathlib
+import time
 
-from json_encoder import CompactJSONEncoder
+from _render import LineCache, Overlay
+from _grid import Clipboard
+from _model import DiagramModel
 
 
-class CommandHistory():
-    def __init__(self) -> None:
-        pass
-
-
-class AsciiCanvas(Static, can_focus=True):
+class AsciiCanvas(ScrollView, can_focus=True):
 
     CSS_PATH = "AsciiCanvas.tcss"
     BINDINGS = [
@@ -40,37 +29,164 @@ class AsciiCanvas(Static, can_focus=True):
     INIT_ROWS = 50
     INIT_COLS = 120
 
-    drawing_buffer  = [[" "  for _ in range(120)] for _ in range(INIT_ROWS)]
-    temp_buffer     = [[" "  for _ in range(120)] for _ in range(INIT_ROWS)]
-    metadata_buffer = [[None for _ in range(120)] for _ in range(INIT_ROWS)]
-
-    active_buffer   = None
-
-    selection_anchor: reactive[Union[Cursor, None]] = reactive(None)
+    # arrow heads dragged within this many cells of a box border snap to it, 0 disables snapping
+    ARROW_SNAP_DISTANCE = 2
 
-    col_max   : reactive[int] = reactive(120)
-    row_max   : reactive[int] = reactive(INIT_ROWS)
+    # drag previews are rebuilt at most this many times per second
+    MAX_FPS = 60
 
-    drawing_col_max = 0
-    drawing_row_max = 0
+    model = None
 
-    command_history = None
-    shapes  = []
+    # cursor and selection are drawn by the overlay, changing them must not repaint the whole canvas
+    selection_anchor: var[Union[Cursor, None]] = var(None)
 
     active_command : reactive[dict | None] = reactive(None)
     approach_mode  = None
 
-    cursor: reactive[Cursor] = reactive(Cursor(0, 0))
-    cursor_visible: reactive[bool] = reactive(True)
+    cursor: var[Cursor] = var(Cursor(0, 0))
+    cursor_visible: var[bool] = var(True)
 
-    selection_data = {"state": None, "buffer": None, "metadata": None, "range": None, "hide_box": False}
+    selection_data = {"state": None, "buffer": None, "metadata": None, "shapes": None, "range": None, "hide_box": False}
 
     #---------------------------------------------------------------------------------------
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        self.active_buffer = self.drawing_buffer
-        self.update(self._content)
+        self.line_cache     = LineCache()
+        self.overlay        = Overlay()
+        self._canvas_size   = None
+
+        # the canvas only draws the model, the rows it changes are repainted on the next refresh
+        self.model = DiagramModel(self.INIT_ROWS, self.INIT_COLS)
+        self.model.on_rows_changed = self.line_cache.mark_rows_dirty
+        self.model.on_reset        = self.line_cache.mark_all_dirty
+
+        self._pending_move  : Union[Offset, None] = None
+        self._move_timer    = None
+        self._last_frame    = 0.0
+
+        self.refresh_canvas()
+
+    #---------------------------------------------------------------------------------------
+    # views over the model
+    @property
+    def drawing_buffer(self):
+        return self.model.drawing_buffer
+
+    @property
+    def metadata_buffer(self):
+        return self.model.metadata_buffer
+
+    @property
+    def preview(self):
+        return self.model.preview
+
+    @property
+    def shapes(self):
+        return self.model.shapes
+
+    @property
+    def command_history(self):
+        return self.model.command_history
+
+    @property
+    def router(self):
+        return self.model.router
+
+    @property
+    def col_max(self) -> int:
+        return self.model.col_max
+
+    @property
+    def row_max(self) -> int:
+        return self.model.row_max
+
+    @property
+    def drawing_col_max(self) -> int:
+        return self.model.drawing_col_max
+
+    @property
+    def drawing_row_max(self) -> int:
+        return self.model.drawing_row_max
+
+    @property
+    def active_buffer(self):
+        return self.model.active_buffer
+
+    @active_buffer.setter
+    def active_buffer(self, buffer):
+        self.model.active_buffer = buffer
+
+    #---------------------------------------------------------------------------------------
+    def discard_preview(self) -> None:
+        self.model.discard_preview()
+
+    #---------------------------------------------------------------------------------------
+    def refresh_canvas(self) -> None:
+        """
+        Repaints the rows changed since the last refresh plus the overlay. A full repaint (and a
+        new layout) only happens when the size of the canvas changed.
+        """
+        self.update_overlay()
+
+        canvas_size = Size(self.drawing_buffer.cols, len(self.drawing_buffer))
+        dirty_rows = self.line_cache.pop_pending_rows()
+        if canvas_size != self._canvas_size:
+            self._canvas_size = canvas_size
+            self.virtual_size = canvas_size
+            self.refresh()
+        elif dirty_rows is None:
+            self.refresh()
+        elif dirty_rows:
+            self.refresh_canvas_regions([Region(self.scroll_offset.x, row, self.size.width, 1) for row in dirty_rows])
+
+    #---------------------------------------------------------------------------------------
+    def update_overlay(self) -> None:
+        """
+        Moves the cursor and the selection box layers and repaints only the cells they cover.
+        """
+        cursor_region = None
+        if self.cursor_visible:
+            cursor_region = Region(self.cursor.col, self.cursor.row, 1, 1)
+
+        selection_region = None
+        if self.selection_anchor is not None and  self.active_command is not None and  self.active_command["cmd"] == "select" and self.selection_data["hide_box"] == False:
+            first = min(self.selection_anchor, self.cursor)
+            second = max(self.selection_anchor, self.cursor)
+            selection_region = Region(first.col + 1, first.row, max(0, second.col - first.col), second.row - first.row + 1)
+
+        regions  = self.overlay.set_layer("cursor", Style(reverse=True), cursor_region)
+        regions += self.overlay.set_layer("selection", Style(bgcolor="white"), selection_region)
+        if regions:
+            self.refresh_canvas_regions(regions)
+
+    #---------------------------------------------------------------------------------------
+    def refresh_canvas_regions(self, regions) -> None:
+        """
+        Repaints regions given in canvas coordinates.
+        """
+        scroll_x, scroll_y = self.scroll_offset
+        self.refresh(*[region.translate((-scroll_x, -scroll_y)) for region in regions])
+
+    #---------------------------------------------------------------------------------------
+    def get_canvas_offset(self, event: MouseEvent) -> Offset:
+        """
+        Translates the position of a mouse event in the viewport into canvas coordinates.
+        """
+        scroll_x, scroll_y = self.scroll_offset
+        return Offset(event.x + scroll_x, event.y + scroll_y)
+
+    #---------------------------------------------------------------------------------------
+    def render_row(self, row, start_col, width) -> Strip:
+        return self.overlay.apply(self.line_cache.get_strip(row, self.active_buffer, start_col, width), row, start_col)
+
+    #---------------------------------------------------------------------------------------
+    def render_line(self, y: int) -> Strip:
+        """
+        Renders only the part of the row visible in the viewport.
+        """
+        scroll_x, scroll_y = self.scroll_offset
+        return self.render_row(y + scroll_y, scroll_x, self.size.width)
 
     #=======================================================================================
     # On Functions
@@ -86,27 +202,27 @@ class AsciiCanvas(Static, can_focus=True):
     #---------------------------------------------------------------------------------------
     def _toggle_cursor(self) -> None:
         self.cursor_visible = not self.cursor_visible
-        self.update(self._content)
+        self.update_overlay()
     #---------------------------------------------------------------------------------------
     def on_focus(self) -> None:
         self.cursor_visible = True
         self.blink_timer.reset()
 
-        if self.parent.content_size.width > self.col_max or self.parent.content_size.height > self.row_max:
-            self.expand_canvas(self.parent.content_size.height-2, self.parent.content_size.width-2)
+        if self.size.width > self.col_max or self.size.height > self.row_max:
+            self.model.expand_canvas(self.size.height-2, self.size.width-2)
 
-        self.update(self._content)
+        self.refresh_canvas()
 
     #---------------------------------------------------------------------------------------
     def on_blur(self) -> None:
         self.blink_timer.pause()
         self.cursor_visible = False
-        self.update(self._content)
+        self.refresh_canvas()
 
     #---------------------------------------------------------------------------------------
     def move_cursor(self, x: int, y: int, set_pref: bool = False) -> None:
         self.cursor = self._get_valid_cursor(x, y, set_pref=set_pref)
-        self.update(self._content)
+        self.refresh_canvas()
 
 
     #---------------------------------------------------------------------------------------
@@ -121,6 +237,15 @@ class AsciiCanvas(Static, can_focus=True):
 
     #---------------------------------------------------------------------------------------
     def on_key(self, event: events.Key) -> None:
+        if event.key == "ctrl+z":
+            event.stop()
+            self.undo()
+            return
+        if event.key == "ctrl+y":
+            event.stop()
+            self.redo()
+            return
+
         if self.active_command:
             if self.active_command["cmd"] == "text-hor":
                 event.stop()
@@ -130,11 +255,11 @@ class AsciiCanvas(Static, can_focus=True):
                     self.move_cursor(self.cursor.col+1, self.cursor.row)
                 elif event.key == "backspace":
                     self.move_cursor(self.cursor.col-1, self.cursor.row)
-                    self.set_char(self.cursor.col, self.cursor.row, " ",None,False)
+                    self.model.set_char(self.cursor.col, self.cursor.row, " ",CellType.NONE,False)
                 elif event.is_printable:
                     assert event.character is not None
                     for char in event.character:
-                        self.set_char(self.cursor.col, self.cursor.row, char,"t",False)
+                        self.model.set_char(self.cursor.col, self.cursor.row, char,CellType.TEXT,False)
                         self.move_cursor(self.cursor.col+1, self.cursor.row)
             elif self.active_command["cmd"] == "text-ver":
                 event.stop()
@@ -144,11 +269,11 @@ class AsciiCanvas(Static, can_focus=True):
                     self.move_cursor(self.cursor.col, self.cursor.row+1)
                 elif event.key == "backspace":
                     self.move_cursor(self.cursor.col, self.cursor.row-1)
-                    self.set_char(self.cursor.col, self.cursor.row, " ",None,False)
+                    self.model.set_char(self.cursor.col, self.cursor.row, " ",CellType.NONE,False)
                 elif event.is_printable:
                     assert event.character is not None
                     for char in event.character:
-                        self.set_char(self.cursor.col, self.cursor.row, char,"t",False)
+                        self.model.set_char(self.cursor.col, self.cursor.row, char,CellType.TEXT,False)
                         self.move_cursor(self.cursor.col, self.cursor.row+1)
             else:
                 if event.key == "ctrl+c":
@@ -166,8 +291,15 @@ class AsciiCanvas(Static, can_focus=True):
                     event.stop()
                     # self.log(self.selection_data["buffer"])
                     if self.selection_data["buffer"]:
-                        first, second = self.selection_data["range"]
-                        self.move_selection(self.cursor.col, self.cursor.row, False)
+                        self.paste_selection(self.cursor.col, self.cursor.row)
+
+            # consecutive keystrokes of a text command are undone together, as long as the
+            # cursor is not moved elsewhere in between
+            cmd = self.active_command["cmd"]
+            if cmd in ("text-hor", "text-ver"):
+                self.model.commit(coalesce=cmd, cursor=self.cursor)
+            else:
+                self.model.commit()
 
 
 
@@ -178,38 +310,65 @@ class AsciiCanvas(Static, can_focus=True):
         """
 
         event.stop()
-        self.temp_buffer    = copy.deepcopy(self.drawing_buffer)
-        self.active_buffer  = self.temp_buffer
+        self._pending_move = None
+        # text typed after a click is a new undo step
+        self.command_history.seal()
+        point = self.get_canvas_offset(event)
+        self.discard_preview()
+        self.active_buffer  = self.preview
 
         self.cursor_visible = True
         self.blink_timer.reset()
         # self.undo_timer.reset()
         if event.button == 1:
-            self.selection_anchor = Cursor.from_mouse_event(event)
-            self.move_cursor(event.x, event.y)
-            self.parse_drawing_command(event, "down", dynamic_mode=True)
-            self.parse_util_command(event, "down")
+            self.selection_anchor = Cursor.from_mouse_event(point)
+            self.move_cursor(point.x, point.y)
+            self.parse_drawing_command(point, "down", dynamic_mode=True)
+            self.parse_util_command(point, "down")
         self.focus()
 
 
     #---------------------------------------------------------------------------------------
     def on_mouse_move(self, event: events.MouseMove) -> None:
+        """
+        Drag moves are coalesced: only the latest position is kept and the preview is rebuilt
+        on the next frame, at most MAX_FPS times per second.
+        """
         if event.button == 1:
-            self.active_buffer  = self.temp_buffer
-            self.cursor_visible = True
-            start_col = self.selection_anchor.col
-            start_row = self.selection_anchor.row
-            end_col   = event.x
-            end_row   = event.y
+            point = self.get_canvas_offset(event)
+            if self.active_command and self.active_command["cmd"] == "eraser":
+                # erasing is cheap and must not skip the cells in between
+                self.drag_to(point)
+                return
+
+            self._pending_move = point
+            if self._move_timer is None:
+                # textual timers need a non zero delay
+                delay = max(0.001, self._last_frame + 1 / self.MAX_FPS - time.monotonic())
+                self._move_timer = self.set_timer(delay, self.flush_pending_move, name="move_timer")
 
-            if start_row < len(self.metadata_buffer) and end_row+2 < len(self.metadata_buffer) and start_col < len(self.metadata_buffer[start_row]) and end_col+2 < len(self.metadata_buffer[end_row]):
-                self.approach_mode  = Arrow.determine_approach_mode(start_col, start_row, end_col, end_row, self.metadata_buffer, self)
+    #---------------------------------------------------------------------------------------
+    def flush_pending_move(self) -> None:
+        if self._move_timer is not None:
+            self._move_timer.stop()
+            self._move_timer = None
+        point, self._pending_move = self._pending_move, None
+        if point is not None:
+            self.drag_to(point)
 
-            self.move_cursor(event.x, event.y)
-            self.parse_drawing_command(event, "move", dynamic_mode=True)
-            self.parse_util_command(event, "move")
+    #---------------------------------------------------------------------------------------
+    def drag_to(self, point: Offset) -> None:
+        if self.selection_anchor is None:
+            return
+        self._last_frame = time.monotonic()
+        self.discard_preview()
+        self.active_buffer  = self.preview
+        self.cursor_visible = True
+        point = self.snap_arrow_point(point)
 
-            self.temp_buffer = copy.deepcopy(self.drawing_buffer)
+        self.move_cursor(point.x, point.y)
+        self.parse_drawing_command(point, "move", dynamic_mode=True)
+        self.parse_util_command(point, "move")
 
     #---------------------------------------------------------------------------------------
     def on_mouse_up(self, event: events.MouseUp) -> None:
@@ -217,21 +376,46 @@ class AsciiCanvas(Static, can_focus=True):
         Moves the cursor to the click.
         """
         event.stop()
+        # the last move still drives the command state (e.g. a selection starting), the up
+        # itself is then applied at its exact position
+        self.flush_pending_move()
+        point = self.get_canvas_offset(event)
         self.cursor_visible = True
         self.active_buffer = self.drawing_buffer
-        if self.selection_anchor == Cursor.from_mouse_event(event):
+        self.discard_preview()
+        if self.selection_anchor == Cursor.from_mouse_event(point):
             # simple click
             self.selection_anchor = None
             # self.selection_range = None
+            self.refresh_canvas()
         else:
-            self.move_cursor(event.x, event.y)
-            self.parse_drawing_command(event, "up", dynamic_mode=False)
-            self.parse_util_command(event, "up")
+            point = self.snap_arrow_point(point)
+            self.move_cursor(point.x, point.y)
+            self.parse_drawing_command(point, "up", dynamic_mode=False)
+            self.parse_util_command(point, "up")
             self.approach_mode = None
 
+        self.model.commit()
         self.focus()
-        # self.active_buffer = self.drawing_buffer
-        # self.update(self._content)
+
+    #---------------------------------------------------------------------------------------
+    def snap_arrow_point(self, point: Offset) -> Offset:
+        """
+        Sets the approach mode of the arrow being dragged and returns its end point, moved
+        next to a box border when one is within ARROW_SNAP_DISTANCE.
+        """
+        if self.selection_anchor is None:
+            return point
+        start_col = self.selection_anchor.col
+        start_row = self.selection_anchor.row
+
+        self.approach_mode = Arrow.determine_approach_mode(start_col, start_row, point.x, point.y, self.metadata_buffer, self)
+        if self.active_command and self.active_command["cmd"] in ("arrow", "arrow-route") and self.approach_mode is None:
+            snapped = Arrow.snap_endpoint(start_col, start_row, point.x, point.y, self.metadata_buffer, self.ARROW_SNAP_DISTANCE)
+            if snapped is not None:
+                end_col, end_row, self.approach_mode = snapped
+                point = Offset(end_col, end_row)
+        return point
 
     #---------------------------------------------------------------------------------------
     def on_click(self, event: events.Click) -> None:
@@ -248,51 +432,27 @@ class AsciiCanvas(Static, can_focus=True):
         self.active_command["cmd"] = cmd
         self.active_command["char_set"] = kwargs.pop("char_set", None)
         self.active_command["arrow_set"] = kwargs.pop("arrow_set", None)
+        self.update_overlay()
 
     #---------------------------------------------------------------------------------------
-    def parse_drawing_command(self, event: events.MouseMove,  event_type="move", dynamic_mode=False):
+    def parse_drawing_command(self, event: Offset,  event_type="move", dynamic_mode=False):
         if self.active_command:
-            if event_type in ("up", "move"):
-                if self.active_command["cmd"] == "box":
-                    new_shape = Box(self, self.active_command["char_set"],dynamic_mode)
-                    new_shape.draw(event, self.selection_anchor)
-                    if not dynamic_mode:
-                        self.shapes.append(new_shape)
-
-                if self.active_command["cmd"] == "arrow":
-                    new_shape = Arrow(self, self.active_command["char_set"],dynamic_mode)
-                    new_shape.draw(event, self.selection_anchor, self.approach_mode)
-                    if not dynamic_mode:
-                        self.shapes.append(new_shape)
-
-                if self.active_command["cmd"] == "trapezoid-ver":
-                    new_shape = Trapezoid(self, self.active_command["char_set"],dynamic_mode)
-                    new_shape.draw(self.cursor, self.selection_anchor,"ver")
-                    if not dynamic_mode:
-                        self.shapes.append(new_shape)
-
-                if self.active_command["cmd"] == "trapezoid-hor":
-                    new_shape = Trapezoid(self, self.active_command["char_set"],dynamic_mode)
-                    new_shape.draw(self.cursor, self.selection_anchor,"hor")
-                    if not dynamic_mode:
-                        self.shapes.append(new_shape)
-
-                if self.active_command["cmd"] == "line":
-                    new_shape = Line(self, self.active_command["char_set"],dynamic_mode)
-                    new_shape.draw(self.cursor, self.selection_anchor)
-                    if not dynamic_mode:
-                        self.shapes.append(new_shape)
+            cmd = self.active_command["cmd"]
+            if event_type in ("up", "move") and cmd in self.model.SHAPES:
+                # boxes and arrows follow the pointer, the other shapes the cursor kept on the canvas
+                end = Cursor(event.y, event.x) if cmd in ("box", "arrow", "arrow-route") else self.cursor
+                self.model.draw(cmd, self.selection_anchor, end, self.active_command["char_set"], dynamic_mode, self.approach_mode)
 
             if event_type in ("down", "move"):
                 if self.active_command["cmd"] == "eraser":
                     self.active_buffer  = self.drawing_buffer
-                    self.set_char(event.x, event.y, " ", None, False)
+                    self.model.erase_rect(event.x, event.y, event.x, event.y)
 
 
-        self.update(self._content)
+        self.refresh_canvas()
 
     #---------------------------------------------------------------------------------------
-    def parse_util_command(self, event: events.MouseMove, event_type="move"):
+    def parse_util_command(self, event: Offset, event_type="move"):
         if self.active_command:
             if self.active_command["cmd"] == "select":
                 # self.log(f"event_type: {event_type} self.selection_data['state']: {self.selection_data['state']}")
@@ -324,222 +484,95 @@ class AsciiCanvas(Static, can_focus=True):
                         self.selection_data["state"] = "selected"
                         first = min(self.selection_anchor, self.cursor)
                         second = max(self.selection_anchor, self.cursor)
-                        self.selection_data["range"] = (copy.deepcopy(first), copy.deepcopy(second))
+                        self.selection_data["range"] = (first, second)
                         self.copy_selection(first, second)
 
                     elif self.selection_data["state"] =="selected":
-                        self.move_selection(event.x - 1, event.y, False)
+                        first, second = self.selection_data["range"]
+                        moved_shapes = self.model.shapes_in(first, second, contained=True)
+                        # the source is cleared first, the pasted cells may overlap it, erasing
+                        # drops the moved shapes too, they come back at their new place
                         self.erase_selection()
+                        self.move_selection(event.x - 1, event.y, False)
+                        for shape in moved_shapes:
+                            self.model.translate_shape(shape, event.x - 1 - first.col, event.y - first.row)
+                            self.model.add_shape(shape)
                         self.selection_data["state"] = None
                         self.selection_data["buffer"] = None
                         self.active_command["cmd"] = None
 
-            self.update(self._content)
+            self.refresh_canvas()
 
     #=======================================================================================
     # Selection Functions
     #=======================================================================================
     def copy_selection(self, first, second):
-        self.selection_data["buffer"] = []
-        self.selection_data["metadata"] = []
-        for row in range(first.row, second.row+1):
-            row_data = []
-            row_metadata = []
-            for col in range(first.col, second.col+1):
-                if self.active_buffer[row][col] != " ":
-                    row_data.append(self.active_buffer[row][col])
-                else:
-                    row_data.append(None)
-                row_metadata.append(self.get_metadata(col,row))
-
-            self.selection_data["buffer"].append(row_data)
-            self.selection_data["metadata"].append(row_metadata)
+        clipboard = Clipboard.from_grids(self.active_buffer, self.metadata_buffer, first.col, first.row, second.col, second.row)
+        self.selection_data["buffer"]   = clipboard
+        self.selection_data["metadata"] = clipboard.types
+        # copies, the shapes of the selection may move before it is pasted
+        self.selection_data["shapes"]   = [shape.copy() for shape in self.model.shapes_in(first, second, contained=True)]
 
     #---------------------------------------------------------------------------------------
     def move_selection(self, dest_col, dest_row, dynamic_mode):
-        for row in range(len(self.selection_data["buffer"])):
-            for col in range(len(self.selection_data["buffer"][row])):
-                if self.selection_data["buffer"][row][col] != None:
-                    self.set_char(dest_col+col, dest_row+row, self.selection_data["buffer"][row][col],self.selection_data["metadata"][row][col],dynamic_mode)
+        self.model.blit_clipboard(self.selection_data["buffer"], dest_col, dest_row, dynamic_mode)
+        self.refresh_canvas()
 
-        self.update(self._content)
+    #---------------------------------------------------------------------------------------
+    def paste_selection(self, dest_col, dest_row):
+        """
+        Pastes the copied cells with their top left corner at (dest_col, dest_row), along with
+        copies of the shapes they hold.
+        """
+        first, _ = self.selection_data["range"]
+        self.move_selection(dest_col, dest_row, False)
+        self.model.add_shape_copies(self.selection_data["shapes"] or (), dest_col - first.col, dest_row - first.row)
 
     #---------------------------------------------------------------------------------------
     def erase_selection(self):
         first, second = self.selection_data["range"]
-        for row in range(first.row, second.row+1):
-            for col in range(first.col, second.col+1):
-                self.set_char(col, row, " ", None,False)
-
-        self.update(self._content)
+        self.model.erase_rect(first.col, first.row, second.col, second.row)
+        self.refresh_canvas()
 
 
     #=======================================================================================
-    # Save and Open Functions
+    # Undo Functions
     #=======================================================================================
-    def save_diagram(self, file_name):
-        import json
-
-        drawing =  "\n".join(list(map("".join, self.active_buffer)))
-
-        if pathlib.Path(file_name).suffix == ".json":
-
-            data = {}
-            data["drawing"] = []
-            for drawing_line in drawing.split("\n")[:self.drawing_row_max+1]:
-                data["drawing"].append(drawing_line[:self.drawing_col_max+1])
-
-            data["metadata"] = []
-            for row in self.metadata_buffer[:self.drawing_row_max+1]:
-                data["metadata"].append(row[:self.drawing_col_max+1])
-
-
-            # Serializing json
-            json_object = json.dumps(data, indent=4, ensure_ascii=False, cls=CompactJSONEncoder)
-
-            # Writing to sample.json
-            with open(file_name, "w") as outfile:
-                drawing_comment =  "\n".join([ "//" + line for line in data["drawing"]]) + "\n\n"
-                outfile.write(drawing_comment)
-                outfile.write(json_object)
-        else:
-            self.write_to_file(file_name, drawing)
+    def undo(self):
+        if self.model.undo() is not None:
+            self.refresh_canvas()
 
     #---------------------------------------------------------------------------------------
-    def load_diagram(self, file_name):
-        import re
-        import json
-        def remove_comments(string):
-            string = re.sub(re.compile("//.*?\n" ) ,"" ,string) # remove all occurance singleline comments (//COMMENT\n ) from string
-            return string
-
-        def load_lines(lines):
-            for line_num,line in enumerate(lines):
-                for char_num,char in enumerate(line):
-                    self.set_char(char_num, line_num, char, None, False)
-
-        if pathlib.Path(file_name).suffix == ".json":
-             with open(file_name) as f:
-                file_content = f.read()
-                file_content = remove_comments(file_content)
-                json_object = json.loads(file_content)
-                load_lines(json_object["drawing"])
-                self.metadata_buffer = json_object["metadata"]
-
-        else:
-            with open(file_name) as f:
-                lines = [line.rstrip() for line in f]
-                load_lines(lines)
-
-    #---------------------------------------------------------------------------------------
-    def write_to_file(self, file_name, text):
-        with open(file_name, "w") as f:
-                f.write(text)
-
-    #---------------------------------------------------------------------------------------
-    def write_metadata_to_file(self, file_name, target_metadata):
-        metadata = ""
-        if target_metadata:
-            for row in target_metadata:
-                for col in row:
-                    if col == None:
-                        metadata = metadata + " "
-                    elif col[-1] in ("h", "v"):
-                        metadata = metadata + col[-1]
-                    else:
-                        metadata = metadata + col
-                metadata = metadata + "\n "
-
-            self.write_to_file(file_name, metadata)
+    def redo(self):
+        if self.model.redo() is not None:
+            self.refresh_canvas()
 
 
     #=======================================================================================
-    # Buffer manipulation functions
+    # Save and Open Functions
     #=======================================================================================
-    def expand_canvas(self, row, col):
-        exp_char = " "
-
-        # Expand the number of rows
-        if row >= len(self.drawing_buffer):
-            row_diff = row - len(self.drawing_buffer) + 2
-            for i in range(row_diff):
-                self.drawing_buffer.append(     [exp_char  for _ in range(self.col_max)])
-                self.temp_buffer.append(        [exp_char  for _ in range(self.col_max)])
-                self.metadata_buffer.append(    [None      for _ in range(self.col_max)])
-
-        # Expand the number of columns
-        if col >= len(self.drawing_buffer[row]):
-            for drawing_line, temp_line, meta_line in zip(self.drawing_buffer, self.temp_buffer, self.metadata_buffer):
-                drawing_line.extend(    [exp_char   for _ in range(col - len(drawing_line) + 2)])
-                temp_line.extend(       [exp_char   for _ in range(col - len(temp_line) + 2)])
-                meta_line.extend(       [None       for _ in range(col - len(meta_line) + 2)])
-
-        if self.col_max < col:
-            self.col_max = col
-        if self.row_max < row:
-            self.row_max = row
-
-        self.update(self._content)
+    def save_diagram(self, file_name, comment_preview=None):
+        self.model.save_diagram(file_name, comment_preview)
 
     #---------------------------------------------------------------------------------------
-    def set_char(self, col, row, char, char_type=None, dynamic=True):
-        self.expand_canvas(row, col)
-
-        if row < len(self.active_buffer) and col < len(self.active_buffer[row]):
-            self.active_buffer[row][col] = char
-
-            if not dynamic:
-                self.metadata_buffer[row][col] = char_type
-
-                if self.drawing_col_max < col:
-                    self.drawing_col_max = col
-                if self.drawing_row_max < row:
-                    self.drawing_row_max = row
+    def load_diagram(self, file_name):
+        self.model.load_diagram(file_name)
+        self.clear_selection()
+        self.refresh_canvas()
 
     #---------------------------------------------------------------------------------------
-    def get_metadata(self, col, row):
-        if row < len(self.metadata_buffer) and col < len(self.metadata_buffer[row]):
-            return self.metadata_buffer[row][col]
-        else:
-            return None
+    def clear_diagram(self):
+        """
+        Drops the drawing, its shapes, the selection and the undo history.
+        """
+        self.model.clear()
+        self.clear_selection()
+        self.refresh_canvas()
 
     #---------------------------------------------------------------------------------------
-    @property
-    def _content(self) -> RenderableType:
-        drawing =  "\n".join(list(map("".join, self.active_buffer)))
-
-        # self.write_to_file(f"{os.path.dirname(__file__)}/drawing_buffer.txt", drawing)
-        # self.write_metadata_to_file(f"{os.path.dirname(__file__)}/metadata.txt", self.metadata_buffer)
-        # self.write_metadata_to_file(f"{os.path.dirname(__file__)}/selection_data_metadata.txt", self.selection_data["metadata"])
-
-        syntax = Syntax(
-            drawing,
-            lexer=None,  # type: ignore
-            theme="monokai",
-        )
-        if self.cursor_visible:
-            syntax.stylize_range(
-                "reverse",
-                # rows are 1-indexed
-                (self.cursor.row + 1, self.cursor.col),
-                (self.cursor.row + 1, self.cursor.col + 1),
-            )
-
-        if self.selection_anchor is not None and  self.active_command is not None and  self.active_command["cmd"] == "select" and self.selection_data["hide_box"] == False:
-            first = min(self.selection_anchor, self.cursor)
-            second = max(self.selection_anchor, self.cursor)
-            selection_style = Style(
-                bgcolor="white"
-            )
-            for row in range(first.row, second.row + 1):
-                syntax.stylize_range(
-                    selection_style,
-                    # rows are 1-indexed
-                    (row + 1, first.col + 1),
-                    (row + 1, second.col + 1),
-                )
-        return syntax
-
+    def clear_selection(self):
+        self.selection_anchor = None
+        self.selection_data = {"state": None, "buffer": None, "metadata": None, "shapes": None, "range": None, "hide_box": False}
 
 
 
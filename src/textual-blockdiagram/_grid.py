@@ -0,0 +1,590 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterator, List, Set, Tuple, Union
+import re
+import sys
+
+from _utils import CELL_TYPE_TAGS, CELL_TYPE_CODES, CellType
+
+
+# array("u") is deprecated from python 3.13 on, "w" is its replacement
+CHAR_TYPECODE = "w" if sys.version_info >= (3, 13) else "u"
+
+
+TILE_SIZE = 64
+
+
+#====================================================================================================================================
+class GridRow():
+    """
+    View over one row of a TiledGrid, so the canvas can keep indexing cells as grid[row][col].
+    """
+    __slots__ = ("grid", "row")
+
+    #---------------------------------------------------------------------------------------
+    def __init__(self, grid, row) -> None:
+        self.grid = grid
+        self.row = row
+
+    #---------------------------------------------------------------------------------------
+    def __len__(self) -> int:
+        return self.grid.cols
+
+    #---------------------------------------------------------------------------------------
+    def __getitem__(self, col):
+        return self.grid.get(col, self.row)
+
+    #---------------------------------------------------------------------------------------
+    def __setitem__(self, col, value) -> None:
+        self.grid.set(col, self.row, value)
+
+    #---------------------------------------------------------------------------------------
+    def __iter__(self) -> Iterator:
+        return iter(self.grid.row_slice(self.row))
+
+    #---------------------------------------------------------------------------------------
+    def tounicode(self, start=0, end=None) -> str:
+        return self.grid.row_slice(self.row, start, end).tounicode()
+
+
+#====================================================================================================================================
+class TiledGrid():
+    """
+    Sparse 2D plane split in TILE_SIZE x TILE_SIZE tiles, each tile being one flat array that
+    is only allocated on the first write of a non blank value. Memory is proportional to the
+    drawn content and growing the grid only moves its logical extent (rows x cols).
+    version is bumped on every write, so caches derived from the grid can tell they are stale.
+    When a loader (RowLoader) is attached, rows are read from its source on first access.
+    """
+    TYPECODE = "B"
+    FILL     = 0
+
+    loader = None
+
+    #---------------------------------------------------------------------------------------
+    def __init__(self, rows, cols) -> None:
+        self.rows  = rows
+        self.cols  = cols
+        self.tiles : Dict[Tuple[int, int], array] = {}
+        self._blank = array(self.TYPECODE, [self.FILL]) * TILE_SIZE
+        self.version = 0
+
+    #---------------------------------------------------------------------------------------
+    def __len__(self) -> int:
+        return self.rows
+
+    #---------------------------------------------------------------------------------------
+    def __getitem__(self, row) -> GridRow:
+        return GridRow(self, row)
+
+    #---------------------------------------------------------------------------------------
+    def __iter__(self) -> Iterator[GridRow]:
+        for row in range(self.rows):
+            yield GridRow(self, row)
+
+    #---------------------------------------------------------------------------------------
+    def _new_tile(self) -> array:
+        return self._blank * TILE_SIZE
+
+    #---------------------------------------------------------------------------------------
+    def get(self, col, row):
+        if self.loader is not None:
+            self.loader.touch(row // TILE_SIZE)
+        tile = self.tiles.get((row // TILE_SIZE, col // TILE_SIZE))
+        if tile is None:
+            return self.FILL
+        return tile[(row % TILE_SIZE) * TILE_SIZE + col % TILE_SIZE]
+
+    #---------------------------------------------------------------------------------------
+    def set(self, col, row, value) -> None:
+        if self.loader is not None:
+            self.loader.touch(row // TILE_SIZE)
+        self.version += 1
+        key = (row // TILE_SIZE, col // TILE_SIZE)
+        tile = self.tiles.get(key)
+        if tile is None:
+            if value == self.FILL:
+                return
+            tile = self.tiles[key] = self._new_tile()
+        tile[(row % TILE_SIZE) * TILE_SIZE + col % TILE_SIZE] = value
+
+    #---------------------------------------------------------------------------------------
+    def ensure_loaded(self, start_row, end_row) -> None:
+        """
+        Loads the rows start_row to end_row from the loader, if any, for the lookups that do not
+        read the rows themselves (the box edge index of MetadataGrid).
+        """
+        if self.loader is not None:
+            self.loader.load(start_row, end_row)
+
+    #---------------------------------------------------------------------------------------
+    def expand(self, rows, cols) -> None:
+        """
+        Grows the logical extent of the grid to at least rows x cols, no memory is allocated.
+        """
+        self.rows = max(self.rows, rows)
+        self.cols = max(self.cols, cols)
+
+    #---------------------------------------------------------------------------------------
+    def clear(self) -> None:
+        self.version += 1
+        self.tiles.clear()
+
+    #---------------------------------------------------------------------------------------
+    def copy(self) -> "TiledGrid":
+        grid = self.__class__(self.rows, self.cols)
+        grid.tiles = {key: tile[:] for key, tile in self.tiles.items()}
+        return grid
+
+    #---------------------------------------------------------------------------------------
+    def row_slice(self, row, start=0, end=None) -> array:
+        """
+        Returns the values of row[start:end] as one array, copying whole tile runs.
+        """
+        end = self.cols if end is None else end
+        tile_row, offset = divmod(row, TILE_SIZE)
+        offset *= TILE_SIZE
+        if self.loader is not None:
+            self.loader.touch(tile_row)
+
+        values = array(self.TYPECODE)
+        col = start
+        while col < end:
+            tile_col, tile_start = divmod(col, TILE_SIZE)
+            count = min(TILE_SIZE - tile_start, end - col)
+            tile = self.tiles.get((tile_row, tile_col))
+            if tile is None:
+                values.extend(self._blank[:count])
+            else:
+                values.extend(tile[offset + tile_start : offset + tile_start + count])
+            col += count
+        return values
+
+    #---------------------------------------------------------------------------------------
+    def set_row_slice(self, row, values, start=0) -> None:
+        """
+        Writes values to row[start:start+len(values)] with one slice assignment per tile, blank
+        runs falling on tiles that are not allocated yet are skipped.
+        """
+        tile_row, offset = divmod(row, TILE_SIZE)
+        offset *= TILE_SIZE
+        if self.loader is not None:
+            self.loader.touch(tile_row)
+        self.version += 1
+
+        col = start
+        index = 0
+        while index < len(values):
+            tile_col, tile_start = divmod(col, TILE_SIZE)
+            count = min(TILE_SIZE - tile_start, len(values) - index)
+            run = values[index : index + count]
+            key = (tile_row, tile_col)
+            tile = self.tiles.get(key)
+            if tile is None:
+                if run == self._blank[:count]:
+                    col += count
+                    index += count
+                    continue
+                tile = self.tiles[key] = self._new_tile()
+            tile[offset + tile_start : offset + tile_start + count] = run
+            col += count
+            index += count
+
+
+#====================================================================================================================================
+class CharGrid(TiledGrid):
+    """
+    Glyph plane of the canvas, tiles hold unicode code points (4 bytes per cell).
+    """
+    TYPECODE = CHAR_TYPECODE
+    FILL     = " "
+
+    #---------------------------------------------------------------------------------------
+    def row_text(self, row, start=0, end=None) -> str:
+        return self.row_slice(row, start, end).tounicode()
+
+    #---------------------------------------------------------------------------------------
+    def set_row_text(self, row, text, start=0) -> None:
+        self.set_row_slice(row, array(CHAR_TYPECODE, text), start)
+
+
+#====================================================================================================================================
+class EdgeIndex():
+    """
+    Sorted positions of the box edges: for every row the columns holding a vertical edge
+    (CellType.BOX_V) and for every column the rows holding a horizontal edge (CellType.BOX_H).
+    Membership and nearest edge queries are a bisect, O(log n) in the edges of that line.
+    """
+    #---------------------------------------------------------------------------------------
+    def __init__(self) -> None:
+        self.v_cols : Dict[int, List[int]] = {}
+        self.h_rows : Dict[int, List[int]] = {}
+
+    #---------------------------------------------------------------------------------------
+    def _lines(self, code) -> Dict[int, List[int]]:
+        return self.v_cols if code == CellType.BOX_V else self.h_rows
+
+    #---------------------------------------------------------------------------------------
+    def add(self, col, row, code) -> None:
+        line, position = (row, col) if code == CellType.BOX_V else (col, row)
+        positions = self._lines(code).setdefault(line, [])
+        index = bisect_left(positions, position)
+        if index == len(positions) or positions[index] != position:
+            positions.insert(index, position)
+
+    #---------------------------------------------------------------------------------------
+    def discard(self, col, row, code) -> None:
+        line, position = (row, col) if code == CellType.BOX_V else (col, row)
+        lines = self._lines(code)
+        positions = lines.get(line)
+        if not positions:
+            return
+        index = bisect_left(positions, position)
+        if index < len(positions) and positions[index] == position:
+            del positions[index]
+            if not positions:
+                del lines[line]
+
+    #---------------------------------------------------------------------------------------
+    def update(self, col, row, old, new) -> None:
+        if old == new:
+            return
+        if old in (CellType.BOX_V, CellType.BOX_H):
+            self.discard(col, row, old)
+        if new in (CellType.BOX_V, CellType.BOX_H):
+            self.add(col, row, new)
+
+    #---------------------------------------------------------------------------------------
+    def clear(self) -> None:
+        self.v_cols.clear()
+        self.h_rows.clear()
+
+    #---------------------------------------------------------------------------------------
+    def copy(self) -> "EdgeIndex":
+        edges = EdgeIndex()
+        edges.v_cols = {line: positions[:] for line, positions in self.v_cols.items()}
+        edges.h_rows = {line: positions[:] for line, positions in self.h_rows.items()}
+        return edges
+
+    #---------------------------------------------------------------------------------------
+    @staticmethod
+    def _nearest(positions, position, max_distance, accept=None) -> Union[int, None]:
+        if not positions:
+            return None
+        start = bisect_left(positions, position - max_distance)
+        end   = bisect_right(positions, position + max_distance)
+        for candidate in sorted(positions[start:end], key=lambda candidate: (abs(candidate - position), candidate)):
+            if accept is None or accept(candidate):
+                return candidate
+        return None
+
+    #---------------------------------------------------------------------------------------
+    @staticmethod
+    def _enclosing(positions, position) -> Union[Tuple[int, int], None]:
+        """
+        The closest positions before and after position, when there are both.
+        """
+        if not positions:
+            return None
+        index = bisect_left(positions, position)
+        after = index + 1 if index < len(positions) and positions[index] == position else index
+        if index == 0 or after >= len(positions):
+            return None
+        return positions[index - 1], positions[after]
+
+    #---------------------------------------------------------------------------------------
+    def is_v_edge(self, col, row) -> bool:
+        return self._nearest(self.v_cols.get(row), col, 0) is not None
+
+    #---------------------------------------------------------------------------------------
+    def is_h_edge(self, col, row) -> bool:
+        return self._nearest(self.h_rows.get(col), row, 0) is not None
+
+    #---------------------------------------------------------------------------------------
+    def v_edge_side(self, col, row) -> Union[int, None]:
+        """
+        Side of the vertical edge at (col, row) its box lies on: 1 for a left border, -1 for
+        a right border. The top and bottom borders of the box run next to the edge on that
+        side only; None when they cannot be told apart.
+        """
+        sides = []
+        for side in (1, -1):
+            rows = self._enclosing(self.h_rows.get(col + side), row)
+            if rows is not None and self.is_v_edge(col, rows[0] + 1) and self.is_v_edge(col, rows[1] - 1):
+                sides.append(side)
+        return sides[0] if len(sides) == 1 else None
+
+    #---------------------------------------------------------------------------------------
+    def h_edge_side(self, col, row) -> Union[int, None]:
+        """
+        Side of the horizontal edge at (col, row) its box lies on: 1 for a top border, -1 for
+        a bottom border, None when it cannot be told.
+        """
+        sides = []
+        for side in (1, -1):
+            cols = self._enclosing(self.v_cols.get(row + side), col)
+            if cols is not None and self.is_h_edge(cols[0] + 1, row) and self.is_h_edge(cols[1] - 1, row):
+                sides.append(side)
+        return sides[0] if len(sides) == 1 else None
+
+    #---------------------------------------------------------------------------------------
+    def nearest_v_edge(self, col, row, max_distance, facing=None) -> Union[int, None]:
+        """
+        Column of the vertical edge closest to col on row, if it is within max_distance. With
+        facing set, only the edges whose box lies on that side (see v_edge_side) count.
+        """
+        accept = None if facing is None else lambda edge_col: self.v_edge_side(edge_col, row) == facing
+        return self._nearest(self.v_cols.get(row), col, max_distance, accept)
+
+    #---------------------------------------------------------------------------------------
+    def nearest_h_edge(self, col, row, max_distance, facing=None) -> Union[int, None]:
+        """
+        Row of the horizontal edge closest to row on col, if it is within max_distance. With
+        facing set, only the edges whose box lies on that side (see h_edge_side) count.
+        """
+        accept = None if facing is None else lambda edge_row: self.h_edge_side(col, edge_row) == facing
+        return self._nearest(self.h_rows.get(col), row, max_distance, accept)
+
+
+#====================================================================================================================================
+class MetadataGrid(TiledGrid):
+    """
+    Metadata plane of the canvas, tiles hold the CellType code of each cell in one byte.
+    Tags are only used at the file boundary (row_tags / set_row_tags). Every write goes through
+    set / set_row_slice, which keep the box edge index (edges) up to date.
+    """
+    _EDGE_CODES = (bytes([CellType.BOX_H]), bytes([CellType.BOX_V]))
+
+    #---------------------------------------------------------------------------------------
+    def __init__(self, rows, cols) -> None:
+        super().__init__(rows, cols)
+        self.edges = EdgeIndex()
+
+    #---------------------------------------------------------------------------------------
+    def set(self, col, row, value) -> None:
+        old = self.get(col, row)
+        if old != value:
+            super().set(col, row, value)
+            self.edges.update(col, row, old, value)
+
+    #---------------------------------------------------------------------------------------
+    def set_row_slice(self, row, values, start=0) -> None:
+        old = self.row_slice(row, start, start + len(values))
+        old_bytes = old.tobytes()
+        new_bytes = bytes(values)
+        super().set_row_slice(row, values, start)
+
+        for code in self._EDGE_CODES:
+            for data in (old_bytes, new_bytes):
+                position = data.find(code)
+                while position >= 0:
+                    self.edges.update(start + position, row, old[position], values[position])
+                    position = data.find(code, position + 1)
+
+    #---------------------------------------------------------------------------------------
+    def clear(self) -> None:
+        super().clear()
+        self.edges.clear()
+
+    #---------------------------------------------------------------------------------------
+    def copy(self) -> "MetadataGrid":
+        grid = super().copy()
+        grid.edges = self.edges.copy()
+        return grid
+    #---------------------------------------------------------------------------------------
+    def row_tags(self, row, start=0, end=None) -> List[Union[str, None]]:
+        return [CELL_TYPE_TAGS[code] for code in self.row_slice(row, start, end)]
+
+    #---------------------------------------------------------------------------------------
+    def set_row_tags(self, row, tags, start=0) -> None:
+        self.set_row_slice(row, array("B", [CELL_TYPE_CODES[tag] for tag in tags]), start)
+
+
+#====================================================================================================================================
+class RowLoader():
+    """
+    Fills a glyph / metadata grid pair from a row source (MappedDiagram) one tile row at a time,
+    the first time either grid reads or writes one of its rows, so only the visited part of a
+    diagram is ever decoded. Rows never loaded are still the source's, see DiagramWriter.
+    """
+    #---------------------------------------------------------------------------------------
+    def __init__(self, source, drawing: CharGrid, metadata: MetadataGrid) -> None:
+        self.source   = source
+        self.drawing  = drawing
+        self.metadata = metadata
+        self.loaded : Set[int] = set()
+        drawing.loader = metadata.loader = self
+
+    #---------------------------------------------------------------------------------------
+    def is_loaded(self, row) -> bool:
+        return row // TILE_SIZE in self.loaded
+
+    #---------------------------------------------------------------------------------------
+    def touch(self, tile_row) -> None:
+        if tile_row in self.loaded:
+            return
+        self.loaded.add(tile_row)
+        # a fill does not change what the grids hold, only where it is read from: keep the
+        # versions so the caches built on the grids (ArrowRouter) stay valid
+        versions = self.drawing.version, self.metadata.version
+        for row in range(tile_row * TILE_SIZE, min(self.source.rows, (tile_row + 1) * TILE_SIZE)):
+            text, codes = self.source.row(row)
+            self.drawing.set_row_text(row, text)
+            if codes is not None:
+                self.metadata.set_row_slice(row, codes)
+        self.drawing.version, self.metadata.version = versions
+
+    #---------------------------------------------------------------------------------------
+    def load(self, start_row, end_row) -> None:
+        """
+        Loads the rows start_row to end_row (included) that are not loaded yet.
+        """
+        for tile_row in range(max(0, start_row) // TILE_SIZE, min(end_row, self.source.rows - 1) // TILE_SIZE + 1):
+            self.touch(tile_row)
+
+    #---------------------------------------------------------------------------------------
+    def close(self) -> None:
+        self.drawing.loader = self.metadata.loader = None
+        self.source.close()
+
+
+#====================================================================================================================================
+class PreviewRow():
+    """
+    View over one row of a PreviewLayer, reads fall through to the base row unless the
+    preview wrote the cell.
+    """
+    __slots__ = ("layer", "row", "base_row", "cells")
+
+    _NO_CELLS : Dict[int, str] = {}
+
+    #---------------------------------------------------------------------------------------
+    def __init__(self, layer, row) -> None:
+        self.layer = layer
+        self.row = row
+        self.base_row = layer.base[row]
+        self.cells = layer._rows.get(row, self._NO_CELLS)
+
+    #---------------------------------------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self.base_row)
+
+    #---------------------------------------------------------------------------------------
+    def __getitem__(self, col):
+        return self.cells.get(col, self.base_row[col])
+
+    #---------------------------------------------------------------------------------------
+    def __setitem__(self, col, char) -> None:
+        if self.cells is self._NO_CELLS:
+            self.cells = self.layer._rows.setdefault(self.row, {})
+        self.cells[col] = char
+
+    #---------------------------------------------------------------------------------------
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.tounicode())
+
+    #---------------------------------------------------------------------------------------
+    def tounicode(self, start=0, end=None) -> str:
+        text = self.base_row.tounicode(start, end)
+        if not self.cells:
+            return text
+        row = list(text)
+        for col, char in self.cells.items():
+            if start <= col < start + len(row):
+                row[col - start] = char
+        return "".join(row)
+
+
+#====================================================================================================================================
+class PreviewLayer():
+    """
+    Sparse copy-on-write layer over a buffer, used to preview the shape being dragged.
+    Only the cells written while previewing are stored, the rest of the reads go to the base
+    buffer, so both discarding the preview and repainting it cost O(touched cells).
+    """
+    #---------------------------------------------------------------------------------------
+    def __init__(self, base) -> None:
+        self.base = base
+        self._rows : Dict[int, Dict[int, str]] = {}
+
+    #---------------------------------------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self.base)
+
+    #---------------------------------------------------------------------------------------
+    def __getitem__(self, row) -> PreviewRow:
+        return PreviewRow(self, row)
+
+    #---------------------------------------------------------------------------------------
+    def __iter__(self) -> Iterator[PreviewRow]:
+        for row in range(len(self.base)):
+            yield self[row]
+
+    #---------------------------------------------------------------------------------------
+    def set(self, col, row, char) -> None:
+        self._rows.setdefault(row, {})[col] = char
+
+    #---------------------------------------------------------------------------------------
+    def set_row_text(self, row, text, start=0) -> None:
+        self._rows.setdefault(row, {}).update(zip(range(start, start + len(text)), text))
+
+    #---------------------------------------------------------------------------------------
+    def touched_rows(self) -> Set[int]:
+        return set(self._rows)
+
+    #---------------------------------------------------------------------------------------
+    def discard(self) -> Set[int]:
+        """
+        Drops every previewed cell and returns the rows that have to be repainted.
+        """
+        rows = self.touched_rows()
+        self._rows.clear()
+        return rows
+
+
+#====================================================================================================================================
+class Clipboard():
+    """
+    Rectangular copy of canvas cells: one glyph array and one metadata array per row, plus a
+    transparency mask kept as the runs of non blank cells of every row. Pasting writes each
+    run with one slice assignment per plane, blank cells leave the destination untouched.
+    """
+    _OPAQUE = re.compile(r"[^ ]+")
+
+    #---------------------------------------------------------------------------------------
+    def __init__(self, chars: List[array], types: List[array]) -> None:
+        self.chars  = chars
+        self.types  = types
+        self.height = len(chars)
+        self.width  = max((len(row) for row in chars), default=0)
+        self.runs   : List[List[Tuple[int, int]]] = [
+            [match.span() for match in self._OPAQUE.finditer(row.tounicode())]
+            for row in chars
+        ]
+
+    #---------------------------------------------------------------------------------------
+    @classmethod
+    def from_grids(cls, buffer, metadata, col, row, end_col, end_row) -> "Clipboard":
+        """
+        Copies the cells of [col, end_col] x [row, end_row] from a glyph buffer (grid or preview
+        layer) and its metadata grid.
+        """
+        chars = []
+        types = []
+        for r in range(row, end_row + 1):
+            chars.append(array(CHAR_TYPECODE, buffer[r].tounicode(col, end_col + 1)) if r < len(buffer) else array(CHAR_TYPECODE))
+            types.append(metadata.row_slice(r, col, end_col + 1))
+        return cls(chars, types)
+
+    #---------------------------------------------------------------------------------------
+    def __len__(self) -> int:
+        return self.height
+
+    #---------------------------------------------------------------------------------------
+    def opaque_runs(self) -> Iterator[Tuple[int, int, int]]:
+        """
+        Yields (row, start, end) for every run of non blank cells.
+        """
+        for row, runs in enumerate(self.runs):
+            for start, end in runs:
+                yield row, start, end
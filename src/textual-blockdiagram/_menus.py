@@ -35,7 +35,7 @@ class ComplexMenu(Widget):
         height: auto;
         padding-right: 1;
         layout: grid;
-        grid-size: 2 1;
+        grid-size: 2;
         grid-gutter: 1;
         grid-columns: 3 12;
     }
@@ -101,11 +101,16 @@ class ComplexMenu(Widget):
         self._option_lists = option_lists
 
         self.selected_options = {}
+        # command button the options apply to, the last one pressed
+        self.active_button = buttons[0]["id"] if buttons else None
 
     #---------------------------------------------------------------------------------------
     def compose(self) -> ComposeResult:
         with Container():
-            yield Button(id="hide-btn", label =">")
+            hide_button = Button(id="hide-btn", label =">")
+            # the command buttons are stacked in the second column
+            hide_button.styles.row_span = max(1, len(self._buttons))
+            yield hide_button
             for button in self._buttons:
                 yield Button(id=button["id"], label =button["label"])
 
@@ -132,6 +137,7 @@ class ComplexMenu(Widget):
 
         button_id = event.button.id
         if button_id != "hide-btn":
+            self.active_button = button_id
             # Another button was pressed, we select the first option of the corresponding option list
             for option_list_id in self._option_lists:
                 option_list = self.query_one(f"#{option_list_id['id']}", OptionList)
@@ -0,0 +1,771 @@
+from array import array
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, List, Set, Tuple, Union
+import os
+
+from _utils import *
+from _shapes import Arrow, Box, FreeLine, Line, RoutedArrow, Shape, Trapezoid
+from _grid import CHAR_TYPECODE, CharGrid, Clipboard, MetadataGrid, PreviewLayer, RowLoader
+from _scene import SceneGraph
+from _router import ArrowRouter
+from _storage import DiagramReader, DiagramWriter, MappedDiagram
+
+
+#====================================================================================================================================
+class HistoryEntry():
+    """
+    One undoable operation: the cells it touched with their glyph and metadata before and after
+    the change, plus the scene graph changes to replay. While it is the latest entry the cells
+    are kept in a dict so following keystrokes can be merged in, older entries are frozen into
+    flat arrays (18 bytes per cell). cursor is the (row, col) cell the next keystroke of a
+    coalesced run is expected at.
+    """
+    __slots__ = ("coalesce", "cursor", "cells", "rows", "cols", "old_chars", "old_types", "new_chars", "new_types", "scene_ops", "nbytes")
+
+    CELL_BYTES      = 18
+    DICT_CELL_BYTES = 160
+
+    #---------------------------------------------------------------------------------------
+    def __init__(self) -> None:
+        self.coalesce  = None
+        self.cursor    : Union[Tuple[int, int], None] = None
+        self.cells     : Union[Dict[Tuple[int, int], list], None] = {}
+        self.scene_ops : List[Tuple[Callable, Callable]] = []
+        self.nbytes    = 0
+
+    #---------------------------------------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self.cells) if self.cells is not None else len(self.rows)
+
+    #---------------------------------------------------------------------------------------
+    def close(self, drawing, metadata) -> None:
+        # the new glyph and metadata are read once the operation is done
+        for (row, col), cell in self.cells.items():
+            cell[2] = drawing.get(col, row)
+            cell[3] = metadata.get(col, row)
+        self.nbytes = self.DICT_CELL_BYTES * len(self.cells)
+
+    #---------------------------------------------------------------------------------------
+    def follows(self, other: "HistoryEntry") -> bool:
+        """
+        True when the first cell written by this entry is at, or next to, the cell where
+        other expected the next keystroke: the user kept typing instead of moving elsewhere.
+        """
+        if other.cursor is None or not self.cells:
+            return False
+        row, col = next(iter(self.cells))
+        return abs(row - other.cursor[0]) <= 1 and abs(col - other.cursor[1]) <= 1
+
+    #---------------------------------------------------------------------------------------
+    def merge(self, other: "HistoryEntry") -> None:
+        for key, cell in other.cells.items():
+            mine = self.cells.get(key)
+            if mine is None:
+                self.cells[key] = cell
+            else:
+                mine[2], mine[3] = cell[2], cell[3]
+        self.scene_ops.extend(other.scene_ops)
+        self.cursor = other.cursor
+        self.nbytes = self.DICT_CELL_BYTES * len(self.cells)
+
+    #---------------------------------------------------------------------------------------
+    def freeze(self) -> None:
+        if self.cells is None:
+            return
+        keys = sorted(self.cells)
+        cells = [self.cells[key] for key in keys]
+        self.rows      = array("i", [row for row, _ in keys])
+        self.cols      = array("i", [col for _, col in keys])
+        self.old_chars = array(CHAR_TYPECODE, [cell[0] for cell in cells])
+        self.old_types = array("B", [cell[1] for cell in cells])
+        self.new_chars = array(CHAR_TYPECODE, [cell[2] for cell in cells])
+        self.new_types = array("B", [cell[3] for cell in cells])
+        self.cells  = None
+        self.nbytes = self.CELL_BYTES * len(keys)
+
+    #---------------------------------------------------------------------------------------
+    def apply(self, drawing, metadata, undo=True) -> Set[int]:
+        """
+        Writes back the old (undo) or new (redo) cells and returns the rows that changed.
+        """
+        self.freeze()
+        chars = self.old_chars if undo else self.new_chars
+        types = self.old_types if undo else self.new_types
+        for index in range(len(self.rows)):
+            drawing.set(self.cols[index], self.rows[index], chars[index])
+            metadata.set(self.cols[index], self.rows[index], types[index])
+
+        for undo_op, redo_op in (reversed(self.scene_ops) if undo else self.scene_ops):
+            (undo_op if undo else redo_op)()
+
+        return set(self.rows)
+
+
+#====================================================================================================================================
+class CommandHistory():
+    """
+    Undo/redo journal. The canvas records the cells a committed operation is about to overwrite,
+    commit() closes the operation into one HistoryEntry, so undo and redo cost O(cells changed).
+    Entries committed with the same coalesce key one after the other (typed text) are merged
+    while each starts where the previous one left the cursor, and the oldest entries are
+    evicted once the journal grows over max_bytes.
+    """
+    # size cap of the journal, the default of every model's history
+    MAX_BYTES = 32 * 1024 * 1024
+
+    # a disabled history records nothing, for scripted diagrams that are never undone
+    enabled = True
+
+    #---------------------------------------------------------------------------------------
+    def __init__(self, drawing_buffer, metadata_buffer, max_bytes=None) -> None:
+        self.drawing_buffer  = drawing_buffer
+        self.metadata_buffer = metadata_buffer
+        self.max_bytes = self.MAX_BYTES if max_bytes is None else max_bytes
+
+        self.undo_stack : Deque[HistoryEntry] = deque()
+        self.redo_stack : List[HistoryEntry] = []
+        self.nbytes   = 0
+        self._current : Union[HistoryEntry, None] = None
+        self._paused  = 0
+
+    #---------------------------------------------------------------------------------------
+    @contextmanager
+    def paused(self):
+        """
+        Stops recording, used for operations that are not undoable (loading a file).
+        """
+        self._paused += 1
+        try:
+            yield
+        finally:
+            self._paused -= 1
+
+    #---------------------------------------------------------------------------------------
+    def _entry(self) -> Union[HistoryEntry, None]:
+        if self._paused or not self.enabled:
+            return None
+        if self._current is None:
+            self._current = HistoryEntry()
+        return self._current
+
+    #---------------------------------------------------------------------------------------
+    def record_cell(self, col, row) -> None:
+        entry = self._entry()
+        if entry is not None and (row, col) not in entry.cells:
+            entry.cells[(row, col)] = [self.drawing_buffer.get(col, row), self.metadata_buffer.get(col, row), None, None]
+
+    #---------------------------------------------------------------------------------------
+    def record_hspan(self, col, row, length) -> None:
+        entry = self._entry()
+        if entry is None or length <= 0:
+            return
+        chars = self.drawing_buffer.row_slice(row, col, col + length)
+        types = self.metadata_buffer.row_slice(row, col, col + length)
+        cells = entry.cells
+        for offset in range(length):
+            if (row, col + offset) not in cells:
+                cells[(row, col + offset)] = [chars[offset], types[offset], None, None]
+
+    #---------------------------------------------------------------------------------------
+    def record_vspan(self, col, row, length) -> None:
+        for r in range(row, row + length):
+            self.record_cell(col, r)
+
+    #---------------------------------------------------------------------------------------
+    def record_scene(self, undo_op: Callable, redo_op: Callable) -> None:
+        entry = self._entry()
+        if entry is not None:
+            entry.scene_ops.append((undo_op, redo_op))
+
+    #---------------------------------------------------------------------------------------
+    def commit(self, coalesce=None, cursor=None) -> None:
+        """
+        Closes the operation recorded so far. It is merged into the previous entry when both
+        share the same coalesce key and it starts next to the (row, col) cursor the previous
+        one was committed with, its last written cell when no cursor was given.
+        """
+        entry, self._current = self._current, None
+        if entry is None or (not entry.cells and not entry.scene_ops):
+            return
+        entry.close(self.drawing_buffer, self.metadata_buffer)
+        entry.coalesce = coalesce
+        if coalesce is not None:
+            entry.cursor = tuple(cursor) if cursor is not None else next(reversed(entry.cells), None)
+
+        self.nbytes -= sum(redo.nbytes for redo in self.redo_stack)
+        self.redo_stack.clear()
+
+        top = self.undo_stack[-1] if self.undo_stack else None
+        if coalesce is not None and top is not None and top.coalesce == coalesce and top.cells is not None and entry.follows(top):
+            self.nbytes -= top.nbytes
+            top.merge(entry)
+            self.nbytes += top.nbytes
+        else:
+            if top is not None:
+                self._freeze(top)
+            self.undo_stack.append(entry)
+            self.nbytes += entry.nbytes
+
+        self._evict()
+
+    #---------------------------------------------------------------------------------------
+    def seal(self) -> None:
+        """
+        Keeps the latest entry from absorbing the next ones, e.g. after a click elsewhere.
+        """
+        if self.undo_stack:
+            self.undo_stack[-1].coalesce = None
+
+    #---------------------------------------------------------------------------------------
+    def _freeze(self, entry: HistoryEntry) -> None:
+        self.nbytes -= entry.nbytes
+        entry.freeze()
+        self.nbytes += entry.nbytes
+
+    #---------------------------------------------------------------------------------------
+    def _evict(self) -> None:
+        while self.nbytes > self.max_bytes and len(self.undo_stack) > 1:
+            self.nbytes -= self.undo_stack.popleft().nbytes
+
+    #---------------------------------------------------------------------------------------
+    def undo(self) -> Union[Set[int], None]:
+        """
+        Reverts the latest entry and returns the rows to repaint, None when there is nothing to undo.
+        """
+        self.commit()
+        if not self.undo_stack:
+            return None
+        entry = self.undo_stack.pop()
+        self._freeze(entry)
+        self.redo_stack.append(entry)
+        return entry.apply(self.drawing_buffer, self.metadata_buffer, undo=True)
+
+    #---------------------------------------------------------------------------------------
+    def redo(self) -> Union[Set[int], None]:
+        self.commit()
+        if not self.redo_stack:
+            return None
+        entry = self.redo_stack.pop()
+        self.undo_stack.append(entry)
+        return entry.apply(self.drawing_buffer, self.metadata_buffer, undo=False)
+
+    #---------------------------------------------------------------------------------------
+    def clear(self) -> None:
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self._current = None
+        self.nbytes = 0
+
+
+#====================================================================================================================================
+class DiagramModel():
+    """
+    A diagram without any user interface: the glyph and metadata planes, the preview layer
+    dynamic shapes are drawn to, the committed shapes, the undo history and the file formats.
+    AsciiCanvas is a view over one model, scripts can use a model on its own.
+
+    Views follow the changes through two callbacks: on_rows_changed(start_row, end_row) for
+    the rows a write touched, and on_reset() when the whole diagram was replaced.
+    """
+    INIT_ROWS = 50
+    INIT_COLS = 120
+
+    CROSSING_CHAR = ")"
+
+    # .json files start with a "//" copy of the drawing, readable without the app
+    SAVE_COMMENT_PREVIEW = True
+    # run length encode the metadata rows of .json files (format version 2)
+    SAVE_METADATA_RLE = False
+    # compression of the binary .abd files: "none", "zlib" or "lzma"
+    BINARY_COMPRESSION = "zlib"
+    # larger files are memory mapped and decoded as they are scrolled to, instead of read whole
+    LAZY_LOAD_MIN_BYTES = 8 * 1024 * 1024
+
+    # shape drawn by each drawing command
+    SHAPES = {
+        "box"           : Box,
+        "arrow"         : Arrow,
+        "arrow-route"   : RoutedArrow,
+        "trapezoid-ver" : Trapezoid,
+        "trapezoid-hor" : Trapezoid,
+        "line"          : Line,
+        "free-line"     : FreeLine,
+    }
+
+    #---------------------------------------------------------------------------------------
+    def __init__(self, rows=None, cols=None, history=True) -> None:
+        rows = self.INIT_ROWS if rows is None else rows
+        cols = self.INIT_COLS if cols is None else cols
+
+        self.drawing_buffer  = CharGrid(rows, cols)
+        self.metadata_buffer = MetadataGrid(rows, cols)
+        self.preview         = PreviewLayer(self.drawing_buffer)
+        self.shapes          = SceneGraph()
+        self.command_history = CommandHistory(self.drawing_buffer, self.metadata_buffer)
+        self.command_history.enabled = history
+        self.router          = ArrowRouter(self.drawing_buffer, self.metadata_buffer)
+        self.row_loader : Union[RowLoader, None] = None
+
+        # largest cell reached, drawn or not, and bounds of the committed drawing
+        self.col_max = cols
+        self.row_max = rows
+        self.drawing_col_max = 0
+        self.drawing_row_max = 0
+
+        self.on_rows_changed : Union[Callable[[int, int], None], None] = None
+        self.on_reset        : Union[Callable[[], None], None] = None
+
+        self._active_buffer = self.drawing_buffer
+
+    #---------------------------------------------------------------------------------------
+    def _changed(self, start_row, end_row) -> None:
+        if self.on_rows_changed is not None:
+            self.on_rows_changed(start_row, end_row)
+
+    #---------------------------------------------------------------------------------------
+    def _reset(self) -> None:
+        if self.on_reset is not None:
+            self.on_reset()
+
+    #---------------------------------------------------------------------------------------
+    @property
+    def active_buffer(self):
+        """
+        The plane writes go to: the drawing, or the preview while a shape is being dragged.
+        """
+        return self._active_buffer
+
+    @active_buffer.setter
+    def active_buffer(self, buffer):
+        if buffer is self._active_buffer:
+            return
+        if {id(buffer), id(self._active_buffer)} == {id(self.drawing_buffer), id(self.preview)}:
+            # the preview only differs from the drawing on the cells it touched
+            for row in self.preview.touched_rows():
+                self._changed(row, row)
+            self._active_buffer = buffer
+        else:
+            self._active_buffer = buffer
+            self._reset()
+
+    #---------------------------------------------------------------------------------------
+    def discard_preview(self) -> None:
+        for row in self.preview.discard():
+            self._changed(row, row)
+
+    #=======================================================================================
+    # Shapes
+    #=======================================================================================
+    def draw(self, cmd, anchor: Cursor, end: Cursor, char_set, dynamic=False, approach_mode=None) -> Shape:
+        """
+        Draws the shape of a drawing command (a SHAPES key) dragged from anchor to end, the
+        same way the canvas does. A committed (not dynamic) shape joins the scene graph.
+        """
+        shape = self.SHAPES[cmd](self, char_set, dynamic)
+        if cmd == "arrow":
+            shape.draw(end, anchor, approach_mode)
+        elif cmd == "arrow-route":
+            shape.draw(end, anchor, approach_mode, self.router)
+        elif cmd in ("trapezoid-ver", "trapezoid-hor"):
+            shape.draw(end, anchor, cmd.split("-")[1])
+        else:
+            shape.draw(end, anchor)
+
+        if not dynamic:
+            self.add_shape(shape)
+        return shape
+
+    #---------------------------------------------------------------------------------------
+    def write_text(self, col, row, text, dynamic=False) -> None:
+        self.blit_rect(col, row, [text], [array("B", [CellType.TEXT]) * len(text)], dynamic)
+
+    #---------------------------------------------------------------------------------------
+    def add_shape(self, shape) -> None:
+        self.shapes.add(shape)
+        self.command_history.record_scene(lambda: self.shapes.remove(shape), lambda: self.shapes.add(shape))
+
+    #---------------------------------------------------------------------------------------
+    def remove_shape(self, shape) -> None:
+        self.shapes.remove(shape)
+        self.command_history.record_scene(lambda: self.shapes.add(shape), lambda: self.shapes.remove(shape))
+
+    #---------------------------------------------------------------------------------------
+    def add_shape_copies(self, shapes, delta_col, delta_row) -> None:
+        """
+        Adds copies of shapes moved by (delta_col, delta_row), the shapes of pasted cells.
+        """
+        for shape in shapes:
+            clone = shape.copy()
+            clone.translate(delta_col, delta_row)
+            self.add_shape(clone)
+
+    #---------------------------------------------------------------------------------------
+    def translate_shape(self, shape, delta_col, delta_row) -> None:
+        self.shapes.translate(shape, delta_col, delta_row)
+        self.command_history.record_scene(
+            lambda: self.shapes.translate(shape, -delta_col, -delta_row),
+            lambda: self.shapes.translate(shape, delta_col, delta_row)
+        )
+
+    #---------------------------------------------------------------------------------------
+    def shape_at(self, col, row):
+        return self.shapes.shape_at(col, row)
+
+    #---------------------------------------------------------------------------------------
+    def shapes_in(self, first: Cursor, second: Cursor, contained=False):
+        return self.shapes.query(BBox(first.col, first.row, second.col, second.row), contained)
+
+    #=======================================================================================
+    # Undo Functions
+    #=======================================================================================
+    def commit(self, coalesce=None, cursor=None) -> None:
+        self.command_history.commit(coalesce, cursor)
+
+    #---------------------------------------------------------------------------------------
+    def undo(self) -> Union[Set[int], None]:
+        """
+        Reverts the latest operation and returns the rows it changed, None when there is nothing to undo.
+        """
+        return self._history_rows(self.command_history.undo())
+
+    #---------------------------------------------------------------------------------------
+    def redo(self) -> Union[Set[int], None]:
+        return self._history_rows(self.command_history.redo())
+
+    #---------------------------------------------------------------------------------------
+    def _history_rows(self, rows):
+        if rows is None:
+            return None
+        self.active_buffer = self.drawing_buffer
+        self.discard_preview()
+        for row in rows:
+            self._changed(row, row)
+        return rows
+
+    #=======================================================================================
+    # Save and Open Functions
+    #=======================================================================================
+    def save_diagram(self, file_name, comment_preview=None):
+        """
+        Streams the committed drawing, within its bounds, to file_name (.json, binary .abd or plain text).
+        """
+        if comment_preview is None:
+            comment_preview = self.SAVE_COMMENT_PREVIEW
+
+        rows = min(self.drawing_row_max+1, len(self.drawing_buffer))
+        cols = self.drawing_col_max+1
+        if self.row_loader is not None:
+            cols = max(cols, self.row_loader.source.cols)
+        writer = DiagramWriter(self.drawing_buffer, self.metadata_buffer, rows, cols, self.SAVE_METADATA_RLE, self.row_loader)
+        writer.write(file_name, comment_preview, self.BINARY_COMPRESSION)
+
+    #---------------------------------------------------------------------------------------
+    def load_diagram(self, file_name):
+        """
+        Replaces the drawing with the content of file_name (.json, binary .abd or plain text).
+        Files of LAZY_LOAD_MIN_BYTES and more are mapped rather than read, see map_diagram.
+        """
+        if os.path.getsize(file_name) >= self.LAZY_LOAD_MIN_BYTES and self.map_diagram(file_name):
+            return
+
+        rows = DiagramReader(file_name).read()
+        self.clear()
+        try:
+            self.load_rows(rows)
+        except BaseException:
+            # a row past the checked start of the file was damaged, do not keep half a diagram
+            self.clear()
+            raise
+
+    #---------------------------------------------------------------------------------------
+    def load_rows(self, rows):
+        """
+        Bulk loads (text, codes) rows, every row is one slice assignment per plane. The grids
+        are tiled and only grow their logical extent, so they are expanded as the rows arrive
+        and the size of the diagram need not be known up front.
+        """
+        row_count = col_count = 0
+        with self.command_history.paused():
+            for row, (text, codes) in enumerate(rows):
+                if text:
+                    self.expand_canvas(row, len(text) - 1)
+                    col_count = max(col_count, len(text))
+                self.drawing_buffer.set_row_text(row, text)
+                if codes is not None:
+                    self.metadata_buffer.set_row_slice(row, codes)
+                row_count = row + 1
+            if row_count and col_count:
+                self.expand_canvas(row_count - 1, col_count - 1)
+                self._update_drawing_extent(col_count - 1, row_count - 1)
+
+        self._reset()
+
+    #---------------------------------------------------------------------------------------
+    def map_diagram(self, file_name) -> bool:
+        """
+        Opens file_name without reading it: the file is memory mapped and indexed, and its rows
+        are only decoded when a view or an edit reaches them. Returns False, leaving the model
+        untouched, for files that cannot be indexed (compressed .abd for instance).
+        """
+        diagram = MappedDiagram.open(file_name)
+        if diagram is None:
+            return False
+
+        self.clear()
+        self.row_loader = RowLoader(diagram, self.drawing_buffer, self.metadata_buffer)
+        if diagram.rows and diagram.max_width:
+            # the exact width takes decoding every row, it is only needed to save (see save_diagram)
+            self.expand_canvas(diagram.rows - 1, diagram.max_width - 1)
+            self._update_drawing_extent(0, diagram.rows - 1)
+
+        self._reset()
+        return True
+
+    #---------------------------------------------------------------------------------------
+    def clear(self):
+        """
+        Drops the drawing, its shapes and the undo history.
+        """
+        self.active_buffer = self.drawing_buffer
+        self.discard_preview()
+        if self.row_loader is not None:
+            self.row_loader.close()
+            self.row_loader = None
+        self.drawing_buffer.clear()
+        self.metadata_buffer.clear()
+        self.shapes.clear()
+        self.command_history.clear()
+        self.drawing_col_max = 0
+        self.drawing_row_max = 0
+        self._reset()
+
+    #=======================================================================================
+    # Buffer manipulation functions
+    #=======================================================================================
+    def expand_canvas(self, row, col):
+        # Expand the number of rows and columns, leaving a margin of one
+        if row >= len(self.drawing_buffer) or col >= self.drawing_buffer.cols:
+            rows = max(len(self.drawing_buffer), row + 2)
+            cols = max(self.drawing_buffer.cols, col + 2)
+            self.drawing_buffer.expand(rows, cols)
+            self.metadata_buffer.expand(rows, cols)
+
+        if self.col_max < col:
+            self.col_max = col
+        if self.row_max < row:
+            self.row_max = row
+
+    #---------------------------------------------------------------------------------------
+    def set_char(self, col, row, char, char_type=CellType.NONE, dynamic=True):
+        self.expand_canvas(row, col)
+
+        if 0 <= row < len(self.active_buffer) and 0 <= col < len(self.active_buffer[row]):
+            if not dynamic:
+                self.command_history.record_cell(col, row)
+            self.active_buffer[row][col] = char
+            self._changed(row, row)
+
+            if not dynamic:
+                self.metadata_buffer.set(col, row, char_type)
+                self._update_drawing_extent(col, row)
+
+    #---------------------------------------------------------------------------------------
+    def _update_drawing_extent(self, last_col, last_row):
+        if self.drawing_col_max < last_col:
+            self.drawing_col_max = last_col
+        if self.drawing_row_max < last_row:
+            self.drawing_row_max = last_row
+
+    #---------------------------------------------------------------------------------------
+    def fill_hspan(self, col, row, length, char, char_type=CellType.NONE, dynamic=True, cross_type=None):
+        """
+        Writes length copies of char from (col, row) to the right with a single expansion and one
+        slice assignment per plane. Cells whose metadata is cross_type become a crossing (")").
+        """
+        if col < 0:
+            length += col
+            col = 0
+        if length <= 0 or row < 0:
+            return
+        self.expand_canvas(row, col + length - 1)
+
+        text = char * length
+        if cross_type is not None:
+            metadata = self.metadata_buffer.row_slice(row, col, col + length).tobytes()
+            position = metadata.find(cross_type)
+            if position >= 0:
+                cells = list(text)
+                while position >= 0:
+                    cells[position] = self.CROSSING_CHAR
+                    position = metadata.find(cross_type, position + 1)
+                text = "".join(cells)
+
+        if not dynamic:
+            self.command_history.record_hspan(col, row, length)
+        self.active_buffer.set_row_text(row, text, col)
+        self._changed(row, row)
+
+        if not dynamic:
+            self.metadata_buffer.set_row_slice(row, array("B", [char_type]) * length, col)
+            self._update_drawing_extent(col + length - 1, row)
+
+    #---------------------------------------------------------------------------------------
+    def fill_vspan(self, col, row, length, char, char_type=CellType.NONE, dynamic=True, cross_type=None):
+        """
+        Writes length copies of char from (col, row) downwards with a single expansion.
+        Cells whose metadata is cross_type become a crossing (")").
+        """
+        if row < 0:
+            length += row
+            row = 0
+        if length <= 0 or col < 0:
+            return
+        self.expand_canvas(row + length - 1, col)
+
+        buffer   = self.active_buffer
+        metadata = self.metadata_buffer
+        if not dynamic:
+            self.command_history.record_vspan(col, row, length)
+        for r in range(row, row + length):
+            if cross_type is not None and metadata.get(col, r) == cross_type:
+                buffer.set(col, r, self.CROSSING_CHAR)
+            else:
+                buffer.set(col, r, char)
+            if not dynamic:
+                metadata.set(col, r, char_type)
+
+        self._changed(row, row + length - 1)
+        if not dynamic:
+            self._update_drawing_extent(col, row + length - 1)
+
+    #---------------------------------------------------------------------------------------
+    def blit_rect(self, col, row, lines, char_types=None, dynamic=True):
+        """
+        Writes a block of text lines with its top left corner at (col, row), one slice
+        assignment per line. char_types is an optional list of metadata rows (arrays of codes)
+        matching the lines.
+        """
+        if not lines:
+            return
+        width = max(len(line) for line in lines)
+        self.expand_canvas(row + len(lines) - 1, col + width - 1)
+
+        for r, line in enumerate(lines, start=row):
+            if not dynamic:
+                self.command_history.record_hspan(col, r, len(line))
+            self.active_buffer.set_row_text(r, line, col)
+            if not dynamic and char_types is not None:
+                self.metadata_buffer.set_row_slice(r, char_types[r - row], col)
+
+        self._changed(row, row + len(lines) - 1)
+        if not dynamic:
+            self._update_drawing_extent(col + width - 1, row + len(lines) - 1)
+
+    #---------------------------------------------------------------------------------------
+    def blit_clipboard(self, clipboard: Clipboard, col, row, dynamic=True):
+        """
+        Pastes the opaque cells of a clipboard with its top left corner at (col, row): a single
+        expansion, then one slice assignment per run and plane.
+        """
+        if not clipboard or col + clipboard.width <= 0 or row + clipboard.height <= 0:
+            return
+        self.expand_canvas(row + clipboard.height - 1, col + clipboard.width - 1)
+
+        for r, start, end in clipboard.opaque_runs():
+            # cells falling left of or above the canvas are dropped
+            start = max(start, -col)
+            if row + r < 0 or start >= end:
+                continue
+            if not dynamic:
+                self.command_history.record_hspan(col + start, row + r, end - start)
+            self.active_buffer.set_row_text(row + r, clipboard.chars[r][start:end].tounicode(), col + start)
+            if not dynamic:
+                self.metadata_buffer.set_row_slice(row + r, clipboard.types[r][start:end], col + start)
+
+        self._changed(max(row, 0), row + clipboard.height - 1)
+        if not dynamic:
+            self._update_drawing_extent(col + clipboard.width - 1, row + clipboard.height - 1)
+
+    #---------------------------------------------------------------------------------------
+    def clear_rect(self, col, row, end_col, end_row):
+        """
+        Blanks the committed cells of [col, end_col] x [row, end_row], one slice per row and plane.
+        """
+        col = max(col, 0)
+        row = max(row, 0)
+        end_col = min(end_col, self.drawing_buffer.cols - 1)
+        end_row = min(end_row, len(self.drawing_buffer) - 1)
+        width = end_col - col + 1
+        if width <= 0 or end_row < row:
+            return
+
+        blank = " " * width
+        no_type = array("B", [CellType.NONE]) * width
+        for r in range(row, end_row + 1):
+            self.command_history.record_hspan(col, r, width)
+            self.drawing_buffer.set_row_text(r, blank, col)
+            self.metadata_buffer.set_row_slice(r, no_type, col)
+
+        self._changed(row, end_row)
+
+    #---------------------------------------------------------------------------------------
+    def erase_rect(self, col, row, end_col, end_row):
+        """
+        Blanks the committed cells of [col, end_col] x [row, end_row] and drops the shapes
+        with a cell in there from the scene graph, the ones it only overlaps stay.
+        """
+        self.clear_rect(col, row, end_col, end_row)
+        rect = BBox(col, row, end_col, end_row)
+        for shape in self.shapes.query(rect):
+            if shape.covers(rect):
+                self.remove_shape(shape)
+
+    #---------------------------------------------------------------------------------------
+    def plot_cells(self, cells, dynamic=True):
+        """
+        Writes scattered cells given as (col, row, char, char_type) with a single expansion,
+        used by the line rasterizer.
+        """
+        cells = [cell for cell in cells if cell[0] >= 0 and cell[1] >= 0]
+        if not cells:
+            return
+        last_col = max(cell[0] for cell in cells)
+        last_row = max(cell[1] for cell in cells)
+        self.expand_canvas(last_row, last_col)
+
+        for col, row, char, char_type in cells:
+            if not dynamic:
+                self.command_history.record_cell(col, row)
+            self.active_buffer.set(col, row, char)
+            if not dynamic:
+                self.metadata_buffer.set(col, row, char_type)
+        self._changed(min(cell[1] for cell in cells), last_row)
+
+        if not dynamic:
+            self._update_drawing_extent(last_col, last_row)
+
+    #---------------------------------------------------------------------------------------
+    def stroke_rect(self, col, row, width, height, char_set, char_type_h=CellType.BOX_H, char_type_v=CellType.BOX_V, dynamic=True):
+        """
+        Draws the outline of a width x height rectangle: two horizontal spans, two vertical spans
+        and the four corners.
+        """
+        lastrow = row + height - 1
+        lastcol = col + width - 1
+
+        self.fill_hspan(col + 1  , row       , width - 2 , char_set["h"], char_type_h, dynamic, cross_type=CellType.ARROW_V)
+        self.fill_hspan(col + 1  , lastrow   , width - 2 , char_set["h"], char_type_h, dynamic, cross_type=CellType.ARROW_V)
+        self.fill_vspan(col      , row + 1   , height - 2, char_set["v"], char_type_v, dynamic, cross_type=CellType.ARROW_H)
+        self.fill_vspan(lastcol  , row + 1   , height - 2, char_set["v"], char_type_v, dynamic, cross_type=CellType.ARROW_H)
+        self.set_char(col        , row       , char_set["tl"], CellType.NONE, dynamic)
+        self.set_char(lastcol    , row       , char_set["tr"], CellType.NONE, dynamic)
+        self.set_char(col        , lastrow   , char_set["bl"], CellType.NONE, dynamic)
+        self.set_char(lastcol    , lastrow   , char_set["br"], CellType.NONE, dynamic)
+
+    #---------------------------------------------------------------------------------------
+    def get_metadata(self, col, row):
+        if row < len(self.metadata_buffer) and col < self.metadata_buffer.cols:
+            return self.metadata_buffer.get(col, row)
+        else:
+            return CellType.NONE
@@ -0,0 +1,151 @@
+from rich.console import Console, ConsoleOptions, RenderResult
+from rich.measure import Measurement
+from rich.segment import Segment
+from rich.style import Style
+from rich.syntax import Syntax
+from pygments.token import Token
+
+from textual.geometry import Region
+from textual.strip import Strip
+
+from typing import Dict, List, Set, Tuple, Union
+
+
+#====================================================================================================================================
+class LineCache():
+    """
+    Keeps the rendered strip of the visible span of every canvas row and only rebuilds the
+    rows marked as dirty (or whose span changed because the canvas was scrolled).
+    """
+    MAX_LINES = 4096
+
+    #---------------------------------------------------------------------------------------
+    def __init__(self, theme="monokai") -> None:
+        syntax_theme = Syntax.get_theme(theme)
+        self.background_style = syntax_theme.get_background_style()
+        self.text_style       = syntax_theme.get_style_for_token(Token.Text)
+
+        self._lines   : Dict[int, Tuple[Tuple[int, int], Strip]] = {}
+        self._dirty   : Set[int] = set()
+        self._pending : Set[int] = set()
+        self._all_dirty = True
+
+    #---------------------------------------------------------------------------------------
+    def mark_dirty(self, row) -> None:
+        self._dirty.add(row)
+        self._pending.add(row)
+
+    #---------------------------------------------------------------------------------------
+    def mark_rows_dirty(self, start_row, end_row) -> None:
+        self._dirty.update(range(start_row, end_row + 1))
+        self._pending.update(range(start_row, end_row + 1))
+
+    #---------------------------------------------------------------------------------------
+    def mark_all_dirty(self) -> None:
+        self._all_dirty = True
+        self._dirty.clear()
+
+    #---------------------------------------------------------------------------------------
+    def pop_pending_rows(self) -> Union[List[int], None]:
+        """
+        Returns the rows changed since the last call, or None when every row has to be repainted.
+        """
+        rows = None if self._all_dirty else sorted(self._pending)
+        self._pending.clear()
+        return rows
+
+    #---------------------------------------------------------------------------------------
+    def get_strip(self, row, buffer, start_col, width) -> Strip:
+        """
+        Returns the strip of row[start_col:start_col+width], rendering it again only when it is dirty.
+        """
+        if self._all_dirty or len(self._lines) > self.MAX_LINES:
+            self._lines.clear()
+            self._all_dirty = False
+
+        span = (start_col, width)
+        cached = self._lines.get(row)
+        if row in self._dirty or cached is None or cached[0] != span:
+            self._dirty.discard(row)
+            text = buffer[row].tounicode(start_col, start_col + width).rstrip(" ") if row < len(buffer) else ""
+            strip = Strip([Segment(text, self.text_style)]).adjust_cell_length(width, self.background_style)
+            cached = self._lines[row] = (span, strip)
+
+        return cached[1]
+
+
+#====================================================================================================================================
+class Overlay():
+    """
+    Transient decorations (cursor, selection box, ...) composited on top of the cached rows.
+    Each layer is a style applied over a rectangular region, changing a layer only costs the
+    cells it covers.
+    """
+    #---------------------------------------------------------------------------------------
+    def __init__(self) -> None:
+        self._layers : Dict[str, Tuple[Style, Region]] = {}
+
+    #---------------------------------------------------------------------------------------
+    def set_layer(self, name, style: Style, region: Union[Region, None]) -> List[Region]:
+        """
+        Sets (or removes, when region is None or empty) a layer and returns the regions to repaint.
+        """
+        old = self._layers.get(name)
+        if region is None or not region:
+            if old is None:
+                return []
+            del self._layers[name]
+            return [old[1]]
+
+        if old == (style, region):
+            return []
+
+        self._layers[name] = (style, region)
+        return [region] if old is None else [old[1], region]
+
+    #---------------------------------------------------------------------------------------
+    def get_row(self, row) -> List[Tuple[Style, int, int]]:
+        return [
+            (style, region.x, region.right)
+            for style, region in self._layers.values()
+            if region.y <= row < region.bottom
+        ]
+
+    #---------------------------------------------------------------------------------------
+    def apply(self, strip: Strip, row, offset=0) -> Strip:
+        """
+        Applies the layers covering row to a strip that starts at column offset.
+        """
+        for style, start_col, end_col in self.get_row(row):
+            start_col -= offset
+            end_col   -= offset
+            if end_col <= start_col or start_col >= strip.cell_length:
+                continue
+            end_col = min(end_col, strip.cell_length)
+            before, part, after = strip.divide([max(0, start_col), end_col, strip.cell_length])
+            part = Strip(Segment.apply_style(part, post_style=style), part.cell_length)
+            strip = Strip.join([before, part, after])
+        return strip
+
+
+#====================================================================================================================================
+class CanvasRenderable():
+    """
+    Rich renderable of the whole canvas (base rows plus overlay), used when the drawing has
+    to be rendered outside of the widget's line API.
+    """
+    #---------------------------------------------------------------------------------------
+    def __init__(self, canvas) -> None:
+        self.canvas = canvas
+
+    #---------------------------------------------------------------------------------------
+    def __rich_measure__(self, console: Console, options: ConsoleOptions) -> Measurement:
+        width = max((len(row) for row in self.canvas.active_buffer), default=0)
+        return Measurement(width, width)
+
+    #---------------------------------------------------------------------------------------
+    def __rich_console__(self, console: Console, options: ConsoleOptions) -> RenderResult:
+        new_line = Segment.line()
+        for row in range(len(self.canvas.active_buffer)):
+            yield from self.canvas.render_row(row, 0, options.max_width)
+            yield new_line
@@ -0,0 +1,257 @@
+from bisect import bisect_right
+from heapq import heappop, heappush
+from typing import Dict, List, Tuple, Union
+import re
+
+
+#====================================================================================================================================
+class ArrowRouter():
+    """
+    A* search of orthogonal arrow routes on the canvas grid. Box outlines, text and arrow heads
+    are obstacles, existing arrows can only be crossed at a right angle, and every bend or
+    crossing adds to the cost of a route.
+
+    The cost of each row is derived from the metadata and glyph planes once and cached until
+    either grid changes (the grids' version counters), which does not happen while a shape is
+    previewed. Searches are bounded to a window around the two ends and to MAX_EXPANSIONS
+    states, and the last route is reused while the end point does not move. The connected
+    components of the passable cells are cached the same way, an end that cannot be reached
+    (inside a box) is given up at once instead of exhausting the search.
+    """
+    FREE      = 0
+    ALONG_H   = 1     # cell of an horizontal arrow, can only be crossed vertically
+    ALONG_V   = 2     # cell of a vertical arrow, can only be crossed horizontally
+    BLOCKED   = 3
+
+    BEND_COST      = 4
+    CROSSING_COST  = 6
+    MARGIN         = 16
+    MAX_EXPANSIONS = 50000
+
+    # components are labelled over the search window grown to multiples of this, so that the
+    # windows of nearby end points share them
+    REGION_SIZE = 64
+
+    DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+    REVERSE    = (1, 0, 3, 2)
+
+    # cost of each CellType code: NONE, BOX_H, BOX_V, ARROW_H, ARROW_V, the rest are obstacles
+    _COST_TABLE = bytes([FREE, BLOCKED, BLOCKED, ALONG_H, ALONG_V] + [BLOCKED] * 251)
+    _GLYPH = re.compile(r"[^ ]")
+    _PASSABLE_RUN = re.compile(b"[^%c]+" % BLOCKED)
+
+    #---------------------------------------------------------------------------------------
+    def __init__(self, drawing_buffer, metadata_buffer) -> None:
+        self.drawing_buffer  = drawing_buffer
+        self.metadata_buffer = metadata_buffer
+
+        self._rows    : Dict[int, bytearray] = {}
+        self._components : Dict[Tuple[int, int, int, int], Dict[int, Tuple[List[int], List[int], List[int]]]] = {}
+        self._version : Tuple[int, int] = (-1, -1)
+        self._last    : Union[Tuple[tuple, Union[List[Tuple[int, int]], None]], None] = None
+
+    #---------------------------------------------------------------------------------------
+    def _check_version(self) -> Tuple[int, int]:
+        version = (self.drawing_buffer.version, self.metadata_buffer.version)
+        if version != self._version:
+            self._rows.clear()
+            self._components.clear()
+            self._last = None
+            self._version = version
+        return version
+
+    #---------------------------------------------------------------------------------------
+    def _row_cost(self, row) -> bytearray:
+        cost = self._rows.get(row)
+        if cost is None:
+            cols = self.metadata_buffer.cols
+            cost = bytearray(self.metadata_buffer.row_slice(row, 0, cols).tobytes().translate(self._COST_TABLE))
+            # glyphs without metadata (box corners, loaded text files) are obstacles too
+            for match in self._GLYPH.finditer(self.drawing_buffer.row_text(row, 0, cols)):
+                if cost[match.start()] == self.FREE:
+                    cost[match.start()] = self.BLOCKED
+            self._rows[row] = cost
+        return cost
+
+    #---------------------------------------------------------------------------------------
+    def cost(self, col, row) -> int:
+        self._check_version()
+        if row < 0 or col < 0:
+            return self.BLOCKED
+        cost = self._row_cost(row)
+        return cost[col] if col < len(cost) else self.FREE
+
+    #---------------------------------------------------------------------------------------
+    def route(self, start: Tuple[int, int], end: Tuple[int, int]) -> Union[List[Tuple[int, int]], None]:
+        """
+        Returns the cells (col, row) of the cheapest route from start to end, both included,
+        or None when there is none within the search bounds.
+        """
+        key = (start, end, self._check_version())
+        if self._last is not None and self._last[0] == key:
+            return self._last[1]
+
+        window = self._window(start, end)
+        # the rows of a mapped diagram are loaded up front, see RowLoader
+        self.metadata_buffer.ensure_loaded(window[1], window[3])
+        path = self._search(start, end, window) if self._connected(start, end, window) else None
+        self._last = (key, path)
+        return path
+
+    #---------------------------------------------------------------------------------------
+    def _window(self, start, end) -> Tuple[int, int, int, int]:
+        """
+        (min_col, min_row, max_col, max_row) the search between start and end is bounded to.
+        """
+        return (max(0, min(start[0], end[0]) - self.MARGIN), max(0, min(start[1], end[1]) - self.MARGIN),
+                max(start[0], end[0]) + self.MARGIN, max(start[1], end[1]) + self.MARGIN)
+
+    #---------------------------------------------------------------------------------------
+    def _label_components(self, min_col, min_row, max_col, max_row) -> Dict[int, Tuple[List[int], List[int], List[int]]]:
+        """
+        Labels the connected components of the cells that are not BLOCKED, row by row: every
+        run of passable cells is merged (union-find) with the runs it touches in the row above.
+        Returns, for each row, the sorted starts and the ends of its runs and their labels.
+        Arrows count as passable, so two cells with one label may still have no route between
+        them, but two labels never have one.
+        """
+        width = max_col - min_col + 1
+        parent : List[int] = []
+
+        def find(run):
+            while parent[run] != run:
+                parent[run] = parent[parent[run]]
+                run = parent[run]
+            return run
+
+        rows : Dict[int, Tuple[List[int], List[int], List[int]]] = {}
+        above : Tuple[List[int], List[int], List[int]] = ([], [], [])
+        for row in range(min_row, max_row + 1):
+            # cells past the end of the row are free
+            line = bytes(self._row_cost(row)[min_col : max_col + 1]).ljust(width, b"\0")
+            starts, ends, runs = [], [], []
+            for match in self._PASSABLE_RUN.finditer(line):
+                start, end = min_col + match.start(), min_col + match.end() - 1
+                run = len(parent)
+                parent.append(run)
+                # the runs above that overlap this one, the last of them starts at or before end
+                index = bisect_right(above[0], end) - 1
+                while index >= 0 and above[1][index] >= start:
+                    parent[find(above[2][index])] = run
+                    index -= 1
+                starts.append(start)
+                ends.append(end)
+                runs.append(run)
+            rows[row] = above = (starts, ends, runs)
+
+        for starts, ends, runs in rows.values():
+            runs[:] = [find(run) for run in runs]
+        return rows
+
+    #---------------------------------------------------------------------------------------
+    def _connected(self, start, end, window) -> bool:
+        """
+        False when no route can join start and end within window, told from the connected
+        components of the region around the window (cached until either grid changes).
+        """
+        size = self.REGION_SIZE
+        region = (window[0] // size * size, window[1] // size * size,
+                  (window[2] // size + 1) * size - 1, (window[3] // size + 1) * size - 1)
+        rows = self._components.get(region)
+        if rows is None:
+            rows = self._components[region] = self._label_components(*region)
+
+        def labels(col, row):
+            # a blocked end is reached from its passable neighbours
+            found = set()
+            for cell_col, cell_row in ((col, row), (col + 1, row), (col - 1, row), (col, row + 1), (col, row - 1)):
+                if cell_row in rows:
+                    starts, ends, runs = rows[cell_row]
+                    index = bisect_right(starts, cell_col) - 1
+                    if index >= 0 and ends[index] >= cell_col:
+                        if (cell_col, cell_row) == (col, row):
+                            return {runs[index]}
+                        found.add(runs[index])
+            return found
+
+        return not labels(*start).isdisjoint(labels(*end))
+
+    #---------------------------------------------------------------------------------------
+    def _search(self, start, end, window) -> Union[List[Tuple[int, int]], None]:
+        start_col, start_row = start
+        end_col, end_row = end
+        min_col, min_row, max_col, max_row = window
+
+        def heuristic(col, row):
+            estimate = abs(col - end_col) + abs(row - end_row)
+            if col != end_col and row != end_row:
+                estimate += self.BEND_COST
+            return estimate
+
+        row_cost = self._row_cost
+        start_state = (start_col, start_row, -1)
+        best : Dict[Tuple[int, int, int], int] = {start_state: 0}
+        came : Dict[Tuple[int, int, int], Tuple[int, int, int]] = {}
+        heap = [(heuristic(start_col, start_row), 0, start_col, start_row, -1)]
+        expansions = 0
+
+        while heap:
+            _, cost, col, row, direction = heappop(heap)
+            state = (col, row, direction)
+            if cost > best.get(state, cost):
+                continue
+            if col == end_col and row == end_row:
+                return self._path(came, state)
+
+            expansions += 1
+            if expansions > self.MAX_EXPANSIONS:
+                return None
+
+            here = row_cost(row)
+            # an arrow being crossed cannot be turned on
+            crossing_here = direction >= 0 and col < len(here) and here[col] in (self.ALONG_H, self.ALONG_V)
+
+            for new_direction, (step_col, step_row) in enumerate(self.DIRECTIONS):
+                if direction >= 0 and new_direction == self.REVERSE[direction]:
+                    continue
+                bend = direction >= 0 and new_direction != direction
+                if bend and crossing_here:
+                    continue
+
+                new_col = col + step_col
+                new_row = row + step_row
+                if not (min_col <= new_col <= max_col and min_row <= new_row <= max_row):
+                    continue
+
+                step = 1
+                if new_col != end_col or new_row != end_row:
+                    cells = row_cost(new_row)
+                    cell = cells[new_col] if new_col < len(cells) else self.FREE
+                    if cell == self.BLOCKED:
+                        continue
+                    if cell == (self.ALONG_H if step_row == 0 else self.ALONG_V):
+                        # running along an existing arrow would merge both lines
+                        continue
+                    if cell != self.FREE:
+                        step += self.CROSSING_COST
+                if bend:
+                    step += self.BEND_COST
+
+                new_cost = cost + step
+                new_state = (new_col, new_row, new_direction)
+                if new_cost < best.get(new_state, new_cost + 1):
+                    best[new_state] = new_cost
+                    came[new_state] = state
+                    heappush(heap, (new_cost + heuristic(new_col, new_row), new_cost, new_col, new_row, new_direction))
+
+        return None
+
+    #---------------------------------------------------------------------------------------
+    @staticmethod
+    def _path(came, state) -> List[Tuple[int, int]]:
+        path = [(state[0], state[1])]
+        while state in came:
+            state = came[state]
+            path.append((state[0], state[1]))
+        path.reverse()
+        return path
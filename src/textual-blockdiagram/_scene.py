@@ -0,0 +1,142 @@
+from typing import Dict, Iterator, List, Set, Tuple, Union
+
+from _utils import BBox
+
+
+#====================================================================================================================================
+class SceneGraph():
+    """
+    Retained list of the committed shapes, in drawing order, with their bounding boxes hashed
+    in a uniform grid of CELL_SIZE x CELL_SIZE buckets. Point and rectangle queries only visit
+    the buckets they overlap, so they do not depend on the number of shapes on the canvas.
+    """
+    CELL_SIZE = 16
+
+    #---------------------------------------------------------------------------------------
+    def __init__(self) -> None:
+        self._shapes  : Dict[int, object] = {}
+        self._bboxes  : Dict[int, BBox] = {}
+        self._buckets : Dict[Tuple[int, int], Set[int]] = {}
+        self._next_key = 0
+
+    #---------------------------------------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self._shapes)
+
+    #---------------------------------------------------------------------------------------
+    def __iter__(self) -> Iterator:
+        return iter([self._shapes[key] for key in sorted(self._shapes)])
+
+    #---------------------------------------------------------------------------------------
+    def __contains__(self, shape) -> bool:
+        return shape.key is not None and self._shapes.get(shape.key) is shape
+
+    #---------------------------------------------------------------------------------------
+    def _bucket_keys(self, bbox: BBox) -> Iterator[Tuple[int, int]]:
+        if not bbox:
+            return
+        size = self.CELL_SIZE
+        for bucket_row in range(bbox.row // size, bbox.end_row // size + 1):
+            for bucket_col in range(bbox.col // size, bbox.end_col // size + 1):
+                yield (bucket_row, bucket_col)
+
+    #---------------------------------------------------------------------------------------
+    def _index(self, key, bbox: Union[BBox, None]) -> None:
+        if bbox is None:
+            return
+        self._bboxes[key] = bbox
+        for bucket in self._bucket_keys(bbox):
+            self._buckets.setdefault(bucket, set()).add(key)
+
+    #---------------------------------------------------------------------------------------
+    def _unindex(self, key) -> None:
+        bbox = self._bboxes.pop(key, None)
+        if bbox is None:
+            return
+        for bucket in self._bucket_keys(bbox):
+            keys = self._buckets.get(bucket)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._buckets[bucket]
+
+    #---------------------------------------------------------------------------------------
+    def add(self, shape) -> int:
+        """
+        Indexes a shape and returns its key, which is also its rank in the drawing order. A
+        removed shape added back (undo, redo) gets its key back and so its place in that order.
+        """
+        key = shape.key
+        if key is None or key in self._shapes:
+            key = shape.key = self._next_key
+        self._next_key = max(self._next_key, key + 1)
+        self._shapes[key] = shape
+        self._index(key, shape.bbox)
+        return key
+
+    #---------------------------------------------------------------------------------------
+    def remove(self, shape) -> None:
+        if shape not in self:
+            return
+        # the key is kept for the shape to be added back at the same place
+        self._unindex(shape.key)
+        del self._shapes[shape.key]
+
+    #---------------------------------------------------------------------------------------
+    def update(self, shape) -> None:
+        """
+        Re-indexes a shape whose geometry changed.
+        """
+        if shape not in self:
+            return
+        self._unindex(shape.key)
+        self._index(shape.key, shape.bbox)
+
+    #---------------------------------------------------------------------------------------
+    def translate(self, shape, delta_col, delta_row) -> None:
+        shape.translate(delta_col, delta_row)
+        self.update(shape)
+
+    #---------------------------------------------------------------------------------------
+    def clear(self) -> None:
+        for shape in self._shapes.values():
+            shape.key = None
+        self._shapes.clear()
+        self._bboxes.clear()
+        self._buckets.clear()
+
+    #---------------------------------------------------------------------------------------
+    def shape_at(self, col, row):
+        """
+        Returns the shape under a cell, or None. When bounding boxes overlap the smallest one
+        wins (a box drawn inside another one), then the most recent one.
+        """
+        size = self.CELL_SIZE
+        keys = self._buckets.get((row // size, col // size))
+        if not keys:
+            return None
+
+        best = None
+        for key in keys:
+            bbox = self._bboxes[key]
+            if bbox.contains(col, row):
+                rank = (bbox.area, -key)
+                if best is None or rank < best[0]:
+                    best = (rank, key)
+        return None if best is None else self._shapes[best[1]]
+
+    #---------------------------------------------------------------------------------------
+    def query(self, bbox: BBox, contained=False) -> List:
+        """
+        Returns the shapes intersecting bbox (or fully inside it when contained is set),
+        in drawing order.
+        """
+        keys = set()
+        for bucket in self._bucket_keys(bbox):
+            keys.update(self._buckets.get(bucket, ()))
+
+        if contained:
+            hits = [key for key in keys if self._bboxes[key].inside(bbox)]
+        else:
+            hits = [key for key in keys if self._bboxes[key].intersects(bbox)]
+        return [self._shapes[key] for key in sorted(hits)]
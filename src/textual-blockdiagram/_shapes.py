@@ -1,63 +1,163 @@
-
-
-# from textual_textarea import TextArea
-from textual.app import App, ComposeResult
-from textual.message import Message
-from textual.containers import Container, VerticalScroll, Horizontal, Vertical
-from textual.widgets import Header, Footer, Button, Static
-from textual.reactive import reactive
-from textual import events
-from textual.binding import Binding
-from rich.console import RenderableType
-from rich.style import Style
-from rich.syntax import Syntax
-from typing import Deque, List, Tuple, Union
-
+from typing import TYPE_CHECKING, Deque, List, Tuple, Union
+import copy
 
 from _utils import *
 
+if TYPE_CHECKING:
+    # shapes are drawn by DiagramModel, which does not depend on textual
+    from textual import events
+
 #====================================================================================================================================
 class Shape():
+    """
+    Base of the drawable shapes. A shape keeps the points it was drawn from (anchor, end and
+    mode), the cells it wrote as a few rectangles (segments: box sides, line runs) and their
+    bounding box, which is what the scene graph indexes.
+    """
     #---------------------------------------------------------------------------------------
     def __init__(self, parent , char_set, dynamic) -> None:
         self.parent = parent
         self.char_set = char_set
         self.dynamic = dynamic
 
+        self.anchor : Union[Cursor, None] = None
+        self.end    : Union[Cursor, None] = None
+        self.mode   = None
+        self.bbox   : Union[BBox, None] = None
+        self.segments : List[BBox] = []
+        self.key    = None
+
+    #---------------------------------------------------------------------------------------
+    def set_geometry(self, anchor: Cursor, end: Cursor, mode=None) -> None:
+        self.anchor = Cursor(*anchor)
+        self.end    = Cursor(*end)
+        self.mode   = mode
+
+    #---------------------------------------------------------------------------------------
+    def add_segment(self, col, row, end_col, end_row) -> None:
+        self.segments.append(BBox(col, row, end_col, end_row))
+        if self.bbox is None:
+            self.bbox = BBox(col, row, end_col, end_row)
+        else:
+            self.bbox = self.bbox.union(col, row, end_col, end_row)
+
+    #---------------------------------------------------------------------------------------
+    def covers(self, rect: BBox) -> bool:
+        """
+        True when rect holds at least one of the cells the shape wrote, not just part of its
+        bounding box (the inside of a box, the corner an elbow arrow goes around).
+        """
+        return any(segment.intersects(rect) for segment in self.segments)
+
     #---------------------------------------------------------------------------------------
-    def set_char(self, col, row, char, char_type=None):
+    def translate(self, delta_col, delta_row) -> None:
+        """
+        Moves the geometry of the shape, the cells themselves are moved by the canvas.
+        """
+        if self.anchor is not None:
+            self.anchor = Cursor(self.anchor.row + delta_row, self.anchor.col + delta_col)
+            self.end    = Cursor(self.end.row + delta_row, self.end.col + delta_col)
+        if self.bbox is not None:
+            self.bbox = self.bbox.translate(delta_col, delta_row)
+        self.segments = [segment.translate(delta_col, delta_row) for segment in self.segments]
+
+    #---------------------------------------------------------------------------------------
+    def copy(self) -> "Shape":
+        """
+        Returns a copy of the shape outside of any scene graph, for pasted cells.
+        """
+        clone = copy.copy(self)
+        clone.key = None
+        return clone
+
+    #---------------------------------------------------------------------------------------
+    def set_char(self, col, row, char, char_type=CellType.NONE):
+        self.add_segment(col, row, col, row)
         self.parent.set_char(col, row, char, char_type,self.dynamic)
 
     #---------------------------------------------------------------------------------------
-    def draw_vline(self, col, start_row, length, char='|', char_type="v"):
-        for r in range(start_row, start_row + length):
-            if self.parent.get_metadata(col,r) == "ah":
-                self.set_char(col, r, ")", char_type)
-            else:
-                self.set_char(col, r, char, char_type)
+    def draw_vline(self, col, start_row, length, char='|', char_type=CellType.ARROW_V):
+        if length > 0:
+            self.add_segment(col, start_row, col, start_row + length - 1)
+        # crossing an horizontal arrow
+        self.parent.fill_vspan(col, start_row, length, char, char_type, self.dynamic, cross_type=CellType.ARROW_H)
+
     #---------------------------------------------------------------------------------------
-    def draw_hline(self, col, row, length, char='-',char_type="h"):
-        for c in range(col, col + length):
-            if self.parent.get_metadata(c,row) == "av":
-                self.set_char(c, row, ")", char_type)
-            else:
-                self.set_char(c, row, char, char_type)
+    def draw_hline(self, col, row, length, char='-',char_type=CellType.ARROW_H):
+        if length > 0:
+            self.add_segment(col, row, col + length - 1, row)
+        # crossing a vertical arrow
+        self.parent.fill_hspan(col, row, length, char, char_type, self.dynamic, cross_type=CellType.ARROW_V)
 
     #---------------------------------------------------------------------------------------
-    def draw_dline(self, top_col, top_row, horiz_width, char='\\', char_type="diag"):
-        if char == "\\":
-            col_start = top_col
-            col_end   = top_col+horiz_width
-            col_step  = 1
-        else:
-            col_start = top_col
-            col_end   = top_col-horiz_width
-            col_step  = -1
+    def plot_cells(self, cells) -> None:
+        if not cells:
+            return
+        # consecutive cells along a row or a column make one segment
+        segment = None
+        for col, row, *_ in cells:
+            if segment is not None and (
+                    segment.row == segment.end_row == row and col in (segment.col - 1, segment.end_col + 1)
+                    or segment.col == segment.end_col == col and row in (segment.row - 1, segment.end_row + 1)):
+                segment = segment.union(col, row, col, row)
+                continue
+            if segment is not None:
+                self.add_segment(*segment)
+            segment = BBox(col, row, col, row)
+        self.add_segment(*segment)
+        self.parent.plot_cells(cells, self.dynamic)
+
+    #---------------------------------------------------------------------------------------
+    def draw_dline(self, top_col, top_row, horiz_width, char='\\', char_type=CellType.DIAG):
+        if horiz_width <= 0:
+            return
+        col_step = 1 if char == "\\" else -1
+        end_col  = top_col + col_step * (horiz_width - 1)
+        end_row  = top_row + horiz_width - 1
+
+        self.plot_cells([(col, row, char, char_type) for col, row, _ in self.line_cells(top_col, top_row, end_col, end_row)])
 
-        for r,row in enumerate(range(top_row, top_row + horiz_width)):
-                for c,col in enumerate(range(col_start, col_end,col_step)):
-                    if r == c:
-                        self.set_char(col, row, char, char_type)
+    #---------------------------------------------------------------------------------------
+    def line_cells(self, start_col, start_row, end_col, end_row):
+        """
+        Bresenham rasterization of the segment between two cells, linear in its length.
+        Yields (col, row, direction) where direction is the step taken to reach the next cell
+        ("h", "v", "\\" or "/"), the last cell reusing the direction of the previous step.
+        """
+        delta_col =  abs(end_col - start_col)
+        delta_row = -abs(end_row - start_row)
+        step_col  = 1 if start_col < end_col else -1
+        step_row  = 1 if start_row < end_row else -1
+        error     = delta_col + delta_row
+
+        col, row = start_col, start_row
+        direction = "h" if delta_col >= -delta_row else "v"
+        while True:
+            if col == end_col and row == end_row:
+                yield col, row, direction
+                return
+
+            moved_col = moved_row = False
+            double_error = 2 * error
+            if double_error >= delta_row:
+                error += delta_row
+                moved_col = True
+            if double_error <= delta_col:
+                error += delta_col
+                moved_row = True
+
+            if moved_col and moved_row:
+                direction = "\\" if step_col == step_row else "/"
+            elif moved_col:
+                direction = "h"
+            else:
+                direction = "v"
+
+            yield col, row, direction
+            if moved_col:
+                col += step_col
+            if moved_row:
+                row += step_row
 
     #---------------------------------------------------------------------------------------
     def round_to_multiple(self, value, multiple):
@@ -66,7 +166,8 @@ class Shape():
 #====================================================================================================================================
 class Box(Shape):
     #---------------------------------------------------------------------------------------
-    def draw(self, event: events.MouseUp, anchor: Cursor ):
+    def draw(self, event: "events.MouseUp", anchor: Cursor ):
+        self.set_geometry(anchor, Cursor(event.y, event.x))
         if event.x > anchor.col:
             start_col = anchor.col
         else:
@@ -86,26 +187,16 @@ class Box(Shape):
 
     #---------------------------------------------------------------------------------------
     def draw_box(self, col, row, width, height):
-        lastrow = row + height - 1
-        lastcol = col + width - 1
-        hline_start = col + 1
-        hline_end = width - 2
-        vline_start = row + 1
-        vline_end = height - 2
-
-        self.draw_hline(hline_start , row           , hline_end, char=self.char_set["h"], char_type="bh")
-        self.draw_hline(hline_start , lastrow       , hline_end, char=self.char_set["h"], char_type="bh")
-        self.draw_vline(col         , vline_start   , vline_end, char=self.char_set["v"], char_type="bv")
-        self.draw_vline(lastcol     , vline_start   , vline_end, char=self.char_set["v"], char_type="bv")
-        self.set_char(col             , row             , self.char_set["tl"])
-        self.set_char(col + width - 1 , row             , self.char_set["tr"])
-        self.set_char(col             , row + height - 1, self.char_set["bl"])
-        self.set_char(col + width - 1 , row + height - 1, self.char_set["br"])
+        end_col, end_row = col + width - 1, row + height - 1
+        for side in ((col, row, end_col, row), (col, end_row, end_col, end_row), (col, row, col, end_row), (end_col, row, end_col, end_row)):
+            self.add_segment(*side)
+        self.parent.stroke_rect(col, row, width, height, self.char_set, CellType.BOX_H, CellType.BOX_V, self.dynamic)
 
 #====================================================================================================================================
 class Arrow(Shape):
     #---------------------------------------------------------------------------------------
-    def draw(self, event: events.MouseUp, anchor: Cursor, approach_mode):
+    def draw(self, event: "events.MouseUp", anchor: Cursor, approach_mode):
+        self.set_geometry(anchor, Cursor(event.y, event.x), approach_mode)
         start_col = anchor.col
         start_row = anchor.row
         end_col   = event.x
@@ -116,15 +207,15 @@ class Arrow(Shape):
         # self.parent.log(f" start_col = {start_col} start_row = {start_row} \nend_col   = {end_col  } end_row   = {end_row  } ")
 
         if start_row == end_row:
-            self.draw_hline(col = min(start_col, end_col) + 1, row = start_row, length =  abs(end_col - start_col), char=self.char_set["h"], char_type="ah")
+            self.draw_hline(col = min(start_col, end_col) + 1, row = start_row, length =  abs(end_col - start_col), char=self.char_set["h"], char_type=CellType.ARROW_H)
             head = "►" if start_col < end_col else "◄"
-            type = ">" if start_col < end_col else "<"
+            type = CellType.HEAD_RIGHT if start_col < end_col else CellType.HEAD_LEFT
             self.set_char(end_col, end_row, head, type)
 
         elif start_col == end_col:
-            self.draw_vline(col = start_col , start_row = min(start_row, end_row), length = abs(end_row - start_row), char=self.char_set["v"], char_type="av")
+            self.draw_vline(col = start_col , start_row = min(start_row, end_row), length = abs(end_row - start_row), char=self.char_set["v"], char_type=CellType.ARROW_V)
             head = "▼" if start_row < end_row else "▲"
-            type = "v" if start_col < end_col else "^"
+            type = CellType.HEAD_DOWN if start_col < end_col else CellType.HEAD_UP
             self.set_char(end_col, end_row, head,type)
 
         else:
@@ -166,9 +257,9 @@ class Arrow(Shape):
 
         top_bot = None
         left_right = None
-        if start_metadata == "^":
+        if start_metadata == CellType.HEAD_UP:
             top_bot = "t"
-        elif start_metadata == "v":
+        elif start_metadata == CellType.HEAD_DOWN:
             top_bot = "b"
 
         if start_col < end_col:
@@ -183,119 +274,190 @@ class Arrow(Shape):
     #---------------------------------------------------------------------------------------
     @classmethod
     def determine_approach_mode(cls, start_col, start_row, end_col, end_row, canvas_direction, parent):
-        if start_row > len(canvas_direction) or end_row+2 > len(canvas_direction):
-            return "h"
-        if start_col > len(canvas_direction[start_row]) or end_col+2 > len(canvas_direction[end_row]):
-            return "h"
-
-        if start_row < end_row:
-            if start_col < end_col:
-                # └───►
-                if canvas_direction[end_row][end_col+1] == "bv":
-                    return  "h"
-                # ───┐
-                #    ▼
-                if canvas_direction[end_row+1][end_col] == "bh":
-                    return  "v"
-
-            else:
-                # ◄────┘
-                if canvas_direction[end_row][end_col-1] == "bv":
-                    return  "h"
-                # ┌───
-                # ▼
-                if canvas_direction[end_row+1][end_col] == "bh":
-                    return  "v"
-        else:
-            if start_col < end_col:
-                # ┌───►
-                if canvas_direction[end_row][end_col+1] == "bv":
-                    return  "h"
-                #    ▲
-                # ───┘
-                if canvas_direction[end_row-1][end_col] == "bh":
-                    return  "v"
+        """
+        Picks how the arrow reaches its end: "h" when a vertical box edge is next to the head in
+        the direction of travel, "v" for a horizontal edge. canvas_direction is the metadata grid,
+        its edge index answers each probe with a bisect.
+        """
+        canvas_direction.ensure_loaded(end_row - 1, end_row + 1)
+        edges = canvas_direction.edges
+        side_col = end_col + 1 if start_col < end_col else end_col - 1
+        side_row = end_row + 1 if start_row < end_row else end_row - 1
+
+        # └───►  ◄────┘  ┌───►  ◄────┐
+        if edges.is_v_edge(side_col, end_row):
+            return  "h"
+        # ───┐  ┌───     ▲  ▲
+        #    ▼  ▼     ───┘  └───
+        if edges.is_h_edge(end_col, side_row):
+            return  "v"
 
-            else:
-                # ◄────┐
-                if canvas_direction[end_row][end_col-1] == "bv":
-                    return  "h"
-                # ▲
-                # └───
-                if canvas_direction[end_row-1][end_col] == "bh":
-                    return  "v"
+    #---------------------------------------------------------------------------------------
+    @classmethod
+    def snap_endpoint(cls, start_col, start_row, end_col, end_row, canvas_direction, max_distance):
+        """
+        Moves the end of an arrow next to the closest box border within max_distance cells.
+        Returns (end_col, end_row, approach_mode), or None when no border is close enough.
+
+        Only the borders the head runs into from outside count: the box must lie ahead in the
+        direction of travel and the head stays on the side the arrow comes from. A straight
+        arrow stays straight, a same row drag only snaps to a vertical border and a same column
+        drag to a horizontal one. On a tie the border across the longer leg of the arrow wins.
+        """
+        if max_distance <= 0:
+            return None
+        # the edge index only knows the loaded rows of a mapped diagram
+        canvas_direction.ensure_loaded(min(start_row, end_row) - max_distance - 1, max(start_row, end_row) + max_distance + 1)
+        edges = canvas_direction.edges
+        col_step = 1 if start_col < end_col else -1
+        row_step = 1 if start_row < end_row else -1
+        horizontal_first = abs(end_col - start_col) >= abs(end_row - start_row)
+
+        candidates = []
+        if start_col != end_col:
+            edge_col = edges.nearest_v_edge(end_col + col_step, end_row, max_distance, facing=col_step)
+            if edge_col is not None and (edge_col - col_step - start_col) * col_step > 0:
+                candidates.append((abs(edge_col - col_step - end_col), not horizontal_first, edge_col - col_step, end_row, "h"))
+        if start_row != end_row:
+            edge_row = edges.nearest_h_edge(end_col, end_row + row_step, max_distance, facing=row_step)
+            if edge_row is not None and (edge_row - row_step - start_row) * row_step > 0:
+                candidates.append((abs(edge_row - row_step - end_row), horizontal_first, end_col, edge_row - row_step, "v"))
+
+        if not candidates:
+            return None
+        _, _, col, row, approach_mode = min(candidates)
+        return col, row, approach_mode
 
     #---------------------------------------------------------------------------------------
     def draw_arrow_top_right(self, start_col, start_row,  end_col, end_row):
         start_col = start_col + 1
         end_col   = end_col + 1
         # self.parent.log("└───►")
-        self.draw_vline(col = start_col , start_row = start_row, length = abs(end_row - start_row), char=self.char_set["v"], char_type="av")
-        self.draw_hline(col = start_col , row = end_row, length =  abs(end_col - start_col), char=self.char_set["h"], char_type="ah")
-        self.set_char(end_col -1, end_row, "►", ">")
+        self.draw_vline(col = start_col , start_row = start_row, length = abs(end_row - start_row), char=self.char_set["v"], char_type=CellType.ARROW_V)
+        self.draw_hline(col = start_col , row = end_row, length =  abs(end_col - start_col), char=self.char_set["h"], char_type=CellType.ARROW_H)
+        self.set_char(end_col -1, end_row, "►", CellType.HEAD_RIGHT)
         self.set_char(start_col , end_row, self.char_set["bl"])
 
     #---------------------------------------------------------------------------------------
     def draw_arrow_right_down(self, start_col, start_row,  end_col, end_row):
         start_col = start_col + 1
         # self.parent.log("───┐\n▼ ")
-        self.draw_vline(col = end_col , start_row = start_row, length = abs(end_row - start_row), char=self.char_set["v"], char_type="av")
-        self.draw_hline(col = start_col , row = start_row, length =  abs(end_col - start_col), char=self.char_set["h"], char_type="ah")
-        self.set_char(end_col , end_row, "▼", "v")
+        self.draw_vline(col = end_col , start_row = start_row, length = abs(end_row - start_row), char=self.char_set["v"], char_type=CellType.ARROW_V)
+        self.draw_hline(col = start_col , row = start_row, length =  abs(end_col - start_col), char=self.char_set["h"], char_type=CellType.ARROW_H)
+        self.set_char(end_col , end_row, "▼", CellType.HEAD_DOWN)
         self.set_char(end_col , start_row, self.char_set["tr"])
 
     #---------------------------------------------------------------------------------------
     def draw_arrow_top_left(self, start_col, start_row,  end_col, end_row):
         start_col = start_col + 1
         # self.parent.log("◄────┘")
-        self.draw_vline(col = start_col , start_row = start_row, length = abs(end_row - start_row), char=self.char_set["v"], char_type="av")
-        self.draw_hline(col = end_col , row = end_row, length =  abs(end_col - start_col), char=self.char_set["h"], char_type="ah")
-        self.set_char(end_col , end_row, "◄", "<")
+        self.draw_vline(col = start_col , start_row = start_row, length = abs(end_row - start_row), char=self.char_set["v"], char_type=CellType.ARROW_V)
+        self.draw_hline(col = end_col , row = end_row, length =  abs(end_col - start_col), char=self.char_set["h"], char_type=CellType.ARROW_H)
+        self.set_char(end_col , end_row, "◄", CellType.HEAD_LEFT)
         self.set_char(start_col , end_row, self.char_set["br"])
     #---------------------------------------------------------------------------------------
     def draw_arrow_left_down(self, start_col, start_row,  end_col, end_row):
         start_col = start_col + 1
-        self.draw_vline(col = end_col , start_row = start_row, length = abs(end_row - start_row), char=self.char_set["v"], char_type="av")
-        self.draw_hline(col = end_col , row = start_row, length =  abs(end_col - start_col), char=self.char_set["h"], char_type="ah")
-        self.set_char(end_col , end_row, "▼", "v")
+        self.draw_vline(col = end_col , start_row = start_row, length = abs(end_row - start_row), char=self.char_set["v"], char_type=CellType.ARROW_V)
+        self.draw_hline(col = end_col , row = start_row, length =  abs(end_col - start_col), char=self.char_set["h"], char_type=CellType.ARROW_H)
+        self.set_char(end_col , end_row, "▼", CellType.HEAD_DOWN)
         self.set_char(end_col , start_row, self.char_set["tl"])
     #---------------------------------------------------------------------------------------
     def draw_arrow_bottom_right(self, start_col, start_row,  end_col, end_row):
         start_col = start_col + 1
         start_row = start_row + 1
         # self.parent.log("┌───►")
-        self.draw_vline(col = start_col , start_row = end_row, length = abs(end_row - start_row), char=self.char_set["v"], char_type="av")
-        self.draw_hline(col = start_col  , row = end_row, length =  abs(end_col - start_col), char=self.char_set["h"], char_type="ah")
-        self.set_char(end_col   , end_row, "►", ">")
+        self.draw_vline(col = start_col , start_row = end_row, length = abs(end_row - start_row), char=self.char_set["v"], char_type=CellType.ARROW_V)
+        self.draw_hline(col = start_col  , row = end_row, length =  abs(end_col - start_col), char=self.char_set["h"], char_type=CellType.ARROW_H)
+        self.set_char(end_col   , end_row, "►", CellType.HEAD_RIGHT)
         self.set_char(start_col , end_row, self.char_set["tl"])
     #---------------------------------------------------------------------------------------
     def draw_arrow_right_up(self, start_col, start_row,  end_col, end_row):
         start_col = start_col + 1
-        self.draw_vline(col = end_col , start_row = end_row, length = abs(end_row - start_row), char=self.char_set["v"], char_type="av")
-        self.draw_hline(col = start_col  , row = start_row, length =  abs(end_col - start_col), char=self.char_set["h"], char_type="ah")
-        self.set_char(end_col   , end_row, "▲", "^")
+        self.draw_vline(col = end_col , start_row = end_row, length = abs(end_row - start_row), char=self.char_set["v"], char_type=CellType.ARROW_V)
+        self.draw_hline(col = start_col  , row = start_row, length =  abs(end_col - start_col), char=self.char_set["h"], char_type=CellType.ARROW_H)
+        self.set_char(end_col   , end_row, "▲", CellType.HEAD_UP)
         self.set_char(end_col , start_row, self.char_set["br"])
     #---------------------------------------------------------------------------------------
     def draw_arrow_bottom_left(self, start_col, start_row,  end_col, end_row):
         start_col = start_col + 1
         # self.parent.log("◄────┐")
-        self.draw_vline(col = start_col , start_row = end_row, length = abs(end_row - start_row), char=self.char_set["v"], char_type="av")
-        self.draw_hline(col = end_col  , row = end_row, length =  abs(end_col - start_col), char=self.char_set["h"], char_type="ah")
-        self.set_char(end_col+1 , end_row, "◄", "<")
+        self.draw_vline(col = start_col , start_row = end_row, length = abs(end_row - start_row), char=self.char_set["v"], char_type=CellType.ARROW_V)
+        self.draw_hline(col = end_col  , row = end_row, length =  abs(end_col - start_col), char=self.char_set["h"], char_type=CellType.ARROW_H)
+        self.set_char(end_col+1 , end_row, "◄", CellType.HEAD_LEFT)
         self.set_char(start_col , end_row, self.char_set["tr"])
     #---------------------------------------------------------------------------------------
     def draw_arrow_left_up(self, start_col, start_row,  end_col, end_row):
         start_col = start_col + 2
-        self.draw_vline(col = end_col , start_row = end_row, length = abs(end_row - start_row), char=self.char_set["v"], char_type="av")
-        self.draw_hline(col = end_col  , row = start_row, length =  abs(end_col - start_col), char=self.char_set["h"], char_type="ah")
-        self.set_char(end_col , end_row, "▲", "^")
+        self.draw_vline(col = end_col , start_row = end_row, length = abs(end_row - start_row), char=self.char_set["v"], char_type=CellType.ARROW_V)
+        self.draw_hline(col = end_col  , row = start_row, length =  abs(end_col - start_col), char=self.char_set["h"], char_type=CellType.ARROW_H)
+        self.set_char(end_col , end_row, "▲", CellType.HEAD_UP)
         self.set_char(end_col , start_row, self.char_set["bl"])
 
 
+#====================================================================================================================================
+class RoutedArrow(Arrow):
+    """
+    Arrow following the route found by the canvas' ArrowRouter around boxes and across other
+    arrows, falling back to the single elbow arrow when no route is found.
+    """
+    HEADS = {
+        ( 1,  0) : ("►", CellType.HEAD_RIGHT),
+        (-1,  0) : ("◄", CellType.HEAD_LEFT),
+        ( 0,  1) : ("▼", CellType.HEAD_DOWN),
+        ( 0, -1) : ("▲", CellType.HEAD_UP),
+    }
+
+    # corner glyph from the sides of the cell the route enters and leaves by
+    CORNERS = {
+        frozenset("lb") : "tr",
+        frozenset("rb") : "tl",
+        frozenset("lt") : "br",
+        frozenset("rt") : "bl",
+    }
+    ENTRY_SIDE = {(1, 0): "l", (-1, 0): "r", (0, 1): "t", (0, -1): "b"}
+    EXIT_SIDE  = {(1, 0): "r", (-1, 0): "l", (0, 1): "b", (0, -1): "t"}
+
+    #---------------------------------------------------------------------------------------
+    def draw(self, event: "events.MouseUp", anchor: Cursor, approach_mode, router=None):
+        start = (anchor.col + 1, anchor.row)
+        end   = (event.x, event.y)
+        path  = router.route(start, end) if router is not None and start != end else None
+        if not path:
+            super().draw(event, anchor, approach_mode)
+            return
+
+        self.set_geometry(anchor, Cursor(event.y, event.x), "route")
+        self.plot_cells(self.route_cells(path, router))
+
+    #---------------------------------------------------------------------------------------
+    def route_cells(self, path, router):
+        cells = []
+        last = len(path) - 1
+        for index, (col, row) in enumerate(path):
+            entry = (col - path[index-1][0], row - path[index-1][1]) if index > 0 else None
+            exit  = (path[index+1][0] - col, path[index+1][1] - row) if index < last else None
+
+            if exit is None:
+                cells.append((col, row, *self.HEADS[entry]))
+            elif entry is not None and entry != exit:
+                corner = self.CORNERS[frozenset((self.ENTRY_SIDE[entry], self.EXIT_SIDE[exit]))]
+                cells.append((col, row, self.char_set[corner], CellType.NONE))
+            else:
+                horizontal = exit[1] == 0
+                char_type  = CellType.ARROW_H if horizontal else CellType.ARROW_V
+                char = self.char_set["h" if horizontal else "v"]
+                if index > 0 and router.cost(col, row) in (router.ALONG_H, router.ALONG_V):
+                    char = self.parent.CROSSING_CHAR
+                cells.append((col, row, char, char_type))
+        return cells
+
+
 #====================================================================================================================================
 class Trapezoid(Shape):
     #---------------------------------------------------------------------------------------
     def draw(self, event: Cursor, anchor: Cursor, direction = "ver"):
+        self.set_geometry(anchor, event, direction)
         if direction == "ver":
             height = self.round_to_multiple(abs(event.row - anchor.row), 3)
             width  = height // 3
@@ -307,20 +469,20 @@ class Trapezoid(Shape):
                 #     |/
                 #        event
 
-                self.draw_vline(col = anchor.col , start_row = anchor.row, length = height, char=self.char_set["v"], char_type="bv")
-                self.draw_vline(col = anchor.col+width+1 , start_row = anchor.row + height//3, length = height//3, char=self.char_set["v"], char_type="bv")
-                self.draw_dline(anchor.col+1, anchor.row, height//3, char='\\', char_type="diag")
-                self.draw_dline(anchor.col+width, anchor.row + 2 * (height//3), height//3, char='/', char_type="diag")
+                self.draw_vline(col = anchor.col , start_row = anchor.row, length = height, char=self.char_set["v"], char_type=CellType.BOX_V)
+                self.draw_vline(col = anchor.col+width+1 , start_row = anchor.row + height//3, length = height//3, char=self.char_set["v"], char_type=CellType.BOX_V)
+                self.draw_dline(anchor.col+1, anchor.row, height//3, char='\\', char_type=CellType.DIAG)
+                self.draw_dline(anchor.col+width, anchor.row + 2 * (height//3), height//3, char='/', char_type=CellType.DIAG)
             else:
                 # anchor
                 #      /|
                 #     | |
                 #      \|
                 #        event
-                self.draw_vline(col = anchor.col , start_row = anchor.row  + height//3, length = height//3, char=self.char_set["v"], char_type="bv")
-                self.draw_vline(col = anchor.col+width+1 , start_row = anchor.row, length = height, char=self.char_set["v"], char_type="bv")
-                self.draw_dline(anchor.col+1, anchor.row + 2 * (height//3), height//3, char='\\', char_type="diag")
-                self.draw_dline(anchor.col+width, anchor.row, height//3, char='/', char_type="diag")
+                self.draw_vline(col = anchor.col , start_row = anchor.row  + height//3, length = height//3, char=self.char_set["v"], char_type=CellType.BOX_V)
+                self.draw_vline(col = anchor.col+width+1 , start_row = anchor.row, length = height, char=self.char_set["v"], char_type=CellType.BOX_V)
+                self.draw_dline(anchor.col+1, anchor.row + 2 * (height//3), height//3, char='\\', char_type=CellType.DIAG)
+                self.draw_dline(anchor.col+width, anchor.row, height//3, char='/', char_type=CellType.DIAG)
         else:
             width  = self.round_to_multiple(abs(event.col - anchor.col), 3)
             height = width // 3
@@ -332,27 +494,45 @@ class Trapezoid(Shape):
                 #     /____\
                 #        event
 
-            self.draw_hline(col = anchor.col + width // 3, row = anchor.row, length = width//3, char=self.char_set["h"], char_type="bh")
-            self.draw_hline(col = anchor.col , row = event.row , length = width, char=self.char_set["h"], char_type="bh")
-            self.draw_dline(anchor.col, anchor.row, height//3, char='/', char_type="diag")
-            self.draw_dline(anchor.col+width-width//3, anchor.row, height//3, char='\\', char_type="diag")
+            self.draw_hline(col = anchor.col + width // 3, row = anchor.row, length = width//3, char=self.char_set["h"], char_type=CellType.BOX_H)
+            self.draw_hline(col = anchor.col , row = event.row , length = width, char=self.char_set["h"], char_type=CellType.BOX_H)
+            self.draw_dline(anchor.col, anchor.row, height//3, char='/', char_type=CellType.DIAG)
+            self.draw_dline(anchor.col+width-width//3, anchor.row, height//3, char='\\', char_type=CellType.DIAG)
             # else:
             #     # anchor
             #     #     ____
             #     #     \__/
             #     #        event
-            #     self.draw_hline(col = anchor.col , row = anchor.row, length = width, char=self.char_set["h"], char_type="bh")
-            #     self.draw_hline(col = event.col + width // 3, row = event.row , length = width//3, char=self.char_set["h"], char_type="bh")
-            #     # self.draw_dline(anchor.col+1, anchor.row + 2 * (height//3), height//3, char='\\', char_type="diag")
-            #     # self.draw_dline(anchor.col+width, anchor.row, height//3, char='/', char_type="diag")
+            #     self.draw_hline(col = anchor.col , row = anchor.row, length = width, char=self.char_set["h"], char_type=CellType.BOX_H)
+            #     self.draw_hline(col = event.col + width // 3, row = event.row , length = width//3, char=self.char_set["h"], char_type=CellType.BOX_H)
+            #     # self.draw_dline(anchor.col+1, anchor.row + 2 * (height//3), height//3, char='\\', char_type=CellType.DIAG)
+            #     # self.draw_dline(anchor.col+width, anchor.row, height//3, char='/', char_type=CellType.DIAG)
 
 
 #====================================================================================================================================
 class Line(Shape):
     def draw(self, event: Cursor, anchor: Cursor):
+        self.set_geometry(anchor, event)
         height = abs(event.row - anchor.row)
         width  = abs(event.col - anchor.col)
         if height > width:
-            self.draw_vline(col = anchor.col , start_row = anchor.row, length = height, char=self.char_set["v"], char_type="av")
+            self.draw_vline(col = anchor.col , start_row = anchor.row, length = height, char=self.char_set["v"], char_type=CellType.ARROW_V)
         else:
-            self.draw_hline(col = anchor.col , row = anchor.row, length = width, char=self.char_set["h"], char_type="ah")
\ No newline at end of file
+            self.draw_hline(col = anchor.col , row = anchor.row, length = width, char=self.char_set["h"], char_type=CellType.ARROW_H)
+
+
+#====================================================================================================================================
+class FreeLine(Shape):
+    """
+    Line at any angle between the anchor and the cursor, glyphs follow the local slope.
+    """
+    #---------------------------------------------------------------------------------------
+    def draw(self, event: Cursor, anchor: Cursor):
+        glyphs = {
+            "h"  : (self.char_set["h"], CellType.ARROW_H),
+            "v"  : (self.char_set["v"], CellType.ARROW_V),
+            "\\" : ("\\", CellType.DIAG),
+            "/"  : ("/", CellType.DIAG),
+        }
+        self.set_geometry(anchor, event)
+        self.plot_cells([(col, row, *glyphs[direction]) for col, row, direction in self.line_cells(anchor.col + 1, anchor.row, event.col, event.row)])
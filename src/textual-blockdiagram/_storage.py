@@ -0,0 +1,724 @@
+from abc import ABC, abstractmethod
+from array import array
+from contextlib import contextmanager
+from collections import deque
+from itertools import chain, groupby
+from typing import IO, Deque, Dict, Iterator, List, Tuple, Union
+import json
+import lzma
+import mmap
+import os
+import pathlib
+import struct
+import sys
+import tempfile
+import zlib
+
+from _utils import CELL_TYPE_CODES, CELL_TYPE_TAGS
+
+
+# version 1 files (no "version" field) store one tag per cell in every metadata row,
+# version 2 files store each row as [tag, count] runs
+JSON_FORMAT_VERSION_RLE = 2
+
+
+# Binary diagram (.abd) layout, little endian:
+#   header   magic "ABDG", version u16, compression u8, reserved u8, rows u32, cols u32, trailer offset u64
+#   payload  the rows, compressed as one stream when compression is set. Each row is
+#            u32 run count + (count u16, glyph index u16) runs, then u32 run count + (count u16, code u16) runs
+#   trailer  u32 byte length + utf-8 glyph dictionary (one code point per glyph), then
+#            (rows + 1) u32 offsets of the rows in the uncompressed payload
+BINARY_MAGIC   = b"ABDG"
+BINARY_VERSION = 1
+BINARY_HEADER  = struct.Struct("<4sHBBIIQ")
+BINARY_COMPRESSION = {"none": 0, "zlib": 1, "lzma": 2}
+
+
+#---------------------------------------------------------------------------------------
+@contextmanager
+def atomic_open(file_name, mode="w", **kwargs) -> Iterator[IO]:
+    """
+    Opens a temporary file next to file_name and renames it over file_name once the block
+    completes, so a failed save never leaves a truncated diagram behind.
+    """
+    directory = os.path.dirname(os.path.abspath(file_name))
+    handle, temp_name = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(file_name)}.", suffix=".tmp")
+    try:
+        # mkstemp creates the file as 0600, keep the permissions a plain open() would give
+        if os.path.exists(file_name):
+            os.chmod(temp_name, os.stat(file_name).st_mode & 0o7777)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temp_name, 0o666 & ~umask)
+
+        with os.fdopen(handle, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_name, file_name)
+    except BaseException:
+        try:
+            os.unlink(temp_name)
+        except OSError:
+            pass
+        raise
+
+
+#---------------------------------------------------------------------------------------
+def metadata_row_codes(row: List, version=1) -> array:
+    """
+    Decodes one "metadata" row of a .json file into an array of CellType codes.
+    """
+    try:
+        if version >= JSON_FORMAT_VERSION_RLE:
+            return array("B", b"".join(bytes([CELL_TYPE_CODES[tag]]) * count for tag, count in row))
+        return array("B", [CELL_TYPE_CODES[tag] for tag in row])
+    except (KeyError, TypeError, ValueError) as error:
+        raise ValueError(f"invalid metadata row: {error!r}") from None
+
+
+#---------------------------------------------------------------------------------------
+def _little_endian(values: array) -> array:
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+#---------------------------------------------------------------------------------------
+def _unpack_array(typecode, data) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    return _little_endian(values)
+
+
+#---------------------------------------------------------------------------------------
+def _drain(values: Deque) -> Iterator:
+    # hands the buffered rows over one at a time and releases them as it goes
+    while values:
+        yield values.popleft()
+
+
+#---------------------------------------------------------------------------------------
+def _runs(values, max_run=0xFFFF) -> Iterator[Tuple]:
+    """
+    Yields (value, count) for every run of equal values, splitting runs longer than max_run.
+    """
+    for value, run in groupby(values):
+        count = len(tuple(run))
+        while count > max_run:
+            yield value, max_run
+            count -= max_run
+        yield value, count
+
+
+#====================================================================================================================================
+class DiagramWriter():
+    """
+    Writes the committed drawing (glyph and metadata grids) to disk one row at a time, limited
+    to the rows x cols drawing bounds, so memory does not grow with the size of the diagram.
+    Rows are handed whole to the C json encoder, and identical metadata rows (blank ones
+    mostly) are only encoded once. With a loader (RowLoader of a mapped diagram), the rows it
+    never loaded are copied from the mapped file instead of being loaded into the grids.
+    """
+    INDENT = "    "
+    ROW_CACHE_SIZE = 256
+
+    #---------------------------------------------------------------------------------------
+    def __init__(self, drawing_buffer, metadata_buffer, rows, cols, metadata_rle=False, loader=None) -> None:
+        self.drawing_buffer  = drawing_buffer
+        self.metadata_buffer = metadata_buffer
+        self.rows = rows
+        self.cols = cols
+        self.metadata_rle = metadata_rle
+        self.loader = loader
+        self._row_cache : Dict[bytes, str] = {}
+        self._source_row : Tuple[int, str, bytes] = (-1, "", b"")
+
+    #---------------------------------------------------------------------------------------
+    def _from_source(self, row) -> bool:
+        if self.loader is None or self.loader.is_loaded(row) or row >= self.loader.source.rows:
+            return False
+        if self._source_row[0] != row:
+            text, codes = self.loader.source.row(row)
+            text = text[:self.cols].ljust(self.cols)
+            codes = b"" if codes is None else codes.tobytes()[:self.cols]
+            self._source_row = (row, text, codes.ljust(self.cols, b"\0"))
+        return True
+
+    #---------------------------------------------------------------------------------------
+    def row_text(self, row) -> str:
+        if self._from_source(row):
+            return self._source_row[1]
+        return self.drawing_buffer.row_text(row, 0, self.cols)
+
+    #---------------------------------------------------------------------------------------
+    def row_codes(self, row) -> bytes:
+        if self._from_source(row):
+            return self._source_row[2]
+        return self.metadata_buffer.row_slice(row, 0, self.cols).tobytes()
+
+    #---------------------------------------------------------------------------------------
+    def write(self, file_name, comment_preview=True, compression="zlib") -> None:
+        """
+        Writes file_name in the format given by its suffix: .json, binary .abd or plain text.
+        """
+        suffix = pathlib.Path(file_name).suffix
+        if suffix == ".json":
+            self.write_json(file_name, comment_preview)
+        elif suffix == ".abd":
+            self.write_binary(file_name, compression)
+        else:
+            self.write_text(file_name)
+
+    #---------------------------------------------------------------------------------------
+    def write_text(self, file_name) -> None:
+        with atomic_open(file_name, "w", encoding="utf-8") as f:
+            for row in range(self.rows):
+                if row:
+                    f.write("\n")
+                f.write(self.row_text(row))
+
+    #---------------------------------------------------------------------------------------
+    def write_json(self, file_name, comment_preview=True) -> None:
+        """
+        Writes the .json layout: an optional "//" preview of the drawing, then an object with
+        one "drawing" string and one "metadata" array per row, preceded by a "version" field
+        when the metadata is run length encoded.
+        """
+        indent = self.INDENT * 2
+        with atomic_open(file_name, "w", encoding="utf-8") as f:
+            if comment_preview:
+                for row in range(self.rows):
+                    f.write("//" + self.row_text(row) + "\n")
+                f.write("\n")
+
+            f.write("{\n")
+            if self.metadata_rle:
+                f.write(self.INDENT + f'"version": {JSON_FORMAT_VERSION_RLE},\n')
+            f.write(self.INDENT + '"drawing": [\n')
+            for row in range(self.rows):
+                f.write((",\n" if row else "") + indent + json.dumps(self.row_text(row), ensure_ascii=False))
+            f.write("\n" + self.INDENT + "],\n" + self.INDENT + '"metadata": [\n')
+            for row in range(self.rows):
+                f.write((",\n" if row else "") + indent + self.encode_metadata_row(row))
+            f.write("\n" + self.INDENT + "]\n}")
+
+    #---------------------------------------------------------------------------------------
+    def encode_metadata_row(self, row) -> str:
+        codes = self.row_codes(row)
+        encoded = self._row_cache.get(codes)
+        if encoded is None:
+            if self.metadata_rle:
+                encoded = json.dumps([[CELL_TYPE_TAGS[code], len(tuple(run))] for code, run in groupby(codes)])
+            else:
+                encoded = json.dumps([CELL_TYPE_TAGS[code] for code in codes])
+            if len(self._row_cache) < self.ROW_CACHE_SIZE:
+                self._row_cache[codes] = encoded
+        return encoded
+
+    #---------------------------------------------------------------------------------------
+    def write_binary(self, file_name, compression="zlib") -> None:
+        """
+        Writes the .abd binary layout (see BINARY_HEADER), streaming the rows through the
+        compressor. The glyph dictionary and row offsets only go to the trailer, once known.
+        """
+        if compression not in BINARY_COMPRESSION:
+            raise ValueError(f"unknown compression {compression!r}, expected one of {', '.join(BINARY_COMPRESSION)}")
+
+        compressor = None
+        if compression == "zlib":
+            compressor = zlib.compressobj(9)
+        elif compression == "lzma":
+            compressor = lzma.LZMACompressor()
+
+        glyph_index : Dict[str, int] = {}
+        offsets = array("I", [0])
+        with atomic_open(file_name, "wb") as f:
+            f.write(b"\0" * BINARY_HEADER.size)
+            for row in range(self.rows):
+                data = self.encode_binary_row(row, glyph_index)
+                offsets.append(offsets[-1] + len(data))
+                f.write(compressor.compress(data) if compressor else data)
+            if compressor:
+                f.write(compressor.flush())
+
+            trailer_offset = f.tell()
+            glyphs = "".join(glyph_index).encode("utf-8")
+            f.write(struct.pack("<I", len(glyphs)) + glyphs)
+            f.write(_little_endian(offsets).tobytes())
+
+            f.seek(0)
+            f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, BINARY_COMPRESSION[compression], 0, self.rows, self.cols, trailer_offset))
+
+    #---------------------------------------------------------------------------------------
+    def encode_binary_row(self, row, glyph_index: Dict[str, int]) -> bytes:
+        glyph_runs = array("H")
+        for char, count in _runs(self.row_text(row)):
+            index = glyph_index.get(char)
+            if index is None:
+                index = glyph_index[char] = len(glyph_index)
+            glyph_runs.append(count)
+            glyph_runs.append(index)
+
+        type_runs = array("H")
+        for code, count in _runs(self.row_codes(row)):
+            type_runs.append(count)
+            type_runs.append(code)
+
+        return (struct.pack("<I", len(glyph_runs) // 2) + _little_endian(glyph_runs).tobytes()
+                + struct.pack("<I", len(type_runs) // 2) + _little_endian(type_runs).tobytes())
+
+
+#====================================================================================================================================
+class JsonStream():
+    """
+    Incremental reader of one JSON object from a text file: members() walks the keys of the
+    top level object and array() yields the elements of an array one at a time, so a diagram
+    is parsed row by row and never held twice in memory. With skip_comments, the "//" lines
+    before the object (the drawing preview written by DiagramWriter) are skipped.
+    """
+    CHUNK_SIZE = 1 << 16
+
+    _decoder    = json.JSONDecoder()
+    _WHITESPACE = " \t\n\r"
+
+    # longest token that can be cut short by the end of a chunk without reaching it, in the
+    # error position of the decoder ("-Infin" or a partial "\uXXXX" escape)
+    _TOKEN_MAX = len("-Infinity")
+
+    #---------------------------------------------------------------------------------------
+    def __init__(self, f: IO, file_name, skip_comments=False) -> None:
+        self.f = f
+        self.file_name = file_name
+        self.buffer = ""
+        self.pos = 0
+        if skip_comments:
+            for line in f:
+                stripped = line.lstrip()
+                if stripped and not stripped.startswith("//"):
+                    self.buffer = line
+                    break
+
+    #---------------------------------------------------------------------------------------
+    def _fill(self) -> bool:
+        chunk = self.f.read(self.CHUNK_SIZE)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    #---------------------------------------------------------------------------------------
+    def peek(self) -> str:
+        """
+        Skips whitespace and returns the next character, "" at the end of the file.
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in self._WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    #---------------------------------------------------------------------------------------
+    def expect(self, char) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"{self.file_name}: expected {char!r}, found {found or 'end of file'!r}")
+        self.pos += 1
+
+    #---------------------------------------------------------------------------------------
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as error:
+                # the value may continue in the next chunk when the error is at the end of the
+                # buffer, or is a string or a literal the buffer cuts short
+                truncated = (error.pos + self._TOKEN_MAX > len(self.buffer)
+                             or error.msg.startswith("Unterminated string"))
+                if truncated and self._fill():
+                    continue
+                raise ValueError(f"{self.file_name}: {error}") from None
+            # a number at the end of the buffer may continue in the next chunk too
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    #---------------------------------------------------------------------------------------
+    def array(self) -> Iterator:
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == "]":
+                self.pos += 1
+                return
+            self.expect(",")
+
+    #---------------------------------------------------------------------------------------
+    def members(self) -> Iterator[str]:
+        """
+        Yields the keys of the top level object, the caller reads each value with value() or
+        array() before asking for the next key.
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise ValueError(f"{self.file_name}: expected an object key, found {key!r}")
+            self.expect(":")
+            yield key
+            if self.peek() == "}":
+                self.pos += 1
+                return
+            self.expect(",")
+
+
+#====================================================================================================================================
+class DiagramReader():
+    """
+    Decodes diagram files into (text, codes) rows, text being the glyphs of the row and codes
+    an array of its CellType codes (None for plain text files). The read_* methods check the
+    file before returning the row iterator, so the canvas is not cleared for a file that
+    cannot be read. The dimensions (rows, cols) are final once the iterator is exhausted.
+    """
+    #---------------------------------------------------------------------------------------
+    def __init__(self, file_name) -> None:
+        self.file_name = file_name
+        self.rows = 0
+        self.cols = 0
+
+    #---------------------------------------------------------------------------------------
+    def read(self) -> Iterator[Tuple[str, Union[array, None]]]:
+        suffix = pathlib.Path(self.file_name).suffix
+        if suffix == ".json":
+            return self.read_json()
+        if suffix == ".abd":
+            return self.read_binary()
+        return self.read_text()
+
+    #---------------------------------------------------------------------------------------
+    def read_text(self) -> Iterator[Tuple[str, None]]:
+        with open(self.file_name, encoding="utf-8") as f:
+            lines = [line.rstrip() for line in f]
+        self.rows = len(lines)
+        self.cols = max((len(line) for line in lines), default=0)
+        return ((line, None) for line in lines)
+
+    #---------------------------------------------------------------------------------------
+    def read_json(self) -> Iterator[Tuple[str, array]]:
+        """
+        Yields the rows as the second of the "drawing" and "metadata" arrays is parsed, only
+        the first one is held, in its compact form (strings or code arrays), until then. The
+        rows and cols counts grow as the rows are handed over. The file is read up to its
+        first row before returning, so a file that is not a diagram fails here.
+        """
+        rows = self._json_rows()
+        first = next(rows, None)
+        return iter(()) if first is None else chain((first,), rows)
+
+    #---------------------------------------------------------------------------------------
+    def _json_rows(self) -> Iterator[Tuple[str, array]]:
+        drawing  : Union[Deque[str], None] = None
+        metadata : Union[Deque[array], None] = None
+        version  = 1
+        paired   = False
+        with open(self.file_name, encoding="utf-8") as f:
+            stream = JsonStream(f, self.file_name, skip_comments=True)
+            for key in stream.members():
+                if key == "drawing" and drawing is None:
+                    if metadata is None:
+                        drawing = deque(stream.array())
+                    else:
+                        yield from self._json_pairs(stream.array(), _drain(metadata))
+                        drawing, paired = deque(), True
+                elif key == "metadata" and metadata is None:
+                    codes = (metadata_row_codes(row, version) for row in stream.array())
+                    if drawing is None:
+                        metadata = deque(codes)
+                    else:
+                        yield from self._json_pairs(_drain(drawing), codes)
+                        metadata, paired = deque(), True
+                elif key == "version":
+                    if metadata is not None:
+                        raise ValueError(f"{self.file_name}: \"version\" must precede \"metadata\"")
+                    version = stream.value()
+                else:
+                    stream.value()
+
+        if not paired:
+            yield from self._json_pairs(_drain(drawing or deque()), _drain(metadata or deque()))
+
+    #---------------------------------------------------------------------------------------
+    def _json_pairs(self, drawing: Iterator, metadata: Iterator) -> Iterator[Tuple[str, array]]:
+        """
+        Pairs the drawing and metadata rows and checks each pair before handing it over.
+        """
+        row = -1
+        for row, text in enumerate(drawing):
+            if not isinstance(text, str):
+                raise ValueError(f"{self.file_name}: drawing row {row} is not a string")
+            codes = next(metadata, None)
+            if codes is None:
+                codes = array("B")
+            elif len(codes) > len(text):
+                raise ValueError(f"{self.file_name}: metadata row {row} is longer than its drawing row")
+            self.rows = row + 1
+            self.cols = max(self.cols, len(text))
+            yield text, codes
+
+        extra = sum(1 for _ in metadata)
+        if extra:
+            raise ValueError(f"{self.file_name}: {row + 1 + extra} metadata rows for {row + 1} drawing rows")
+
+    #---------------------------------------------------------------------------------------
+    def read_binary(self) -> Iterator[Tuple[str, array]]:
+        with open(self.file_name, "rb") as f:
+            data = f.read()
+
+        if len(data) < BINARY_HEADER.size or data[:len(BINARY_MAGIC)] != BINARY_MAGIC:
+            raise ValueError(f"{self.file_name} is not a binary diagram")
+        magic, version, compression, _, self.rows, self.cols, trailer_offset = BINARY_HEADER.unpack_from(data)
+        if version > BINARY_VERSION:
+            raise ValueError(f"{self.file_name} uses binary format version {version}, only {BINARY_VERSION} is supported")
+        if compression not in BINARY_COMPRESSION.values():
+            raise ValueError(f"{self.file_name}: unknown compression {compression}")
+
+        try:
+            glyphs_size = struct.unpack_from("<I", data, trailer_offset)[0]
+            glyphs = data[trailer_offset + 4 : trailer_offset + 4 + glyphs_size].decode("utf-8")
+            offsets = _unpack_array("I", data[trailer_offset + 4 + glyphs_size :])
+
+            payload = data[BINARY_HEADER.size : trailer_offset]
+            if compression == BINARY_COMPRESSION["zlib"]:
+                payload = zlib.decompress(payload)
+            elif compression == BINARY_COMPRESSION["lzma"]:
+                payload = lzma.decompress(payload)
+        except (struct.error, UnicodeDecodeError, zlib.error, lzma.LZMAError) as error:
+            raise ValueError(f"{self.file_name}: corrupted binary diagram ({error})") from None
+        if (len(offsets) != self.rows + 1 or offsets[0] != 0 or offsets[-1] != len(payload)
+                or any(offsets[row] > offsets[row + 1] for row in range(self.rows))):
+            raise ValueError(f"{self.file_name}: corrupted row table")
+
+        return (
+            self.decode_binary_row(memoryview(payload)[offsets[row] : offsets[row + 1]], glyphs)
+            for row in range(self.rows)
+        )
+
+    #---------------------------------------------------------------------------------------
+    @staticmethod
+    def decode_binary_row(data, glyphs) -> Tuple[str, array]:
+        try:
+            count = struct.unpack_from("<I", data)[0]
+            end = 4 + 4 * count
+            glyph_runs = _unpack_array("H", data[4 : end])
+            text = "".join([glyphs[glyph_runs[i + 1]] * glyph_runs[i] for i in range(0, 2 * count, 2)])
+
+            count = struct.unpack_from("<I", data, end)[0]
+            type_runs = _unpack_array("H", data[end + 4 : end + 4 + 4 * count])
+            codes = array("B", b"".join([bytes((type_runs[i + 1],)) * type_runs[i] for i in range(0, 2 * count, 2)]))
+        except (struct.error, IndexError, ValueError) as error:
+            raise ValueError(f"corrupted binary row: {error!r}") from None
+        if max(codes, default=0) >= len(CELL_TYPE_TAGS):
+            raise ValueError("corrupted binary row: unknown cell type")
+        return text, codes
+
+
+#====================================================================================================================================
+class MappedDiagram(ABC):
+    """
+    Diagram file mapped in memory with an index of where each row starts, row() decodes a
+    single row on demand. Building the index only scans the file, nothing is decoded until
+    the canvas asks for a row (see RowLoader). max_width bounds the width of the rows from
+    their size in bytes, the exact width (cols) is only worked out when first asked for.
+    """
+    #---------------------------------------------------------------------------------------
+    def __init__(self, file_name) -> None:
+        self.file_name = file_name
+        self.rows = 0
+        self.max_width = 0
+        self._cols : Union[int, None] = None
+        with open(file_name, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    #---------------------------------------------------------------------------------------
+    @property
+    def cols(self) -> int:
+        """
+        Width of the widest row, which takes a pass over every row: computed on first use
+        (saving the diagram) rather than when the file is opened.
+        """
+        if self._cols is None:
+            self._cols = max((self.width(row) for row in range(self.rows)), default=0)
+        return self._cols
+
+    #---------------------------------------------------------------------------------------
+    def width(self, row) -> int:
+        return len(self.row(row)[0])
+
+    #---------------------------------------------------------------------------------------
+    @staticmethod
+    def open(file_name) -> Union["MappedDiagram", None]:
+        """
+        Maps and indexes file_name, or returns None when its rows cannot be located without
+        decoding the whole file (compressed .abd, .json not laid out by DiagramWriter).
+        """
+        if os.path.getsize(file_name) == 0:
+            return None
+        suffix = pathlib.Path(file_name).suffix
+        diagram = {".json": MappedJsonDiagram, ".abd": MappedBinaryDiagram}.get(suffix, MappedTextDiagram)(file_name)
+        try:
+            if diagram.index():
+                return diagram
+        except (ValueError, UnicodeDecodeError, struct.error):
+            pass
+        diagram.close()
+        return None
+
+    #---------------------------------------------------------------------------------------
+    def _lines(self, start=0) -> Iterator[Tuple[int, int]]:
+        """
+        Yields the (start, end) offsets of the lines of the file, end excluding the newline.
+        """
+        find = self.map.find
+        size = len(self.map)
+        while start < size:
+            end = find(b"\n", start)
+            if end < 0:
+                end = size
+            yield start, end
+            start = end + 1
+
+    #---------------------------------------------------------------------------------------
+    @abstractmethod
+    def index(self) -> bool:
+        """
+        Locates the rows and sets rows, returns False when the file is not laid out as expected.
+        """
+
+    #---------------------------------------------------------------------------------------
+    @abstractmethod
+    def row(self, row) -> Tuple[str, Union[array, None]]:
+        """
+        Decodes one row into (text, codes), codes being None for plain text files.
+        """
+
+    #---------------------------------------------------------------------------------------
+    def close(self) -> None:
+        self.map.close()
+
+
+#====================================================================================================================================
+class MappedTextDiagram(MappedDiagram):
+    """
+    Plain text diagram, one row per line.
+    """
+    #---------------------------------------------------------------------------------------
+    def index(self) -> bool:
+        self.starts = array("Q")
+        self.ends   = array("Q")
+        for start, end in self._lines():
+            self.starts.append(start)
+            self.ends.append(end)
+            self.max_width = max(self.max_width, end - start)
+        self.rows = len(self.starts)
+        return True
+
+    #---------------------------------------------------------------------------------------
+    def row(self, row) -> Tuple[str, None]:
+        return self.map[self.starts[row] : self.ends[row]].decode("utf-8").rstrip(), None
+
+
+#====================================================================================================================================
+class MappedJsonDiagram(MappedDiagram):
+    """
+    .json diagram in the layout written by DiagramWriter.write_json: every "drawing" and
+    "metadata" row on a line of its own.
+    """
+    #---------------------------------------------------------------------------------------
+    def index(self) -> bool:
+        self.version = 1
+        self.drawing  = array("Q")    # start, end offset pairs of the row lines
+        self.metadata = array("Q")
+
+        lines = self._lines()
+        section = None
+        for start, end in lines:
+            line = self.map[start:end].strip()
+            if section is None:
+                if not line or line.startswith(b"//") or line == b"{":
+                    continue
+                if line.startswith(b'"version":'):
+                    self.version = json.loads(line[len(b'"version":'):].rstrip(b","))
+                elif line == b'"drawing": [':
+                    section = self.drawing
+                elif line == b'"metadata": [':
+                    section = self.metadata
+                elif line == b"}":
+                    break
+                else:
+                    return False
+            elif line.startswith(b"]"):
+                section = None
+            elif line:
+                section.append(start)
+                section.append(end)
+                if section is self.drawing:
+                    self.max_width = max(self.max_width, len(line.rstrip(b",")) - 2)
+
+        if not self.drawing or len(self.metadata) > len(self.drawing):
+            return False
+        self.rows = len(self.drawing) // 2
+        return True
+
+    #---------------------------------------------------------------------------------------
+    def _decode(self, lines: array, row):
+        return json.loads(self.map[lines[2 * row] : lines[2 * row + 1]].strip().rstrip(b","))
+
+    #---------------------------------------------------------------------------------------
+    def width(self, row) -> int:
+        line = self.map[self.drawing[2 * row] : self.drawing[2 * row + 1]].strip().rstrip(b",")
+        # without escapes the width is the decoded length less the quotes
+        return len(json.loads(line)) if b"\\" in line else len(line.decode("utf-8")) - 2
+
+    #---------------------------------------------------------------------------------------
+    def row(self, row) -> Tuple[str, array]:
+        text = self._decode(self.drawing, row)
+        codes = array("B")
+        if 2 * row < len(self.metadata):
+            codes = metadata_row_codes(self._decode(self.metadata, row), self.version)
+        return text, codes
+
+
+#====================================================================================================================================
+class MappedBinaryDiagram(MappedDiagram):
+    """
+    Uncompressed .abd diagram, the row offsets come from its trailer.
+    """
+    #---------------------------------------------------------------------------------------
+    def index(self) -> bool:
+        magic, version, compression, _, self.rows, self._cols, trailer_offset = BINARY_HEADER.unpack_from(self.map)
+        self.max_width = self._cols
+        if magic != BINARY_MAGIC or version > BINARY_VERSION or compression != BINARY_COMPRESSION["none"]:
+            return False
+
+        glyphs_size = struct.unpack_from("<I", self.map, trailer_offset)[0]
+        self.glyphs = self.map[trailer_offset + 4 : trailer_offset + 4 + glyphs_size].decode("utf-8")
+        self.offsets = _unpack_array("I", self.map[trailer_offset + 4 + glyphs_size :])
+        return len(self.offsets) == self.rows + 1 and BINARY_HEADER.size + self.offsets[-1] == trailer_offset
+
+    #---------------------------------------------------------------------------------------
+    def row(self, row) -> Tuple[str, array]:
+        start = BINARY_HEADER.size + self.offsets[row]
+        end = BINARY_HEADER.size + self.offsets[row + 1]
+        return DiagramReader.decode_binary_row(self.map[start:end], self.glyphs)
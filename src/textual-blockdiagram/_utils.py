@@ -1,5 +1,9 @@
-from typing import Deque, List, Tuple, Union, NamedTuple
-from textual.events import MouseEvent
+from typing import TYPE_CHECKING, Deque, List, Tuple, Union, NamedTuple
+from enum import IntEnum
+
+if TYPE_CHECKING:
+    # the storage and grid modules import _utils from the headless batch converter too
+    from textual.events import MouseEvent
 
 class UnicodeBoxChars():
 
@@ -155,14 +159,90 @@ class UnicodeBoxChars():
             + f'   {gc("v")}\n'
             + f' {gc("h")*2}{gc("br")}')
 
+class CellType(IntEnum):
+    """
+    Metadata type of a canvas cell. The values fit in a byte so the metadata plane is stored as
+    one bytearray per row, the tags are the strings written to the .json files.
+    """
+    NONE        = 0
+    BOX_H       = 1     # "bh"
+    BOX_V       = 2     # "bv"
+    ARROW_H     = 3     # "ah"
+    ARROW_V     = 4     # "av"
+    DIAG        = 5     # "diag"
+    TEXT        = 6     # "t"
+    HEAD_RIGHT  = 7     # ">"
+    HEAD_LEFT   = 8     # "<"
+    HEAD_DOWN   = 9     # "v"
+    HEAD_UP     = 10    # "^"
+
+    #---------------------------------------------------------------------------------------
+    @property
+    def tag(self) -> Union[str, None]:
+        return CELL_TYPE_TAGS[self]
+
+    #---------------------------------------------------------------------------------------
+    @classmethod
+    def from_tag(cls, tag: Union[str, None]) -> "CellType":
+        return CELL_TYPE_CODES[tag]
+
+# tags indexed by code, used to translate whole metadata rows at the file boundary
+CELL_TYPE_TAGS  = [None, "bh", "bv", "ah", "av", "diag", "t", ">", "<", "v", "^"]
+CELL_TYPE_CODES = {tag: CellType(code) for code, tag in enumerate(CELL_TYPE_TAGS)}
+
+
 class Cursor(NamedTuple):
     row: int
     col: int
 
     @classmethod
-    def from_mouse_event(cls, event: MouseEvent) -> "Cursor":
+    def from_mouse_event(cls, event: "MouseEvent") -> "Cursor":
         return Cursor(event.y, event.x - 1)
 
+    # x / y aliases, so a cursor can stand for the point of a mouse event
+    @property
+    def x(self) -> int:
+        return self.col
+
+    @property
+    def y(self) -> int:
+        return self.row
+
+
+class BBox(NamedTuple):
+    """
+    Inclusive cell rectangle, empty when end_col < col or end_row < row.
+    """
+    col: int
+    row: int
+    end_col: int
+    end_row: int
+
+    def __bool__(self) -> bool:
+        return self.col <= self.end_col and self.row <= self.end_row
+
+    @property
+    def area(self) -> int:
+        return (self.end_col - self.col + 1) * (self.end_row - self.row + 1) if self else 0
+
+    def contains(self, col, row) -> bool:
+        return self.col <= col <= self.end_col and self.row <= row <= self.end_row
+
+    def intersects(self, other: "BBox") -> bool:
+        return (bool(self) and bool(other)
+                and self.col <= other.end_col and other.col <= self.end_col
+                and self.row <= other.end_row and other.row <= self.end_row)
+
+    def inside(self, other: "BBox") -> bool:
+        return (bool(self) and other.col <= self.col and self.end_col <= other.end_col
+                and other.row <= self.row and self.end_row <= other.end_row)
+
+    def union(self, col, row, end_col, end_row) -> "BBox":
+        return BBox(min(self.col, col), min(self.row, row), max(self.end_col, end_col), max(self.end_row, end_row))
+
+    def translate(self, delta_col, delta_row) -> "BBox":
+        return BBox(self.col + delta_col, self.row + delta_row, self.end_col + delta_col, self.end_row + delta_row)
+
 
 
 if __name__ == "__main__":
@@ -1,6 +1,6 @@
 from textual.app import App, ComposeResult
 from textual.message import Message
-from textual.containers import Container, VerticalScroll, Horizontal, Vertical, ScrollableContainer
+from textual.containers import Container, VerticalScroll, Horizontal, Vertical
 from textual.widgets import Header, Footer, Button, Static, Collapsible, OptionList
 from textual.widget import Widget
 from textual.reactive import reactive
@@ -46,6 +46,7 @@ class BlockDiagramApp(App, inherit_bindings=False):
                     yield Button(classes="tool-btn", id="select",           label = "Select")
                     yield Button(classes="tool-btn", id="eraser",           label = "Eraser")
                     yield Button(classes="tool-btn", id="trapezoid-ver",    label = "|\ \n | |\n |/")
+                    yield Button(classes="tool-btn", id="free-line",        label = "Line ∠")
                     # yield Button(classes="tool-btn", id="trapezoid-hor",    label = " ____\n /____\\")
 
                 # with Horizontal(classes="menu-group"):
@@ -68,7 +69,8 @@ class BlockDiagramApp(App, inherit_bindings=False):
                                         )
                     yield ComplexMenu(id="arrow-menu",
                                         buttons=[
-                                                {"id":"arrow-cmd","label":"Arrow"}
+                                                {"id":"arrow-cmd","label":"Arrow"},
+                                                {"id":"arrow-route-cmd","label":"Route"}
                                             ],
                                         option_lists=[
                                             {"id":"arrow-heads","title":"Head"},
@@ -86,8 +88,7 @@ class BlockDiagramApp(App, inherit_bindings=False):
                                     )
 
             with Container(id="work-area"):
-                with ScrollableContainer(id="canvas-scroll"):
-                    yield AsciiCanvas(id="canvas")
+                yield AsciiCanvas(id="canvas")
                 yield FileDialog(id="open-file", dialog_label = "Open file...", action_button_label="Open", action_button_id = "open-file-btn")
                 yield FileDialog(id="save-file", dialog_label = "Save file...", action_button_label="Save", action_button_id = "save-file-btn")
             yield Static("Status Bar", id="status-bar")
@@ -104,6 +105,7 @@ class BlockDiagramApp(App, inherit_bindings=False):
         self.query_one("#select",       Button).tooltip = "Select area"
         self.query_one("#eraser",       Button).tooltip = "Erase character"
         self.query_one("#trapezoid-ver",Button).tooltip = "Draw vertical trapezoid"
+        self.query_one("#free-line",    Button).tooltip = "Draw line at any angle"
         # self.query_one("#trapezoid-hor",Button).tooltip = "Draw horizontal trapezoid"
 
 
@@ -158,6 +160,9 @@ class BlockDiagramApp(App, inherit_bindings=False):
         elif button_id == "trapezoid-ver":
             canvas.set_command(cmd =  "trapezoid-ver", char_set =   UnicodeBoxChars.get_char_set("SINGLE","CONTINUOUS", "SQUARE", "LIGHT") )
 
+        elif button_id == "free-line":
+            canvas.set_command(cmd =  "free-line", char_set =   UnicodeBoxChars.get_char_set("SINGLE","CONTINUOUS", "SQUARE", "LIGHT") )
+
         # for i, options in enumerate(UnicodeBoxChars.get_combinations()):
         #     if button_id == f"box_{'_'.join(options)}":
         #         canvas.set_command(cmd =  "box", char_set =   UnicodeBoxChars.get_char_set(*options) )
@@ -170,6 +175,11 @@ class BlockDiagramApp(App, inherit_bindings=False):
             corner_type = self.query_one("#arrow-menu",ComplexMenu).get_selected_option("arrow-corners").id
             canvas.set_command(cmd =  "arrow", char_set =   UnicodeBoxChars.get_char_set(line_style, line_type,corner_type,  line_weight), arrow_set = None)
 
+        elif button_id == "arrow-route-cmd":
+            line_style, line_type, line_weight = list(eval(self.query_one("#arrow-menu",ComplexMenu).get_selected_option("arrow-patterns").id))
+            corner_type = self.query_one("#arrow-menu",ComplexMenu).get_selected_option("arrow-corners").id
+            canvas.set_command(cmd =  "arrow-route", char_set =   UnicodeBoxChars.get_char_set(line_style, line_type,corner_type,  line_weight), arrow_set = None)
+
         elif button_id == "box-cmd":
             line_style, line_type, line_weight = list(eval(self.query_one("#box-menu",ComplexMenu).get_selected_option("box-patterns").id))
             corner_type = self.query_one("#box-menu",ComplexMenu).get_selected_option("box-corners").id
@@ -218,8 +228,9 @@ class BlockDiagramApp(App, inherit_bindings=False):
                     except NoMatches:
                         pass
 
-                # mimics the button press when selecting an option
-                menu_button = self.query_one(f"#{menu_id}-cmd", Button)
+                # mimics the press of the menu's current command button when selecting an option
+                menu = self.query_one(f"#{menu_id}-menu", ComplexMenu)
+                menu_button = self.query_one(f"#{menu.active_button}", Button)
                 self.post_message(Button.Pressed(button=menu_button))
 
 
@@ -0,0 +1,145 @@
+"""
+Headless batch converter: renders diagrams between .json, .abd and plain text without
+starting the Textual application.
+
+    python blockdiagram_batch.py [--to txt] [--from json] [-o OUTPUT_DIR] [-j JOBS] PATH...
+
+Files are converted next to their source (or under OUTPUT_DIR, keeping the layout of the
+directories given), directories are searched recursively for the --from suffixes. Outputs
+newer than their input are skipped unless --force is given.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, NamedTuple, Tuple, Union
+import argparse
+import os
+import pathlib
+import sys
+
+from _model import DiagramModel
+from _storage import BINARY_COMPRESSION
+
+
+FORMATS = ("json", "abd", "txt")
+
+
+class Options(NamedTuple):
+    comment_preview : bool = True
+    metadata_rle    : bool = False
+    compression     : str  = "zlib"
+
+
+#---------------------------------------------------------------------------------------
+def convert(source, target, options: Options = Options()) -> None:
+    """
+    Loads source and saves it as target with the DiagramModel the canvas draws.
+    """
+    model = DiagramModel(history=False)
+    model.SAVE_METADATA_RLE  = options.metadata_rle
+    model.BINARY_COMPRESSION = options.compression
+    model.load_diagram(source)
+
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    model.save_diagram(target, options.comment_preview)
+    model.clear()
+
+
+#---------------------------------------------------------------------------------------
+def _convert_job(job: Tuple[str, str, Options]) -> Tuple[str, str, Union[str, None]]:
+    source, target, options = job
+    try:
+        convert(source, target, options)
+    except Exception as error:
+        return source, target, f"{type(error).__name__}: {error}"
+    return source, target, None
+
+
+#---------------------------------------------------------------------------------------
+def is_up_to_date(source, target) -> bool:
+    try:
+        return os.stat(target).st_mtime >= os.stat(source).st_mtime
+    except FileNotFoundError:
+        return False
+
+
+#---------------------------------------------------------------------------------------
+def find_jobs(paths, to_format, from_formats, output_dir=None) -> Iterator[Tuple[str, str]]:
+    """
+    Yields the (source, target) pairs of the given files and of the matching files found
+    under the given directories.
+    """
+    suffixes = {"." + suffix for suffix in from_formats}
+    for path in map(pathlib.Path, paths):
+        if path.is_dir():
+            sources = sorted(
+                pathlib.Path(root, name)
+                for root, _, names in os.walk(path)
+                for name in names
+                if pathlib.Path(name).suffix in suffixes
+            )
+            root = path
+        else:
+            sources = [path]
+            root = path.parent
+
+        for source in sources:
+            target = source.with_suffix("." + to_format)
+            if output_dir is not None:
+                target = pathlib.Path(output_dir, target.relative_to(root))
+            if target.resolve() != source.resolve():
+                yield str(source), str(target)
+
+
+#---------------------------------------------------------------------------------------
+def run(jobs: List[Tuple[str, str, Options]], workers=None) -> Iterator[Tuple[str, str, Union[str, None]]]:
+    """
+    Converts the jobs, spread over a pool of worker processes when there is more than one.
+    """
+    if len(jobs) <= 1 or workers == 1:
+        yield from map(_convert_job, jobs)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_convert_job, jobs, chunksize=max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1))))
+
+
+#---------------------------------------------------------------------------------------
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Converts block diagrams without starting the editor.")
+    parser.add_argument("paths", nargs="+", help="diagram files or directories to search")
+    parser.add_argument("-t", "--to", choices=FORMATS, default="txt", help="output format (default: txt)")
+    parser.add_argument("-f", "--from", dest="from_formats", choices=FORMATS, action="append",
+                        help="formats looked for in directories, can be repeated (default: json)")
+    parser.add_argument("-o", "--output-dir", help="write the outputs under this directory")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: one per cpu)")
+    parser.add_argument("--force", action="store_true", help="convert even when the output is up to date")
+    parser.add_argument("--no-preview", action="store_true", help="omit the // preview from .json outputs")
+    parser.add_argument("--rle", action="store_true", help="run length encode the metadata of .json outputs")
+    parser.add_argument("--compression", choices=tuple(BINARY_COMPRESSION), default="zlib", help="compression of .abd outputs")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only report errors")
+    args = parser.parse_args(argv)
+
+    options = Options(not args.no_preview, args.rle, args.compression)
+    jobs = []
+    skipped = 0
+    for source, target in find_jobs(args.paths, args.to, args.from_formats or ["json"], args.output_dir):
+        if not args.force and is_up_to_date(source, target):
+            skipped += 1
+        else:
+            jobs.append((source, target, options))
+
+    failed = 0
+    for source, target, error in run(jobs, args.jobs):
+        if error is None:
+            if not args.quiet:
+                print(f"{source} -> {target}")
+        else:
+            failed += 1
+            print(f"{source}: {error}", file=sys.stderr)
+
+    if not args.quiet:
+        print(f"{len(jobs) - failed} converted, {skipped} up to date, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "textual-blockdiagram"))
+
+from _model import DiagramModel
+from _utils import Cursor, UnicodeBoxChars
+
+
+# helpers shared by the test modules, imported with "from conftest import ..."
+CHAR_SET = UnicodeBoxChars.get_char_set("SINGLE", "CONTINUOUS", "SQUARE", "LIGHT")
+
+
+def row_text(model, row):
+    return model.drawing_buffer.row_text(row, 0, model.drawing_buffer.cols).rstrip()
+
+
+def draw_box(model, col, row, end_col, end_row):
+    shape = model.draw("box", Cursor(row, col), Cursor(end_row, end_col), CHAR_SET)
+    model.commit()
+    return shape
+
+
+def model_with_box(col, row, end_col, end_row):
+    model = DiagramModel()
+    draw_box(model, col, row, end_col, end_row)
+    return model
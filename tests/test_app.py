@@ -0,0 +1,37 @@
+import asyncio
+
+from textual.widgets import OptionList
+
+from _canvas import AsciiCanvas
+from blockdiagram import BlockDiagramApp
+
+
+def run(scenario):
+    async def main():
+        app = BlockDiagramApp()
+        async with app.run_test(size=(120, 40)) as pilot:
+            await pilot.pause()
+            return await scenario(app, pilot)
+    return asyncio.run(main())
+
+
+def test_route_button_selects_the_routed_arrow():
+    async def scenario(app, pilot):
+        canvas = app.query_one(AsciiCanvas)
+        assert app.query_one("#arrow-route-cmd").region.area > 0
+
+        assert await pilot.click("#arrow-route-cmd")
+        await pilot.pause()
+        assert canvas.active_command["cmd"] == "arrow-route"
+
+        # choosing an arrow style keeps the routed arrow
+        patterns = app.query_one("#arrow-patterns", OptionList)
+        patterns.highlighted = 1
+        patterns.action_select()
+        await pilot.pause()
+        assert canvas.active_command["cmd"] == "arrow-route"
+
+        assert await pilot.click("#arrow-cmd")
+        await pilot.pause()
+        assert canvas.active_command["cmd"] == "arrow"
+    run(scenario)
@@ -0,0 +1,87 @@
+from _model import DiagramModel
+from _utils import CellType, Cursor
+
+from conftest import CHAR_SET, row_text
+
+
+def type_text(model, col, row, text):
+    # as the canvas does for a text-hor command: one commit per keystroke
+    for offset, char in enumerate(text):
+        model.set_char(col + offset, row, char, CellType.TEXT, False)
+        model.commit(coalesce="text-hor", cursor=Cursor(row, col + offset + 1))
+
+
+def test_undo_redo_restores_cells_and_metadata():
+    model = DiagramModel()
+    model.draw("box", Cursor(1, 1), Cursor(4, 8), CHAR_SET)
+    model.commit()
+    assert row_text(model, 1) == " ┌──────┐"
+    assert model.get_metadata(3, 1) == CellType.BOX_H
+
+    assert model.undo() == {1, 2, 3, 4}
+    assert row_text(model, 1) == ""
+    assert model.get_metadata(3, 1) == CellType.NONE
+    assert model.undo() is None
+
+    model.redo()
+    assert row_text(model, 1) == " ┌──────┐"
+    assert model.get_metadata(3, 1) == CellType.BOX_H
+    assert model.redo() is None
+
+
+def test_consecutive_keystrokes_are_undone_together():
+    model = DiagramModel()
+    type_text(model, 2, 2, "hello")
+    assert len(model.command_history.undo_stack) == 1
+    model.undo()
+    assert row_text(model, 2) == ""
+
+
+def test_typing_elsewhere_starts_a_new_undo_step():
+    model = DiagramModel()
+    type_text(model, 2, 2, "hello")
+    type_text(model, 20, 10, "world")
+    assert len(model.command_history.undo_stack) == 2
+
+    model.undo()
+    assert row_text(model, 2) == "  hello"
+    assert row_text(model, 10) == ""
+
+
+def test_seal_breaks_the_coalesce_chain():
+    model = DiagramModel()
+    type_text(model, 2, 2, "ab")
+    model.command_history.seal()
+    type_text(model, 4, 2, "cd")
+    assert len(model.command_history.undo_stack) == 2
+
+    model.undo()
+    assert row_text(model, 2) == "  ab"
+
+
+def test_oldest_entries_are_evicted_past_the_byte_cap():
+    model = DiagramModel()
+    history = model.command_history
+    # room for the two latest 10x3 boxes only: 22 cells, frozen or kept in a dict
+    history.max_bytes = 22 * 18 + 22 * 160
+    for row in (0, 5, 10):
+        model.draw("box", Cursor(row, 0), Cursor(row + 2, 9), CHAR_SET)
+        model.commit()
+    assert len(history.undo_stack) == 2
+    assert history.nbytes <= history.max_bytes
+
+    model.undo()
+    model.undo()
+    assert model.undo() is None
+    # the evicted first box stays drawn
+    assert row_text(model, 0) == "┌────────┐"
+    assert row_text(model, 5) == ""
+    assert row_text(model, 10) == ""
+
+
+def test_disabled_history_records_nothing():
+    model = DiagramModel(history=False)
+    type_text(model, 0, 0, "abc")
+    assert not model.command_history.undo_stack
+    assert model.undo() is None
+    assert row_text(model, 0) == "abc"
@@ -0,0 +1,39 @@
+from _model import DiagramModel
+from _utils import CellType, Cursor
+
+from conftest import CHAR_SET, row_text
+
+
+def test_clear_rect_is_clamped_to_the_grid():
+    model = DiagramModel(10, 20)
+    model.write_text(15, 2, "abcd")
+    model.commit()
+    cols = model.drawing_buffer.cols
+
+    model.clear_rect(16, 1, cols + 50, 20)
+    model.commit()
+    assert model.drawing_buffer.cols == cols
+    assert len(model.drawing_buffer) == 10
+    assert row_text(model, 2) == " " * 15 + "a"
+    assert model.get_metadata(16, 2) == CellType.NONE
+
+    model.undo()
+    assert row_text(model, 2) == " " * 15 + "abcd"
+
+
+def test_clear_rect_blanks_the_drawing_during_a_preview():
+    model = DiagramModel()
+    model.write_text(0, 0, "keep")
+    model.write_text(0, 1, "gone")
+    model.commit()
+
+    model.active_buffer = model.preview
+    model.draw("box", Cursor(3, 0), Cursor(5, 5), CHAR_SET, dynamic=True)
+    model.clear_rect(0, 1, 3, 1)
+    model.active_buffer = model.drawing_buffer
+    model.discard_preview()
+
+    assert row_text(model, 0) == "keep"
+    assert row_text(model, 1) == ""
+    assert row_text(model, 3) == ""
+
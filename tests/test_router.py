@@ -0,0 +1,73 @@
+from _model import DiagramModel
+from _router import ArrowRouter
+from _utils import CellType, Cursor
+
+from conftest import CHAR_SET, model_with_box
+
+
+def test_route_goes_around_a_box():
+    model = model_with_box(10, 2, 20, 8)
+    path = model.router.route((2, 5), (28, 5))
+
+    assert path[0] == (2, 5) and path[-1] == (28, 5)
+    for (col, row), (next_col, next_row) in zip(path, path[1:]):
+        assert abs(next_col - col) + abs(next_row - row) == 1
+    assert all(model.router.cost(col, row) != ArrowRouter.BLOCKED for col, row in path)
+    assert not any(10 <= col <= 20 and 2 <= row <= 8 for col, row in path)
+
+
+def test_route_prefers_few_bends():
+    model = DiagramModel()
+    path = model.router.route((2, 2), (12, 6))
+    bends = sum(
+        1 for before, here, after in zip(path, path[1:], path[2:])
+        if (here[0] - before[0], here[1] - before[1]) != (after[0] - here[0], after[1] - here[1])
+    )
+    assert len(path) == 15
+    assert bends == 1
+
+
+def test_route_crosses_arrows_at_right_angles():
+    model = DiagramModel()
+    model.draw("arrow", Cursor(5, 2), Cursor(5, 30), CHAR_SET)
+    model.commit()
+
+    path = model.router.route((15, 1), (15, 10))
+    assert path == [(15, row) for row in range(1, 11)]
+    assert model.router.cost(15, 5) == ArrowRouter.ALONG_H
+
+
+def test_no_route_out_of_a_closed_box():
+    model = model_with_box(10, 2, 20, 8)
+    assert model.router.route((15, 5), (40, 5)) is None
+
+
+def test_unreachable_end_is_given_up_without_searching(monkeypatch):
+    model = DiagramModel()
+    for row in range(0, 60, 10):
+        for col in range(0, 90, 15):
+            model.draw("box", Cursor(row + 1, col + 1), Cursor(row + 7, col + 11), CHAR_SET)
+    model.commit()
+    router = model.router
+    assert len(router.route((0, 0), (50, 30))) == 81
+
+    def search(start, end, window):
+        raise AssertionError("searched")
+    monkeypatch.setattr(router, "_search", search)
+    # inside a box, from outside and from inside another box
+    assert router.route((0, 0), (36, 34)) is None
+    assert router.route((0, 0), (38, 35)) is None
+    assert router.route((5, 4), (20, 4)) is None
+
+
+def test_routed_arrow_is_drawn_along_the_route():
+    model = model_with_box(10, 2, 20, 8)
+    arrow = model.draw("arrow-route", Cursor(5, 1), Cursor(5, 28), CHAR_SET)
+    model.commit()
+
+    assert arrow.mode == "route"
+    # the route passes over the box and comes down to the end
+    assert model.drawing_buffer.get(28, 5) == "▼"
+    assert model.get_metadata(28, 5) == CellType.HEAD_DOWN
+    # the box is left untouched
+    assert model.drawing_buffer.row_text(5, 10, 21) == "│         │"
@@ -0,0 +1,103 @@
+from _model import DiagramModel
+from _scene import SceneGraph
+from _utils import BBox, Cursor
+
+from conftest import CHAR_SET, draw_box, row_text
+
+
+class Stub():
+    def __init__(self, bbox):
+        self.bbox = bbox
+        self.key  = None
+
+
+def test_removed_shape_gets_its_key_back():
+    scene = SceneGraph()
+    first, second, third = Stub(BBox(0, 0, 4, 4)), Stub(BBox(2, 2, 6, 6)), Stub(BBox(8, 8, 9, 9))
+    for shape in (first, second, third):
+        scene.add(shape)
+
+    scene.remove(first)
+    assert first not in scene
+    scene.add(first)
+    assert list(scene) == [first, second, third]
+    assert scene.query(BBox(0, 0, 10, 10)) == [first, second, third]
+
+
+def test_erase_rect_drops_the_shapes_it_cuts_and_undo_restores_them():
+    model = DiagramModel()
+    outer = draw_box(model, 2, 2, 30, 12)
+    inner = draw_box(model, 5, 4, 12, 8)
+    other = draw_box(model, 40, 2, 50, 6)
+
+    # cuts through inner, only covers the inside of outer
+    model.erase_rect(4, 3, 13, 9)
+    model.commit()
+    assert row_text(model, 4)[2:14] == "│" + " " * 11
+    assert list(model.shapes) == [outer, other]
+    assert model.shape_at(8, 4) is outer
+    assert model.shapes_in(Cursor(0, 0), Cursor(20, 60), contained=True) == [outer, other]
+
+    model.undo()
+    assert list(model.shapes) == [outer, inner, other]
+    assert model.shape_at(8, 4) is inner
+
+    model.redo()
+    assert list(model.shapes) == [outer, other]
+
+
+def test_erase_rect_inside_a_box_keeps_it():
+    model = DiagramModel()
+    box = draw_box(model, 0, 0, 30, 10)
+
+    model.erase_rect(15, 5, 15, 5)
+    model.commit()
+    assert list(model.shapes) == [box]
+    assert model.shape_at(0, 0) is box
+
+    model.erase_rect(30, 4, 32, 6)
+    model.commit()
+    assert list(model.shapes) == []
+
+
+def test_erase_rect_in_the_bend_of_an_arrow_keeps_it():
+    model = DiagramModel()
+    # └ bend at (2, 8), the arrow runs down col 2 then right along row 8
+    arrow = model.draw("arrow", Cursor(2, 1), Cursor(8, 20), CHAR_SET, approach_mode="h")
+    model.commit()
+    assert arrow.bbox.contains(10, 4)
+
+    model.erase_rect(10, 4, 12, 5)
+    model.commit()
+    assert list(model.shapes) == [arrow]
+
+    model.erase_rect(10, 8, 10, 8)
+    model.commit()
+    assert list(model.shapes) == []
+
+
+def test_redo_keeps_the_drawing_order():
+    model = DiagramModel()
+    first  = draw_box(model, 0, 0, 10, 10)
+    second = draw_box(model, 2, 2, 8, 8)
+    model.undo()
+    model.undo()
+    model.redo()
+    model.redo()
+    assert list(model.shapes) == [first, second]
+    assert first.key < second.key
+
+
+def test_pasted_shapes_are_added_as_copies():
+    model = DiagramModel()
+    box = draw_box(model, 1, 1, 5, 3)
+
+    model.add_shape_copies([box], 10, 0)
+    model.commit()
+    shapes = list(model.shapes)
+    assert len(shapes) == 2 and shapes[0] is box
+    assert shapes[1].bbox == BBox(11, 1, 15, 3)
+    assert box.bbox == BBox(1, 1, 5, 3)
+
+    model.undo()
+    assert list(model.shapes) == [box]
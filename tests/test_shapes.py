@@ -0,0 +1,48 @@
+from _shapes import Arrow
+from _utils import CellType, Cursor
+
+from conftest import CHAR_SET, model_with_box, row_text
+
+
+def drag_arrow(model, start, end, max_distance=2):
+    """
+    Drags an arrow from start to end (col, row) the way the canvas does on mouse up.
+    """
+    (start_col, start_row), (end_col, end_row) = start, end
+    approach_mode = None
+    snapped = Arrow.snap_endpoint(start_col, start_row, end_col, end_row, model.metadata_buffer, max_distance)
+    if snapped is not None:
+        end_col, end_row, approach_mode = snapped
+    model.draw("arrow", Cursor(start_row, start_col), Cursor(end_row, end_col), CHAR_SET, approach_mode=approach_mode)
+    model.commit()
+    return snapped
+
+
+def test_same_row_drag_snaps_to_the_near_vertical_border_only():
+    model = model_with_box(10, 2, 30, 8)
+    assert drag_arrow(model, (2, 5), (11, 5)) == (9, 5, "h")
+    assert row_text(model, 5) == "   ──────►│" + " " * 19 + "│"
+
+    # the top border right above the end does not turn the arrow into an elbow
+    assert Arrow.snap_endpoint(2, 3, 15, 3, model.metadata_buffer, 2) is None
+
+
+def test_same_column_drag_snaps_to_the_near_horizontal_border_only():
+    model = model_with_box(10, 2, 30, 8)
+    assert drag_arrow(model, (20, 14), (20, 7)) == (20, 9, "v")
+    assert model.drawing_buffer.get(20, 9) == "▲"
+    assert model.get_metadata(20, 8) == CellType.BOX_H
+
+
+def test_head_never_snaps_inside_a_box():
+    model = model_with_box(10, 2, 30, 8)
+    # leaving the box from inside: its right and bottom borders face away from the arrow
+    assert Arrow.snap_endpoint(16, 4, 29, 5, model.metadata_buffer, 2) is None
+    assert Arrow.snap_endpoint(16, 4, 28, 4, model.metadata_buffer, 2) is None
+
+
+def test_elbow_arrow_snaps_to_the_border_it_approaches():
+    model = model_with_box(10, 2, 30, 8)
+    assert drag_arrow(model, (2, 12), (20, 10)) == (20, 9, "v")
+    assert model.drawing_buffer.get(20, 9) == "▲"
+    assert row_text(model, 8)[10:31] == "└" + "─" * 19 + "┘"
@@ -0,0 +1,265 @@
+import pytest
+
+from _model import DiagramModel
+from _shapes import Arrow
+from _storage import BINARY_HEADER, DiagramReader, DiagramWriter, JsonStream
+from _utils import CellType, Cursor
+
+from conftest import CHAR_SET
+
+
+def sample_model():
+    model = DiagramModel()
+    model.draw("box", Cursor(1, 2), Cursor(5, 12), CHAR_SET)
+    model.write_text(4, 3, "hello")
+    model.write_text(20, 7, "\"quoted\" \\ é")
+    model.commit()
+    return model
+
+
+def dump(model):
+    rows = model.drawing_row_max + 1
+    cols = model.drawing_col_max + 1
+    return ([model.drawing_buffer.row_text(row, 0, cols) for row in range(rows)],
+            [model.metadata_buffer.row_slice(row, 0, cols).tobytes() for row in range(rows)])
+
+
+def reload(file_name):
+    model = DiagramModel()
+    model.load_diagram(str(file_name))
+    return model
+
+
+@pytest.mark.parametrize("comment_preview", [True, False])
+def test_json_v1_round_trip(tmp_path, comment_preview):
+    model = sample_model()
+    file_name = tmp_path / "diagram.json"
+    model.save_diagram(str(file_name), comment_preview)
+
+    content = file_name.read_text(encoding="utf-8")
+    assert '"version"' not in content
+    assert content.startswith("//") == comment_preview
+
+    loaded = reload(file_name)
+    assert dump(loaded) == dump(model)
+    assert loaded.get_metadata(3, 1) == CellType.BOX_H
+    assert loaded.get_metadata(2, 3) == CellType.BOX_V
+    assert loaded.get_metadata(4, 3) == CellType.TEXT
+
+
+def test_text_round_trip(tmp_path):
+    model = sample_model()
+    file_name = tmp_path / "diagram.txt"
+    model.save_diagram(str(file_name))
+    assert dump(reload(file_name))[0] == [text.rstrip().ljust(len(text)) for text in dump(model)[0]]
+
+
+def test_failed_save_keeps_the_previous_file(tmp_path, monkeypatch):
+    model = sample_model()
+    file_name = tmp_path / "diagram.json"
+    model.save_diagram(str(file_name))
+    before = file_name.read_bytes()
+
+    def fail(self, row):
+        raise RuntimeError("disk full")
+    monkeypatch.setattr(DiagramWriter, "encode_metadata_row", fail)
+    with pytest.raises(RuntimeError):
+        model.save_diagram(str(file_name))
+
+    assert file_name.read_bytes() == before
+    assert [path.name for path in tmp_path.iterdir()] == ["diagram.json"]
+
+
+@pytest.mark.parametrize("compression", ["none", "zlib", "lzma"])
+def test_binary_round_trip(tmp_path, compression):
+    model = sample_model()
+    model.BINARY_COMPRESSION = compression
+    file_name = tmp_path / "diagram.abd"
+    model.save_diagram(str(file_name))
+
+    reader = DiagramReader(str(file_name))
+    rows = list(reader.read())
+    assert (reader.rows, reader.cols) == (model.drawing_row_max + 1, model.drawing_col_max + 1)
+    assert [text for text, _ in rows] == dump(model)[0]
+    assert dump(reload(file_name)) == dump(model)
+
+
+def test_binary_rejects_an_unknown_compression(tmp_path):
+    model = sample_model()
+    model.BINARY_COMPRESSION = "gzip"
+    file_name = tmp_path / "diagram.abd"
+    with pytest.raises(ValueError, match="none, zlib, lzma"):
+        model.save_diagram(str(file_name))
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("compression", ["none", "zlib", "lzma"])
+@pytest.mark.parametrize("damage", ["header", "payload", "trailer", "garbled"])
+def test_binary_corrupted_input(tmp_path, compression, damage):
+    model = sample_model()
+    model.BINARY_COMPRESSION = compression
+    file_name = tmp_path / "diagram.abd"
+    model.save_diagram(str(file_name))
+    data = file_name.read_bytes()
+
+    if damage == "header":
+        data = data[:10]
+    elif damage == "payload":
+        data = data[:BINARY_HEADER.size + 20]
+    elif damage == "trailer":
+        data = data[:-3]
+    else:
+        middle = len(data) // 2
+        data = data[:middle] + b"\xff" * 16 + data[middle + 16:]
+    file_name.write_bytes(data)
+
+    with pytest.raises(ValueError):
+        list(DiagramReader(str(file_name)).read())
+
+
+def test_json_v2_round_trip(tmp_path):
+    model = sample_model()
+    model.SAVE_METADATA_RLE = True
+    file_name = tmp_path / "diagram.json"
+    model.save_diagram(str(file_name))
+
+    assert '"version": 2' in file_name.read_text(encoding="utf-8")
+    assert dump(reload(file_name)) == dump(model)
+
+
+def test_json_metadata_before_drawing(tmp_path):
+    file_name = tmp_path / "diagram.json"
+    file_name.write_text('{"version": 2, "metadata": [[["t", 2]], [], [["bh", 1]]], "drawing": ["ab", "", "─", "tail"]}')
+
+    reader = DiagramReader(str(file_name))
+    rows = [(text, codes.tobytes()) for text, codes in reader.read()]
+    assert rows == [("ab", b"\6\6"), ("", b""), ("─", b"\1"), ("tail", b"")]
+    assert (reader.rows, reader.cols) == (4, 4)
+
+
+def test_json_rows_are_yielded_as_they_are_parsed(tmp_path, monkeypatch):
+    model = DiagramModel()
+    for row in range(200):
+        model.write_text(0, row, f"row {row}")
+    model.commit()
+    file_name = tmp_path / "diagram.json"
+    model.save_diagram(str(file_name), comment_preview=False)
+    content = file_name.read_text(encoding="utf-8")
+    file_name.write_text(content[:content.index('"metadata"') + 3000], encoding="utf-8")
+
+    monkeypatch.setattr(JsonStream, "CHUNK_SIZE", 256)
+    rows = DiagramReader(str(file_name)).read()
+    assert next(rows)[0] == "row 0".ljust(model.drawing_col_max + 1)
+    with pytest.raises(ValueError):
+        for _ in rows:
+            pass
+
+
+def test_json_syntax_error_is_raised_without_reading_to_the_end(tmp_path, monkeypatch):
+    file_name = tmp_path / "diagram.json"
+    rows = ", ".join(f'"row {row}"' for row in range(2000))
+    file_name.write_text('{"drawing": ["ab", ["cd" x], ' + rows + '], "metadata": []}', encoding="utf-8")
+
+    fills = []
+    fill = JsonStream._fill
+    monkeypatch.setattr(JsonStream, "CHUNK_SIZE", 256)
+    monkeypatch.setattr(JsonStream, "_fill", lambda self: fills.append(1) or fill(self))
+    with pytest.raises(ValueError, match="diagram.json: Expecting ',' delimiter"):
+        list(DiagramReader(str(file_name)).read())
+    assert len(fills) < 5
+
+
+@pytest.mark.parametrize("content, message", [
+    ('{"drawing": ["ab", "cd"], "metadata": [["t", "t"], ["t"', "Expecting"),
+    ('{"drawing": ["ab", "cd"] "metadata": []}', "expected ','"),
+    ('{"drawing": ["ab", 3], "metadata": []}', "drawing row 1 is not a string"),
+    ('{"drawing": ["ab"], "metadata": [["t", "t", "t"]]}', "longer than its drawing row"),
+    ('{"drawing": ["ab"], "metadata": [["t"], ["t"]]}', "2 metadata rows for 1 drawing rows"),
+    ('{"drawing": ["ab"], "metadata": [["zz"]]}', "invalid metadata row"),
+    ('{"metadata": [], "version": 2, "drawing": []}', '"version" must precede "metadata"'),
+    ('{3: []}', "Expecting property name|expected an object key"),
+    ('// preview only\n', "expected '{'"),
+])
+def test_json_damaged_input(tmp_path, content, message):
+    file_name = tmp_path / "diagram.json"
+    file_name.write_text(content, encoding="utf-8")
+    with pytest.raises(ValueError, match=message):
+        list(DiagramReader(str(file_name)).read())
+
+
+def test_load_keeps_the_drawing_when_the_file_is_not_a_diagram(tmp_path):
+    model = sample_model()
+    file_name = tmp_path / "diagram.json"
+    file_name.write_text("[1, 2]", encoding="utf-8")
+    before = dump(model)
+    with pytest.raises(ValueError):
+        model.load_diagram(str(file_name))
+    assert dump(model) == before
+
+
+def test_load_drops_a_diagram_damaged_past_its_start(tmp_path):
+    model = sample_model()
+    file_name = tmp_path / "diagram.json"
+    file_name.write_text('{"drawing": ["ab", "cd", 3]}', encoding="utf-8")
+    with pytest.raises(ValueError):
+        model.load_diagram(str(file_name))
+    assert model.drawing_row_max == 0
+    assert model.drawing_buffer.row_text(0, 0, 2) == "  "
+
+
+def mapped_model(tmp_path, suffix, compression="none"):
+    # a box from (10, 130) to (30, 136), (col, row), in the third tile row of the grids
+    model = DiagramModel()
+    model.BINARY_COMPRESSION = compression
+    model.draw("box", Cursor(130, 10), Cursor(136, 30), CHAR_SET)
+    model.write_text(0, 0, "top ─ é")
+    model.commit()
+    file_name = tmp_path / f"diagram{suffix}"
+    model.save_diagram(str(file_name))
+
+    mapped = DiagramModel()
+    mapped.BINARY_COMPRESSION = compression
+    assert mapped.map_diagram(str(file_name))
+    return model, mapped
+
+
+@pytest.mark.parametrize("suffix", [".json", ".txt", ".abd"])
+def test_mapped_width_is_worked_out_on_save(tmp_path, suffix):
+    model, mapped = mapped_model(tmp_path, suffix)
+    source = mapped.row_loader.source
+    assert source.rows == model.drawing_row_max + 1
+    assert source.max_width >= model.drawing_col_max + 1
+    assert source._cols is None or suffix == ".abd"
+    assert not mapped.row_loader.loaded
+
+    saved = tmp_path / f"saved{suffix}"
+    mapped.save_diagram(str(saved))
+    assert source.cols == model.drawing_col_max + 1
+    assert saved.read_bytes() == (tmp_path / f"diagram{suffix}").read_bytes()
+    assert not mapped.row_loader.loaded
+
+
+def test_mapped_rows_load_without_bumping_the_versions(tmp_path):
+    _, mapped = mapped_model(tmp_path, ".json")
+    versions = mapped.drawing_buffer.version, mapped.metadata_buffer.version
+    assert mapped.get_metadata(20, 130) == CellType.BOX_H
+    assert mapped.row_loader.is_loaded(130)
+    assert (mapped.drawing_buffer.version, mapped.metadata_buffer.version) == versions
+
+    mapped.write_text(0, 140, "x")
+    assert mapped.metadata_buffer.version != versions[1]
+
+
+def test_mapped_route_goes_around_a_box_and_is_reused(tmp_path):
+    _, mapped = mapped_model(tmp_path, ".json")
+    path = mapped.router.route((2, 133), (38, 133))
+    assert path[0] == (2, 133) and path[-1] == (38, 133)
+    assert not any(10 <= col <= 30 and 130 <= row <= 136 for col, row in path)
+    assert mapped.router.route((2, 133), (38, 133)) is path
+
+
+def test_mapped_arrow_snaps_to_a_box_not_loaded_yet(tmp_path):
+    _, mapped = mapped_model(tmp_path, ".json")
+    assert not mapped.row_loader.loaded
+    snapped = Arrow.snap_endpoint(2, 133, 8, 133, mapped.metadata_buffer, 2)
+    assert snapped == (9, 133, "h")